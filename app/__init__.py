@@ -1,4 +1,5 @@
-from flask import Flask
+from threading import Lock
+from flask import Flask, current_app
 from flask_login import LoginManager
 from app.config import Config
 
@@ -10,12 +11,20 @@ login_manager.login_view = "auth.login"   # redirect if not logged in
 def load_user(user_id):
 
     from app.auth.models import User
+    from app.auth.principal import load_principal, store_principal
     from app.db import fetchone
 
+    # Fast path: signed session principal, no queries while its version is current
+    if current_app.config["SESSION_PRINCIPAL"]:
+        user = load_principal(user_id)
+        if user is not None:
+            return user
+
     row = fetchone(
         """
         SELECT 
             u.*,
+            GROUP_CONCAT(DISTINCT r.id) AS role_ids,
             GROUP_CONCAT(DISTINCT r.name ORDER BY r.name) AS roles,
             GROUP_CONCAT(DISTINCT p.name ORDER BY p.name) AS permissions 
         FROM users u 
@@ -32,9 +41,61 @@ def load_user(user_id):
     roles = row["roles"].split(",") if row["roles"] else []
     permissions = row["permissions"].split(",") if row["permissions"] else []
 
+    # Re-issue the principal with current roles and version
+    role_ids = [int(r) for r in row["role_ids"].split(",")] if row["role_ids"] else []
+    store_principal(row, role_ids)
+
     return User.from_row(row, roles, permissions)
 
 
+# Blueprint packages, each exposing `bp` (routes added by its `routes` module)
+BLUEPRINTS = (
+    "app.auth",
+    "app.appointments",
+    "app.users",
+    "app.dashboards.main",
+    "app.dashboards.admin",
+    "app.dashboards.doctor",
+    "app.dashboards.clinic_receptionist",
+    "app.dashboards.patient",
+    "app.audit",
+)
+
+def register_blueprints(app):
+    from importlib import import_module
+
+    for module_name in BLUEPRINTS:
+        # Only here: services share these packages and must not pull in the routes
+        import_module(f"{module_name}.routes")
+        app.register_blueprint(import_module(module_name).bp)
+
+
+class LazyBlueprints:
+    """
+    WSGI wrapper that imports and registers the blueprints on the first
+    request instead of in `create_app()`, so CLI processes and short-lived
+    tools skip importing every route module.
+    """
+
+    def __init__(self, app, wsgi_app):
+        self.app = app
+        self.wsgi_app = wsgi_app
+        self.registered = False
+        self._lock = Lock()
+
+    def ensure_registered(self):
+        if self.registered:
+            return
+        with self._lock:
+            if not self.registered:
+                register_blueprints(self.app)
+                self.registered = True
+
+    def __call__(self, environ, start_response):
+        self.ensure_registered()
+        return self.wsgi_app(environ, start_response)
+
+
 def create_app():
     app = Flask(__name__)
 
@@ -44,35 +105,62 @@ def create_app():
     # Initialize login manager with this app instance
     login_manager.init_app(app)
 
-    # Register blueprints
-    from .auth import bp as auth_bp
-    app.register_blueprint(auth_bp)
-
-    from .appointments import bp as appt_bp
-    app.register_blueprint(appt_bp)
-
-    from .users import bp as users_bp
-    app.register_blueprint(users_bp)
-
-    from .dashboards.main import bp as main_bp
-    app.register_blueprint(main_bp)
-
-    from .dashboards.admin import bp as admin_bp
-    app.register_blueprint(admin_bp)
-
-    from .dashboards.doctor import bp as doc_bp
-    app.register_blueprint(doc_bp)
-
-    from .dashboards.clinic_receptionist import bp as recpt_bp
-    app.register_blueprint(recpt_bp)
-
-    from .dashboards.patient import bp as patient_bp
-    app.register_blueprint(patient_bp)
-
-    # Seed DB with data on first initialization
-    from app.seed import run_seed_if_needed
-    with app.app_context():
-        run_seed_if_needed()
+    # Request/DB metrics and /metrics (first, so its timing covers the other hooks)
+    from app.utils.metrics import init_metrics
+    init_metrics(app)
+
+    # Cache shared by the workers of this host (before anything caches)
+    from app.utils.shared_cache import shared_cache
+    shared_cache.init_app(app)
+
+    # Select the clinic shard for each request
+    from app.utils.clinic import resolve_clinic, clinic_context
+    app.before_request(resolve_clinic)
+    app.context_processor(clinic_context)
+
+    # Compiled-template and rendered-row caches
+    from app.utils.fragments import init_template_caches
+    init_template_caches(app)
+
+    # On-demand request profiling (off unless PROFILING_ENABLED)
+    from app.utils.profiling import init_profiling
+    init_profiling(app)
+
+    # Hidden idempotency key for create forms
+    from app.utils.idempotency import new_idempotency_key
+    app.jinja_env.globals["new_idempotency_key"] = new_idempotency_key
+
+    # Initialize login throttling (in-memory buckets, write-behind lockouts)
+    from app.auth.throttle import login_throttle
+    login_throttle.init_app(app)
+
+    # Buffer last_login / login_count (write-behind, batched multi-row updates)
+    from app.auth.activity import login_activity
+    login_activity.init_app(app, app.config["LOGIN_ACTIVITY_FLUSH_INTERVAL"])
+
+    # Initialize audit log writer (bounded queue, background batch inserts)
+    from app.audit.service import audit_log
+    audit_log.init_app(app)
+
+    # Register blueprints (eagerly, or on the first request if LAZY_BLUEPRINTS)
+    if app.config["LAZY_BLUEPRINTS"]:
+        app.wsgi_app = LazyBlueprints(app, app.wsgi_app)
+        app.extensions["lazy_blueprints"] = app.wsgi_app
+    else:
+        register_blueprints(app)
+
+    # Optional startup seeding (prefer `flask seed`); never blocks startup
+    if app.config["SEED_ON_STARTUP"]:
+        from app.seed import seed_all_clinics
+        try:
+            with app.app_context():
+                seed_all_clinics()
+        except Exception as e:
+            app.logger.warning("Startup seeding skipped: %s", e)
+
+    # Register CLI commands
+    from app.cli import register_cli
+    register_cli(app)
 
     #Ensure DB connection is closed after each request
     from app.db import close_db
@@ -0,0 +1,88 @@
+"""
+Hot/cold archival of appointments.
+
+Finalized appointments (completed, cancelled, no_show) older than the
+archive horizon are moved from `appointments` to `appointments_archive`
+in small batches, each in its own short transaction, so day-to-day
+listings only scan the hot set.
+
+Finalized statuses have no outgoing transitions (see VALID_TRANSITIONS),
+so archived rows never need to be written again.
+"""
+
+import time
+from datetime import datetime, timedelta
+
+from flask import current_app
+
+from app.db import fetchall, execute, transaction
+
+FINAL_STATUSES = ("completed", "cancelled", "no_show")
+
+ARCHIVE_COLUMNS = (
+    "id, patient_id, doctor_id, appointment_timestamp, arrival_timestamp, "
+    "status, notes, created_by_staff, deleted_at, created_at, updated_at"
+)
+
+def archive_appointments(horizon_days: int = None, batch_size: int = None,
+                         max_batches: int = None, pause: float = 0.0) -> int:
+    """
+    Move finalized appointments older than `horizon_days` into the archive.
+
+    Behavior:
+    - Candidates are found by a range scan on `idx_appointments_at`.
+    - Each batch is copied and deleted in one transaction.
+    - `pause` seconds are slept between batches to limit lock pressure.
+
+    Returns:
+        number of archived appointments (int)
+    """
+    config = current_app.config
+    # An explicit 0 is a valid horizon (archive everything finalized)
+    if horizon_days is None:
+        horizon_days = config["ARCHIVE_HORIZON_DAYS"]
+    if batch_size is None:
+        batch_size = config["ARCHIVE_BATCH_SIZE"]
+
+    cutoff = datetime.now() - timedelta(days=horizon_days)
+    status_placeholders = ", ".join(["%s"] * len(FINAL_STATUSES))
+
+    archived = 0
+    batches = 0
+    while max_batches is None or batches < max_batches:
+        rows = fetchall(
+            f"""
+            SELECT id
+            FROM appointments
+            WHERE appointment_timestamp < %s AND status IN ({status_placeholders})
+            ORDER BY appointment_timestamp
+            LIMIT %s
+            """,
+            (cutoff, *FINAL_STATUSES, batch_size)
+        )
+        if not rows:
+            break
+
+        ids = tuple(row["id"] for row in rows)
+        id_placeholders = ", ".join(["%s"] * len(ids))
+
+        with transaction():
+            execute(
+                f"""
+                INSERT INTO appointments_archive ({ARCHIVE_COLUMNS})
+                SELECT {ARCHIVE_COLUMNS}
+                FROM appointments
+                WHERE id IN ({id_placeholders})
+                """,
+                ids
+            )
+            execute(f"DELETE FROM appointments WHERE id IN ({id_placeholders})", ids)
+
+        archived += len(ids)
+        batches += 1
+        if len(ids) < batch_size:
+            break
+        if pause:
+            time.sleep(pause)
+
+    return archived
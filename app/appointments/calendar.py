@@ -0,0 +1,176 @@
+"""
+Doctor calendar (week and month views).
+
+Each doctor-week is built from a single range query on
+`cidx_appointments_doctor_at` plus the doctor's weekly availability,
+into a compact grid:
+
+    {"week_start": date, "days": [7 dates], "rows": [{"time": time, "cells": [7 cells]}]}
+
+    cell = None (no slot, no appointment)
+         | {"available": bool, "appointments": [{"id", "status", "patient_name", "at"}]}
+
+Built weeks are cached per process and clinic, keyed by (doctor, week),
+together with the doctor's shared-cache generation
+(`calendar:<clinic>:<doctor_id>`) read before the build. Creating an
+appointment or changing its status bumps that generation once it
+commits, so every worker rebuilds the doctor's weeks on their next view;
+`CALENDAR_CACHE_TTL` is only a fallback. A month view is made of its
+(cached) weeks.
+"""
+
+import threading
+import time
+from collections import OrderedDict
+from datetime import date, datetime, timedelta
+
+from flask import current_app
+
+from app.db import after_commit, current_clinic, fetchall
+from app.users.directory import get_doctor
+from app.utils.shared_cache import shared_cache
+
+WEEKDAYS = ["MON", "TUE", "WED", "THU", "FRI", "SAT", "SUN"]
+
+_weeks = OrderedDict()   # (clinic, doctor_id, week_start) -> (built_at, generation, grid)
+_weeks_lock = threading.Lock()
+_MAX_WEEKS = 5000
+
+
+def get_doctor_calendar_for(user, data: dict) -> dict:
+    """
+    Return a week or month calendar for a doctor.
+
+    Authorization:
+    - doctor: own calendar
+    - manage_appointments / clinic receptionist: any doctor (`doctor_id`)
+    - others: ValueError
+
+    Parameters (all optional): view ("week" | "month"), start (YYYY-MM-DD), doctor_id.
+
+    Raises:
+        ValueError if authorization or parameters are invalid.
+    """
+    view = data.get("view") or "week"
+    if view not in {"week", "month"}:
+        raise ValueError("Invalid calendar view")
+
+    try:
+        start = datetime.strptime(data["start"], "%Y-%m-%d").date() if data.get("start") else date.today()
+    except ValueError:
+        raise ValueError("Invalid start date")
+
+    if user.has_permission("manage_appointments") or user.has_role("clinic_receptionist"):
+        try:
+            doctor_id = int(data.get("doctor_id") or (user.id if user.has_role("doctor") else 0))
+        except ValueError:
+            raise ValueError("Invalid doctor ID")
+        if not doctor_id:
+            raise ValueError("Choose a doctor")
+    elif user.has_role("doctor"):
+        doctor_id = user.id
+    else:
+        raise ValueError("User is not allowed to view doctor calendars")
+
+    doctor = get_doctor(doctor_id)
+    if not doctor:
+        raise ValueError("Selected doctor is not a valid doctor.")
+
+    if view == "week":
+        first = start - timedelta(days=start.weekday())
+        weeks = [_get_week(doctor["user_id"], first)]
+        previous, following = first - timedelta(days=7), first + timedelta(days=7)
+    else:
+        month_start = start.replace(day=1)
+        next_month = (month_start + timedelta(days=32)).replace(day=1)
+        first = month_start - timedelta(days=month_start.weekday())
+        weeks = []
+        while first < next_month:
+            weeks.append(_get_week(doctor["user_id"], first))
+            first += timedelta(days=7)
+        previous = (month_start - timedelta(days=1)).replace(day=1)
+        following = next_month
+
+    return {
+        "doctor": doctor,
+        "view": view,
+        "start": start,
+        "weeks": weeks,
+        "previous": previous,
+        "next": following,
+        "month": start.month if view == "month" else None,
+    }
+
+def invalidate_doctor_calendar(doctor_id: int):
+    """Make every worker rebuild the weeks of `doctor_id` once the transaction commits."""
+    namespace = _namespace(doctor_id)
+    after_commit(lambda: shared_cache.invalidate(namespace))
+
+def _namespace(doctor_id: int) -> str:
+    return f"calendar:{current_clinic()}:{int(doctor_id)}"
+
+def _get_week(doctor_id: int, week_start: date) -> dict:
+    key = (current_clinic(), doctor_id, week_start)
+    ttl = current_app.config["CALENDAR_CACHE_TTL"]
+    # Read before building: a change committed during the build makes this grid stale
+    generation = shared_cache.generation(_namespace(doctor_id))
+    with _weeks_lock:
+        cached = _weeks.get(key)
+        if cached and cached[1] == generation and time.monotonic() - cached[0] < ttl:
+            _weeks.move_to_end(key)
+            return cached[2]
+
+    grid = build_week(doctor_id, week_start)
+
+    with _weeks_lock:
+        _weeks[key] = (time.monotonic(), generation, grid)
+        _weeks.move_to_end(key)
+        while len(_weeks) > _MAX_WEEKS:
+            _weeks.popitem(last=False)
+    return grid
+
+def build_week(doctor_id: int, week_start: date) -> dict:
+    """Build the day x slot grid of one doctor-week (two small queries)."""
+    week_end = week_start + timedelta(days=7)
+    appointments = fetchall(
+        """
+        SELECT a.id, a.appointment_timestamp, a.status, p.name AS patient_name
+        FROM appointments a
+        JOIN user_details p ON p.user_id = a.patient_id
+        WHERE a.doctor_id = %s
+            AND a.appointment_timestamp >= %s AND a.appointment_timestamp < %s
+            AND a.deleted_at IS NULL
+        ORDER BY a.appointment_timestamp
+        """,
+        (doctor_id, week_start, week_end)
+    )
+    availability = fetchall(
+        "SELECT day, start_time FROM doctor_availability WHERE user_id = %s",
+        (doctor_id,)
+    )
+
+    cells = {}   # (weekday, time) -> cell
+    for slot in availability:
+        # TIME columns come back as timedelta
+        slot_time = (datetime.min + slot["start_time"]).time()
+        cells[(WEEKDAYS.index(slot["day"]), slot_time)] = {"available": True, "appointments": []}
+
+    for appt in appointments:
+        at = appt["appointment_timestamp"]
+        cell = cells.setdefault((at.weekday(), at.time()), {"available": False, "appointments": []})
+        cell["appointments"].append({
+            "id": appt["id"],
+            "status": appt["status"],
+            "patient_name": appt["patient_name"],
+            "at": at,
+        })
+
+    times = sorted({slot_time for _, slot_time in cells})
+    return {
+        "week_start": week_start,
+        "days": [week_start + timedelta(days=i) for i in range(7)],
+        "rows": [
+            {"time": slot_time, "cells": [cells.get((weekday, slot_time)) for weekday in range(7)]}
+            for slot_time in times
+        ],
+    }
@@ -0,0 +1,329 @@
+"""
+Front-desk check-in and the live waiting queue.
+
+`check_in_for` records `appointments.arrival_timestamp`. Each clinic keeps
+an in-memory queue per doctor of today's checked-in appointments that are
+still open (requested / confirmed), ordered by appointment time, then
+arrival:
+
+- every queue maps appointment id -> (position, minutes ahead), so a
+  patient's position and estimated wait are O(1) lookups
+- the wait is the sum of the slot lengths of everyone ahead: the
+  `doctor_availability.slot_duration_minutes` of today's matching slot,
+  else the doctor's slot length today, else DEFAULT_SLOT_MINUTES
+- a worker builds the queues from today's rows on first use, then applies
+  rows whose `updated_at` moved since its last refresh
+- check-ins and status changes of today's appointments bump the clinic's
+  shared-cache generation (`checkin:<clinic>`) once they commit. Polls
+  only refresh when it moved, or every CHECKIN_REFRESH_INTERVAL seconds
+  as a fallback, so the waiting-room display and the doctor dashboard
+  poll memory, not MySQL.
+
+Usage:
+    check_in_for(user, {"appointment_id": 42})
+    waiting_queue_for(user, request.args)   # JSON-serializable
+"""
+
+import threading
+import time
+from datetime import date, datetime, timedelta
+
+from flask import current_app
+
+from app.audit.service import audit_log
+from app.appointments.calendar import WEEKDAYS
+from app.db import after_commit, current_clinic, execute, fetchall, fetchone, transaction
+from app.users.directory import list_doctors
+from app.utils.shared_cache import shared_cache
+
+OPEN_STATUSES = ("requested", "confirmed")
+DEFAULT_SLOT_MINUTES = 60   # schema default of slot_duration_minutes
+
+# Transactions commit after their updated_at: re-read rows this recent
+_WATERMARK_LAG = timedelta(seconds=60)
+
+_QUEUE_COLUMNS = """
+    SELECT a.id, a.doctor_id, a.patient_id, ud.name AS patient_name,
+        a.appointment_timestamp, a.arrival_timestamp, a.status, a.deleted_at
+    FROM appointments a
+    LEFT JOIN user_details ud ON ud.user_id = a.patient_id
+    WHERE a.appointment_timestamp >= %s AND a.appointment_timestamp < %s
+"""
+
+
+class CheckinQueue:
+    """
+    In-memory waiting queues of one clinic shard for today.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._day = None
+        self._rows = {}           # appointment id -> row (checked in, still open)
+        self._by_doctor = {}      # doctor_id -> {appointment id -> row}
+        self._by_patient = {}     # patient_id -> {appointment id}
+        self._queues = {}         # doctor_id -> [row, ...] in queue order
+        self._positions = {}      # appointment id -> (position, minutes ahead)
+        self._slot_minutes = {}   # (doctor_id, time) or doctor_id -> minutes, today
+        self._watermark = None
+        self._generation = None
+        self._refreshed_at = 0.0
+
+    def refresh(self, generation: int, max_age: float):
+        """Apply changes if `generation` moved, the day changed or `max_age` passed."""
+        with self._lock:
+            today = date.today()
+            if (self._day == today and self._generation == generation
+                    and time.monotonic() - self._refreshed_at < max_age):
+                return
+
+            watermark = fetchone("SELECT NOW() AS now")["now"]
+            start = datetime.combine(today, datetime.min.time())
+            window = (start, start + timedelta(days=1))
+            if self._day != today:
+                self._reset(today)
+                rows = fetchall(
+                    f"{_QUEUE_COLUMNS} AND a.arrival_timestamp IS NOT NULL AND a.deleted_at IS NULL",
+                    window
+                )
+            else:
+                # Soft-deleted rows are read too, so `_apply` drops them from the queue
+                rows = fetchall(
+                    f"{_QUEUE_COLUMNS} AND a.updated_at >= %s",
+                    (*window, self._watermark - _WATERMARK_LAG)
+                )
+
+            changed = set()
+            for row in rows:
+                changed |= self._apply(row)
+            for doctor_id in changed:
+                self._reindex(doctor_id)
+            self._watermark, self._generation = watermark, generation
+            self._refreshed_at = time.monotonic()
+
+    def doctor_ids(self) -> list[int]:
+        return list(self._queues)
+
+    def waiting(self, doctor_id: int) -> list[dict]:
+        """Checked-in appointments of `doctor_id`, in queue order."""
+        return self._queues.get(doctor_id, [])
+
+    def position(self, appointment_id: int):
+        """(position from 1, estimated wait in minutes), or None if not waiting."""
+        return self._positions.get(appointment_id)
+
+    def appointments_of(self, patient_id: int) -> set:
+        with self._lock:
+            return set(self._by_patient.get(patient_id, ()))
+
+    def _reset(self, today: date):
+        self._day = today
+        self._rows, self._by_doctor, self._by_patient, self._queues, self._positions = {}, {}, {}, {}, {}
+        self._slot_minutes = {}
+        for slot in fetchall(
+            "SELECT user_id, start_time, slot_duration_minutes FROM doctor_availability WHERE day = %s",
+            (WEEKDAYS[today.weekday()],)
+        ):
+            slot_time = (datetime.min + slot["start_time"]).time()
+            self._slot_minutes[(slot["user_id"], slot_time)] = slot["slot_duration_minutes"]
+            self._slot_minutes.setdefault(slot["user_id"], slot["slot_duration_minutes"])
+
+    def _apply(self, row: dict) -> set:
+        """Index or drop one appointment row. Returns the doctors whose queue changed."""
+        changed = set()
+        old = self._rows.pop(row["id"], None)
+        if old is not None:
+            del self._by_doctor[old["doctor_id"]][row["id"]]
+            self._by_patient[old["patient_id"]].discard(row["id"])
+            self._positions.pop(row["id"], None)
+            changed.add(old["doctor_id"])
+
+        if (row["arrival_timestamp"] and row["status"] in OPEN_STATUSES and row["deleted_at"] is None
+                and row["appointment_timestamp"].date() == self._day):
+            self._rows[row["id"]] = row
+            self._by_doctor.setdefault(row["doctor_id"], {})[row["id"]] = row
+            self._by_patient.setdefault(row["patient_id"], set()).add(row["id"])
+            changed.add(row["doctor_id"])
+        return changed
+
+    def _reindex(self, doctor_id: int):
+        rows = sorted(
+            self._by_doctor.get(doctor_id, {}).values(),
+            key=lambda r: (r["appointment_timestamp"], r["arrival_timestamp"], r["id"])
+        )
+        ahead = 0
+        for position, row in enumerate(rows, 1):
+            self._positions[row["id"]] = (position, ahead)
+            ahead += self._slot_minutes.get(
+                (doctor_id, row["appointment_timestamp"].time()),
+                self._slot_minutes.get(doctor_id, DEFAULT_SLOT_MINUTES)
+            )
+        # Replaced, never mutated: readers may hold the old list
+        if rows:
+            self._queues[doctor_id] = rows
+        else:
+            self._queues.pop(doctor_id, None)
+
+
+_queues = {}    # clinic -> CheckinQueue
+_queues_lock = threading.Lock()
+
+def get_checkin_queue() -> CheckinQueue:
+    """Return the waiting queues of the current clinic, refreshed if they changed."""
+    clinic = current_clinic()
+    with _queues_lock:
+        queue = _queues.get(clinic)
+        if queue is None:
+            queue = _queues[clinic] = CheckinQueue()
+    # Read before refreshing: a change committed meanwhile triggers the next refresh
+    generation = shared_cache.generation(f"checkin:{clinic}")
+    queue.refresh(generation, current_app.config["CHECKIN_REFRESH_INTERVAL"])
+    return queue
+
+def queue_changed():
+    """Make every worker refresh the current clinic's queues once the transaction commits."""
+    namespace = f"checkin:{current_clinic()}"
+    after_commit(lambda: shared_cache.invalidate(namespace))
+
+
+def check_in_for(user, data: dict) -> dict:
+    """
+    Record the arrival of a patient for today's appointment.
+
+    Authorization:
+    - manage_appointments / clinic receptionist: any appointment (front desk)
+    - patient: own appointments (kiosk)
+
+    Raises:
+        ValueError if the appointment cannot be checked in.
+
+    Returns:
+        {"appointment_id", "position", "wait_minutes"}
+    """
+    staff = user.has_permission("manage_appointments") or user.has_role("clinic_receptionist")
+    if not staff and not user.has_role("patient"):
+        raise ValueError("User is not allowed to check in patients")
+
+    try:
+        appointment_id = int(data.get("appointment_id"))
+    except (TypeError, ValueError):
+        raise ValueError("Invalid appointment ID")
+
+    with transaction():
+        appointment = fetchone(
+            """
+            SELECT id, patient_id, appointment_timestamp, arrival_timestamp, status
+            FROM appointments
+            WHERE id = %s AND deleted_at IS NULL
+            FOR UPDATE
+            """,
+            (appointment_id,)
+        )
+        if not appointment:
+            raise ValueError("Appointment not found")
+        if not staff and appointment["patient_id"] != user.id:
+            raise ValueError("Patient can only check in to their own appointments")
+        if appointment["status"] not in OPEN_STATUSES:
+            raise ValueError(f"Cannot check in a {appointment['status']} appointment")
+        if appointment["appointment_timestamp"].date() != date.today():
+            raise ValueError("Only today's appointments can be checked in")
+        if appointment["arrival_timestamp"]:
+            raise ValueError("Patient is already checked in")
+
+        execute(
+            "UPDATE appointments SET arrival_timestamp = %s WHERE id = %s",
+            (datetime.now().replace(microsecond=0), appointment_id)
+        )
+        queue_changed()
+
+    audit_log.record(user.id, "appointment.checkin", "appointment", appointment_id, {})
+    position, wait = get_checkin_queue().position(appointment_id) or (None, None)
+    return {"appointment_id": appointment_id, "position": position, "wait_minutes": wait}
+
+def waiting_queue_for(user, data: dict = None) -> dict:
+    """
+    Today's waiting queues, from memory.
+
+    Authorization:
+    - manage_appointments / clinic receptionist: every doctor (or `doctor_id`)
+    - doctor: own queue
+    - patient: own checked-in appointments only (position and wait)
+    - others: ValueError
+
+    Returns:
+        {"date", "doctors": [{"doctor_id", "doctor_name", "waiting": [
+            {"appointment_id", "patient_name", "appointment_time", "arrived_at",
+             "position", "wait_minutes"}, ...]}, ...]}
+    """
+    data = data or {}
+    queue = get_checkin_queue()
+    only = None
+
+    if user.has_permission("manage_appointments") or user.has_role("clinic_receptionist"):
+        doctor_id = data.get("doctor_id")
+        if doctor_id:
+            try:
+                doctor_ids = [int(doctor_id)]
+            except ValueError:
+                raise ValueError("Invalid doctor ID")
+        else:
+            doctor_ids = queue.doctor_ids()
+    elif user.has_role("doctor"):
+        doctor_ids = [user.id]
+    elif user.has_role("patient"):
+        only = queue.appointments_of(user.id)
+        doctor_ids = queue.doctor_ids()
+    else:
+        raise ValueError("User is not allowed to view the waiting queue")
+
+    names = {d["user_id"]: d["name"] for d in list_doctors()}
+    doctors = []
+    for doctor_id in sorted(doctor_ids, key=lambda d: names.get(d) or ""):
+        waiting = []
+        for row in queue.waiting(doctor_id):
+            if only is not None and row["id"] not in only:
+                continue
+            position = queue.position(row["id"])
+            if position is None:
+                continue
+            waiting.append({
+                "appointment_id": row["id"],
+                "patient_name": row["patient_name"],
+                "appointment_time": row["appointment_timestamp"].strftime("%H:%M"),
+                "arrived_at": row["arrival_timestamp"].strftime("%H:%M"),
+                "position": position[0],
+                "wait_minutes": position[1],
+            })
+        if waiting or only is None:
+            doctors.append({"doctor_id": doctor_id, "doctor_name": names.get(doctor_id), "waiting": waiting})
+
+    return {"date": date.today().isoformat(), "doctors": doctors}
+
+def list_expected_for(user) -> list[dict]:
+    """
+    Today's open appointments that have not checked in yet (for the check-in form).
+
+    Authorization:
+    - manage_appointments / clinic receptionist: all
+    - patient: own
+    - others: empty list
+    """
+    start = datetime.combine(date.today(), datetime.min.time())
+    query = """
+        SELECT a.id, a.appointment_timestamp, p.name AS patient_name, d.name AS doctor_name
+        FROM appointments a
+        LEFT JOIN user_details p ON p.user_id = a.patient_id
+        LEFT JOIN user_details d ON d.user_id = a.doctor_id
+        WHERE a.appointment_timestamp >= %s AND a.appointment_timestamp < %s
+            AND a.arrival_timestamp IS NULL AND a.status IN ('requested', 'confirmed')
+            AND a.deleted_at IS NULL
+    """
+    parameters = [start, start + timedelta(days=1)]
+    if user.has_permission("manage_appointments") or user.has_role("clinic_receptionist"):
+        pass
+    elif user.has_role("patient"):
+        query += " AND a.patient_id = %s"
+        parameters.append(user.id)
+    else:
+        return []
+    return fetchall(f"{query} ORDER BY a.appointment_timestamp", parameters)
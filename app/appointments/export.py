@@ -0,0 +1,133 @@
+"""
+Appointment export for reporting.
+
+Streams appointments (hot and archived) joined with doctor and patient
+names and doctor fees as CSV or NDJSON for a date range.
+
+Rows are read through a server-side cursor and encoded in chunks, so
+memory stays constant no matter how many rows are exported.
+"""
+
+import csv
+import io
+import json
+from datetime import datetime, timedelta
+
+from app.db import stream
+
+EXPORT_FORMATS = {
+    "csv": "text/csv",
+    "ndjson": "application/x-ndjson",
+}
+
+EXPORT_FIELDS = [
+    "id", "appointment_timestamp", "status",
+    "doctor_id", "doctor_name", "specialization", "fees",
+    "patient_id", "patient_name",
+    "arrival_timestamp", "created_by_staff", "created_at", "archived",
+]
+
+_EXPORT_QUERY = """
+    SELECT a.id, a.appointment_timestamp, a.status,
+        a.doctor_id, d.name AS doctor_name, dd.specialization, dd.fees,
+        a.patient_id, p.name AS patient_name,
+        a.arrival_timestamp, a.created_by_staff, a.created_at,
+        {archived} AS archived
+    FROM {source} a
+    JOIN user_details d ON a.doctor_id = d.user_id
+    JOIN user_details p ON a.patient_id = p.user_id
+    LEFT JOIN doctor_details dd ON a.doctor_id = dd.user_id
+    WHERE a.appointment_timestamp >= %s AND a.appointment_timestamp < %s
+        AND a.deleted_at IS NULL
+"""
+
+# Rows encoded per yielded chunk
+CHUNK_ROWS = 500
+
+def export_appointments_for(user, data: dict) -> tuple:
+    """
+    Validate an export request and return (chunks, mimetype).
+
+    Authorization:
+    - Caller must have the `manage_appointments` permission.
+
+    Parameters (query string / CLI):
+    - from, to: YYYY-MM-DD, inclusive
+    - format: csv (default) or ndjson
+
+    Raises:
+        ValueError if authorization or parameters are invalid.
+    """
+    if not user.has_permission("manage_appointments"):
+        raise ValueError("User is not allowed to export appointments")
+
+    export_format = (data.get("format") or "csv").lower()
+    if export_format not in EXPORT_FORMATS:
+        raise ValueError("Invalid export format")
+
+    start, end = parse_export_range(data.get("from"), data.get("to"))
+    rows = export_rows(start, end)
+    chunks = to_csv(rows) if export_format == "csv" else to_ndjson(rows)
+    return chunks, EXPORT_FORMATS[export_format]
+
+def parse_export_range(date_from: str, date_to: str) -> tuple[datetime, datetime]:
+    """
+    Helper function that parses an inclusive YYYY-MM-DD range into [start, end).
+    """
+    if not date_from or not date_to:
+        raise ValueError("Export date range is required")
+    try:
+        start = datetime.strptime(date_from, "%Y-%m-%d")
+        end = datetime.strptime(date_to, "%Y-%m-%d") + timedelta(days=1)
+    except ValueError:
+        raise ValueError("Invalid export date range")
+    if end <= start:
+        raise ValueError("Export range end must not be before its start")
+    return start, end
+
+def export_rows(start: datetime, end: datetime):
+    """
+    Yield export rows for appointments in [start, end), hot table first, then archive.
+    Each part is a range scan on the appointment timestamp index.
+    """
+    for source, archived in (("appointments", 0), ("appointments_archive", 1)):
+        yield from stream(
+            _EXPORT_QUERY.format(source=source, archived=archived),
+            (start, end)
+        )
+
+def to_csv(rows):
+    """Encode rows as CSV text chunks, header first."""
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=EXPORT_FIELDS, extrasaction="ignore")
+    writer.writeheader()
+
+    count = 0
+    for row in rows:
+        writer.writerow(row)
+        count += 1
+        if count % CHUNK_ROWS == 0:
+            yield _take(buffer)
+    yield _take(buffer)
+
+def to_ndjson(rows):
+    """Encode rows as newline-delimited JSON chunks."""
+    lines = []
+    for row in rows:
+        lines.append(json.dumps({f: row[f] for f in EXPORT_FIELDS}, default=_json_default))
+        if len(lines) == CHUNK_ROWS:
+            yield "\n".join(lines) + "\n"
+            lines = []
+    if lines:
+        yield "\n".join(lines) + "\n"
+
+def _take(buffer: io.StringIO) -> str:
+    chunk = buffer.getvalue()
+    buffer.seek(0)
+    buffer.truncate()
+    return chunk
+
+def _json_default(value):
+    if isinstance(value, datetime):
+        return value.isoformat(sep=" ")
+    return str(value)
@@ -0,0 +1,168 @@
+"""
+Appointment listing filters.
+
+Turns listing parameters into a WHERE clause and an index hint:
+
+    query = AppointmentQuery.from_args(request.args)   # raises ValueError
+    query = query.scoped(doctor_id=user.id)             # RBAC scope; None if it conflicts
+
+Column names and index names only ever come from the tables below; values
+are always bound as parameters.
+
+Every equality filter has a composite `(column, appointment_timestamp)`
+index, so one equality prefix plus the date range is a single index range
+read already in listing order (no filesort). When several equality filters
+are given, the most selective column drives the index and the others are
+checked on the rows it returns. The hint is forced because on small or
+skewed tables the optimizer tends to prefer a table scan plus filesort,
+and listing queries use STRAIGHT_JOIN so the appointment table drives the
+joins. With history, the hot table and the archive are read by separate
+statements and merged in order (a UNION would need a filesort).
+
+`flask appointments explain` checks the live plan of every filter
+combination; tests/test_appointment_query.py checks the generated SQL.
+"""
+
+from datetime import datetime, timedelta
+from itertools import combinations
+
+STATUSES = ("requested", "confirmed", "cancelled", "completed", "no_show")
+
+# Filter name -> column, most selective first (a patient has far fewer
+# appointments than a doctor); the first one present drives the index
+EQUALITY_FILTERS = {
+    "patient_id": "a.patient_id",
+    "doctor_id": "a.doctor_id",
+    "created_by_staff": "a.created_by_staff",
+    "status": "a.status",
+}
+
+# Table -> driving filter -> index; None = date range / no filter
+INDEXES = {
+    "appointments": {
+        "doctor_id": "cidx_appointments_doctor_at",
+        "patient_id": "cidx_appointments_patient_at",
+        "created_by_staff": "cidx_appointments_staff_at",
+        "status": "cidx_appointments_status_at",
+        None: "idx_appointments_at",
+    },
+    "appointments_archive": {
+        "doctor_id": "cidx_appointments_archive_doctor_at",
+        "patient_id": "cidx_appointments_archive_patient_at",
+        "created_by_staff": "cidx_appointments_archive_staff_at",
+        "status": "cidx_appointments_archive_status_at",
+        None: "idx_appointments_archive_at",
+    },
+}
+
+
+class AppointmentQuery:
+    def __init__(self, equals: dict = None, start: datetime = None, end: datetime = None):
+        self.equals = dict(equals or {})   # filter name -> value
+        self.start = start                 # inclusive
+        self.end = end                     # exclusive
+
+    @classmethod
+    def from_args(cls, args) -> "AppointmentQuery":
+        """
+        Parse listing parameters: from, to (YYYY-MM-DD, inclusive), doctor_id,
+        patient_id, created_by_staff, status. Empty values are ignored.
+
+        Raises:
+            ValueError if a value is malformed.
+        """
+        equals = {}
+        for name in ("doctor_id", "patient_id", "created_by_staff"):
+            value = (args.get(name) or "").strip()
+            if value:
+                if not value.isdigit():
+                    raise ValueError(f"Invalid {name.replace('_', ' ')}")
+                equals[name] = int(value)
+
+        status = args.get("status")
+        if status:
+            if status not in STATUSES:
+                raise ValueError("Invalid status")
+            equals["status"] = status
+
+        try:
+            start = datetime.strptime(args["from"], "%Y-%m-%d") if args.get("from") else None
+            end = datetime.strptime(args["to"], "%Y-%m-%d") + timedelta(days=1) if args.get("to") else None
+        except ValueError:
+            raise ValueError("Dates must be YYYY-MM-DD")
+        if start and end and start >= end:
+            raise ValueError("'From' must not be after 'To'")
+        return cls(equals, start, end)
+
+    def scoped(self, **scope):
+        """
+        Add the caller's mandatory filters (e.g. doctor_id=user.id).
+        Returns None if a requested filter contradicts the scope (nothing visible).
+        """
+        equals = dict(self.equals)
+        for name, value in scope.items():
+            if name in equals and equals[name] != value:
+                return None
+            equals[name] = value
+        return AppointmentQuery(equals, self.start, self.end)
+
+    @property
+    def is_filtered(self) -> bool:
+        return bool(self.equals or self.start or self.end)
+
+    def driving_filter(self):
+        return next((name for name in EQUALITY_FILTERS if name in self.equals), None)
+
+    def index_for(self, source: str) -> str:
+        return INDEXES[source][self.driving_filter()]
+
+    def index_hint(self, source: str) -> str:
+        return f"FORCE INDEX ({self.index_for(source)})"
+
+    def where(self) -> tuple[str, tuple]:
+        """Conditions (each prefixed with AND) and their parameters."""
+        conditions, parameters = [], []
+        for name, column in EQUALITY_FILTERS.items():
+            if name in self.equals:
+                conditions.append(f"{column} = %s")
+                parameters.append(self.equals[name])
+        if self.start:
+            conditions.append("a.appointment_timestamp >= %s")
+            parameters.append(self.start)
+        if self.end:
+            conditions.append("a.appointment_timestamp < %s")
+            parameters.append(self.end)
+        return "".join(f" AND {c}" for c in conditions), tuple(parameters)
+
+    def statements(self, template: str, include_history: bool = False) -> list[tuple[str, str, tuple]]:
+        """
+        Listing statements for `template` as (table, SQL, parameters), one
+        per table (hot, then archive if `include_history`), each returning
+        rows newest first.
+
+        `template` must select FROM `{source} a {index}`, include `{archived} AS archived`
+        and end its WHERE clause with `{filters}`.
+        """
+        conditions, parameters = self.where()
+        sources = ("appointments", "appointments_archive") if include_history else ("appointments",)
+        return [
+            (
+                source,
+                template.format(source=source, archived=int(source != "appointments"),
+                                index=self.index_hint(source), filters=conditions).rstrip()
+                + " ORDER BY a.appointment_timestamp DESC",
+                parameters
+            )
+            for source in sources
+        ]
+
+def filter_combinations():
+    """Every combination of filters with placeholder values (for plan checks)."""
+    values = {"doctor_id": 1, "patient_id": 1, "created_by_staff": 1, "status": "confirmed"}
+    names = list(EQUALITY_FILTERS)
+    start = datetime(2000, 1, 1)
+    for size in range(len(names) + 1):
+        for chosen in combinations(names, size):
+            equals = {name: values[name] for name in chosen}
+            yield AppointmentQuery(equals)
+            yield AppointmentQuery(equals, start, start + timedelta(days=7))
@@ -0,0 +1,210 @@
+"""
+Appointment reminder scheduler.
+
+Keeps upcoming confirmed appointments in a min-heap keyed by reminder
+time and dispatches due reminders in batches to a pluggable notifier.
+
+Loading never re-scans the whole table:
+- `_load_window`: range scan on `idx_appointments_at` for the next
+  slice of time past what is already loaded
+- `_refresh_changes`: range scan over the loaded slice only, for rows
+  whose `updated_at` moved since the last refresh (new bookings,
+  confirmations, cancellations, reschedules)
+
+Cancelled or changed entries are dropped lazily: a heap entry is only
+dispatched if it still matches the current entry for that appointment.
+Sent reminders are marked in `appointments.reminded_at`.
+
+Run a single scheduler process (one scheduler per clinic shard):
+    flask appointments reminders
+"""
+
+import heapq
+import logging
+import time
+from datetime import datetime, timedelta
+from importlib import import_module
+
+from flask import current_app
+
+from app.db import execute_commit, fetchall, fetchone, get_db, use_clinic
+
+_REMINDER_COLUMNS = """
+    SELECT a.id, a.patient_id, a.doctor_id, a.appointment_timestamp, a.status,
+        a.reminded_at, a.deleted_at, a.updated_at,
+        p.name AS patient_name, u.email AS patient_email,
+        d.name AS doctor_name
+    FROM appointments a
+    JOIN users u ON u.id = a.patient_id
+    JOIN user_details p ON p.user_id = a.patient_id
+    JOIN user_details d ON d.user_id = a.doctor_id
+"""
+
+# Transactions commit after their updated_at: re-read rows this recent
+_WATERMARK_LAG = timedelta(seconds=60)
+
+
+class LogNotifier:
+    """
+    Stand-in notifier: appends one line per reminder to a file, or to the
+    app logger when no file is configured.
+
+    Notifier interface: send(reminders: list[dict]) -> None
+    """
+
+    def __init__(self, app):
+        self.path = app.config.get("REMINDER_LOG_FILE")
+        self.logger = logging.getLogger("app.reminders")
+
+    def send(self, reminders: list[dict]):
+        lines = [
+            f"{datetime.now():%Y-%m-%d %H:%M:%S} reminder appointment={r['id']} "
+            f"to={r['patient_email']} patient={r['patient_name']!r} "
+            f"doctor={r['doctor_name']!r} at={r['appointment_timestamp']}"
+            for r in reminders
+        ]
+        if self.path:
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write("\n".join(lines) + "\n")
+        else:
+            for line in lines:
+                self.logger.info(line)
+
+
+class ReminderScheduler:
+    """
+    Reminder scheduler for one clinic shard.
+    """
+
+    def __init__(self, app, clinic: str = None, notifier=None):
+        config = app.config
+        self.clinic = clinic or config["DEFAULT_CLINIC"]
+        self.lead = config["REMINDER_LEAD"]
+        self.window = config["REMINDER_WINDOW"]
+        self.batch_size = config["REMINDER_BATCH_SIZE"]
+
+        if notifier is None:
+            path = config.get("REMINDER_NOTIFIER")
+            if path:
+                module_name, _, class_name = path.partition(":")
+                notifier = getattr(import_module(module_name), class_name)(app)
+            else:
+                notifier = LogNotifier(app)
+        self.notifier = notifier
+
+        self._heap = []           # (remind_at, appointment_id, appointment_timestamp)
+        self._entries = {}        # appointment_id -> row currently scheduled
+        self._loaded_until = None
+        self._watermark = None    # DB time of the last change refresh
+
+    def __len__(self):
+        return len(self._entries)
+
+    def tick(self, now: datetime = None) -> int:
+        """
+        One scheduler step: pick up changes, extend the loaded window if
+        needed, dispatch due reminders. Returns the number sent.
+        """
+        with use_clinic(self.clinic):
+            return self._tick(now or datetime.now())
+
+    def _tick(self, now: datetime) -> int:
+        # End the previous read snapshot so new commits are visible
+        get_db().commit()
+
+        if self._loaded_until is None:
+            self._watermark = fetchone("SELECT NOW() AS now")["now"]
+            self._loaded_until = now
+        else:
+            self._refresh_changes(now)
+
+        if self._loaded_until - now < self.lead + self.window / 2:
+            self._load_window(now + self.lead + self.window)
+
+        return self._dispatch_due(now)
+
+    def _load_window(self, until: datetime):
+        rows = fetchall(
+            f"""
+            {_REMINDER_COLUMNS}
+            WHERE a.appointment_timestamp >= %s AND a.appointment_timestamp < %s
+                AND a.status = 'confirmed' AND a.reminded_at IS NULL AND a.deleted_at IS NULL
+            """,
+            (self._loaded_until, until)
+        )
+        for row in rows:
+            self._schedule(row)
+        self._loaded_until = until
+
+    def _refresh_changes(self, now: datetime):
+        watermark = fetchone("SELECT NOW() AS now")["now"]
+        rows = fetchall(
+            f"""
+            {_REMINDER_COLUMNS}
+            WHERE a.appointment_timestamp >= %s AND a.appointment_timestamp < %s
+                AND a.updated_at >= %s
+            """,
+            (now, self._loaded_until, self._watermark - _WATERMARK_LAG)
+        )
+        for row in rows:
+            if row["status"] == "confirmed" and row["reminded_at"] is None and row["deleted_at"] is None:
+                self._schedule(row)
+            else:
+                self._entries.pop(row["id"], None)
+        self._watermark = watermark
+
+    def _schedule(self, row: dict):
+        current = self._entries.get(row["id"])
+        self._entries[row["id"]] = row
+        if current and current["appointment_timestamp"] == row["appointment_timestamp"]:
+            return  # already queued for this time
+        remind_at = row["appointment_timestamp"] - self.lead
+        heapq.heappush(self._heap, (remind_at, row["id"], row["appointment_timestamp"]))
+
+    def _dispatch_due(self, now: datetime) -> int:
+        sent = 0
+        while self._heap and self._heap[0][0] <= now:
+            batch = []
+            while self._heap and self._heap[0][0] <= now and len(batch) < self.batch_size:
+                _, appointment_id, appointment_ts = heapq.heappop(self._heap)
+                row = self._entries.get(appointment_id)
+                # Stale entry: cancelled, already sent, or rescheduled
+                if row is None or row["appointment_timestamp"] != appointment_ts:
+                    continue
+                if appointment_ts <= now:
+                    self._entries.pop(appointment_id)
+                    continue
+                batch.append(row)
+            if not batch:
+                continue
+
+            try:
+                self.notifier.send(batch)
+            except Exception:
+                # Still in _entries: requeue them, or _schedule would skip them as queued
+                for row in batch:
+                    heapq.heappush(self._heap, (
+                        row["appointment_timestamp"] - self.lead, row["id"], row["appointment_timestamp"]
+                    ))
+                raise
+            ids = tuple(row["id"] for row in batch)
+            placeholders = ", ".join(["%s"] * len(ids))
+            execute_commit(
+                f"UPDATE appointments SET reminded_at = NOW() WHERE id IN ({placeholders})",
+                ids
+            )
+            for appointment_id in ids:
+                self._entries.pop(appointment_id, None)
+            sent += len(ids)
+        return sent
+
+
+def run_schedulers(schedulers: list, poll_interval: float, stop=None):
+    """Tick every scheduler each `poll_interval` seconds until `stop()` returns True."""
+    while not (stop and stop()):
+        for scheduler in schedulers:
+            try:
+                scheduler.tick()
+            except Exception:
+                current_app.logger.exception("reminder tick failed for clinic %s", scheduler.clinic)
+        time.sleep(poll_interval)
@@ -1,8 +1,13 @@
-from flask import flash, redirect, render_template, request, url_for
+from flask import Response, current_app, flash, jsonify, redirect, render_template, request, stream_with_context, url_for
 from flask_login import login_required, current_user
 from . import bp
 from app.utils.permissions import permissions_required
-from app.appointments.service import list_appointments_for, create_appointment_for, update_appointment_status_for
+from app.utils.idempotency import idempotent, request_idempotency_key
+from app.appointments.service import list_appointments_for, list_doctor_choices_for, create_appointment_for, update_appointment_status_for
+from app.appointments.query import AppointmentQuery, STATUSES
+from app.appointments.export import export_appointments_for
+from app.appointments.waitlist import join_waitlist_for, list_waitlist_for, respond_to_waitlist_for
+from app.appointments.checkin import check_in_for, list_expected_for, waiting_queue_for
 
 @bp.route("/list", methods=["GET"])
 @login_required
@@ -13,8 +18,30 @@ def list_appointments():
     Access is enforced via permission checks.
     Data scope is enforced in the service layer.
     """
-    appointments = list_appointments_for(current_user)
-    return render_template("appointments/list.html",appointments=appointments)
+    include_history = request.args.get("history") == "1"
+    all_clinics = request.args.get("clinic") == "all"
+    try:
+        query = AppointmentQuery.from_args(request.args)
+    except ValueError as e:
+        flash (str(e))
+        return redirect(url_for("appointments.list_appointments"))
+
+    appointments = list_appointments_for(current_user, include_history, all_clinics, query)
+    # Filters carried over by the history/clinic toggles
+    filters = {
+        name: request.args[name]
+        for name in ("from", "to", "doctor_id", "patient_id", "created_by_staff", "status")
+        if request.args.get(name)
+    }
+    return render_template(
+        "appointments/list.html",
+        appointments=appointments,
+        include_history=include_history,
+        all_clinics=all_clinics,
+        filters=filters,
+        statuses=STATUSES,
+        doctors=list_doctor_choices_for(current_user)
+    )
 
 @bp.route("/create", methods=["GET", "POST"])
 @login_required
@@ -25,7 +52,10 @@ def create_appointment():
         return render_template("appointments/create.html")
 
     try:
-        appointment_id = create_appointment_for(current_user, request.form)
+        appointment_id, _ = idempotent(
+            "appointments.create", current_user.id, request_idempotency_key(),
+            lambda: create_appointment_for(current_user, request.form)
+        )
     except ValueError as e:
         flash (str(e))
         return redirect(url_for("appointments.create_appointment")) 
@@ -44,4 +74,114 @@ def update_appointment_status():
         return redirect(url_for("appointments.list_appointments"))
     
     flash("Appointment status updated successfully", "success")
-    return redirect(url_for("appointments.list_appointments"))
\ No newline at end of file
+    return redirect(url_for("appointments.list_appointments"))
+
+@bp.route("/export", methods=["GET"])
+@login_required
+@permissions_required("manage_appointments")
+def export_appointments():
+    """
+    Stream appointments for a date range as CSV or NDJSON.
+    The response is sent with chunked transfer encoding while rows are read.
+    """
+    try:
+        chunks, mimetype = export_appointments_for(current_user, request.args)
+    except ValueError as e:
+        flash (str(e))
+        return redirect(url_for("appointments.list_appointments"))
+
+    extension = "csv" if mimetype == "text/csv" else "ndjson"
+    filename = f"appointments_{request.args['from']}_{request.args['to']}.{extension}"
+    return Response(
+        stream_with_context(chunks),
+        mimetype=mimetype,
+        headers={"Content-Disposition": f"attachment; filename={filename}"}
+    )
+
+@bp.route("/waitlist", methods=["GET", "POST"])
+@login_required
+@permissions_required("create_appointments")
+def waitlist():
+    """
+    Show waitlist entries visible to the current user and join the waitlist.
+    """
+    if request.method == "GET":
+        return render_template(
+            "appointments/waitlist.html",
+            entries=list_waitlist_for(current_user),
+            max_days=current_app.config["WAITLIST_MAX_DAYS"]
+        )
+
+    try:
+        waitlist_id = join_waitlist_for(current_user, request.form)
+    except ValueError as e:
+        flash (str(e))
+        return redirect(url_for("appointments.waitlist"))
+
+    flash("Added to the waitlist", "success")
+    return redirect(url_for("appointments.waitlist"))
+
+@bp.route("/waitlist/respond", methods=["POST"])
+@login_required
+@permissions_required("create_appointments")
+def respond_to_waitlist():
+    try:
+        result_id = respond_to_waitlist_for(current_user, request.form)
+    except ValueError as e:
+        flash (str(e))
+        return redirect(url_for("appointments.waitlist"))
+
+    if request.form.get("action") == "accept":
+        flash("Appointment booked from the waitlist", "success")
+        return redirect(url_for("appointments.list_appointments"))
+
+    flash("Removed from the waitlist", "success")
+    return redirect(url_for("appointments.waitlist"))
+
+@bp.route("/queue", methods=["GET"])
+@login_required
+@permissions_required("view_appointments")
+def queue():
+    """
+    Waiting-room display: today's check-in queues, refreshed by polling `queue.json`.
+    Staff and patients also get the check-in form.
+    """
+    try:
+        data = waiting_queue_for(current_user, request.args)
+    except ValueError as e:
+        flash (str(e))
+        return redirect(url_for("appointments.list_appointments"))
+
+    return render_template(
+        "appointments/queue.html",
+        queue=data,
+        expected=list_expected_for(current_user),
+        doctor_id=request.args.get("doctor_id", ""),
+        poll_interval=current_app.config["CHECKIN_POLL_INTERVAL"]
+    )
+
+@bp.route("/queue.json", methods=["GET"])
+@login_required
+@permissions_required("view_appointments")
+def queue_json():
+    """Today's check-in queues as JSON (served from memory, for polling)."""
+    try:
+        return jsonify(waiting_queue_for(current_user, request.args))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 403
+
+@bp.route("/check_in", methods=["POST"])
+@login_required
+@permissions_required("update_appointments")
+def check_in():
+    try:
+        result = check_in_for(current_user, request.form)
+    except ValueError as e:
+        flash (str(e))
+        return redirect(url_for("appointments.queue"))
+
+    if result["position"]:
+        flash(f"Checked in: number {result['position']} in the queue, about {result['wait_minutes']} minutes", "success")
+    else:
+        flash("Checked in", "success")
+    return redirect(url_for("appointments.queue"))
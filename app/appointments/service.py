@@ -12,24 +12,41 @@ Security model:
   and valid state transitions.
 """
 
-from app.db import fetchall, fetchone, execute, transaction
+import heapq
+from app.db import fetchall, fetchone, execute, execute_commit, transaction, fan_out
 from datetime import datetime
+from app.auth.catalog import get_role_catalog
 from app.users.service import create_user_by_staff
+from app.users.directory import list_doctors
+from app.audit.service import audit_log
+from app.appointments.waitlist import backfill_slot
+from app.appointments.calendar import invalidate_doctor_calendar
+from app.appointments.checkin import queue_changed
+from app.appointments.query import AppointmentQuery, STATUSES
 
-ALLOWED_STATUSES = {
-    "requested",
-    "confirmed",
-    "cancelled",
-    "completed",
-    "no_show"
-}
+ALLOWED_STATUSES = set(STATUSES)
 
 VALID_TRANSITIONS = {
     "requested": {"confirmed", "cancelled"},
     "confirmed": {"completed", "cancelled", "no_show"}
 }
 
-def list_appointments_for(user) -> list[dict]:
+# Listing of manage_appointments (also the query `flask appointments explain` checks)
+FULL_VIEW_QUERY = """
+    SELECT STRAIGHT_JOIN a.id, a.patient_id, a.doctor_id, a.appointment_timestamp,
+        a.arrival_timestamp, a.status, a.notes, a.created_by_staff,
+        a.deleted_at, a.created_at, a.updated_at,
+        d.name AS doctor_name,
+        p.name AS patient_name,
+        {archived} AS archived
+    FROM {source} a {index}
+    JOIN user_details d ON a.doctor_id = d.user_id
+    JOIN user_details p ON a.patient_id = p.user_id
+    WHERE a.deleted_at IS NULL {filters}
+"""
+
+def list_appointments_for(user, include_history: bool = False, all_clinics: bool = False,
+                          query: AppointmentQuery = None) -> list[dict]:
     """
     Return appointment records visible to the given user.
 
@@ -43,67 +60,80 @@ def list_appointments_for(user) -> list[dict]:
     - Doctor: own appointments with patient name
     - Patient: own appointments with doctor name
     - Others: empty list
+
+    Filters:
+    - `query` (see app/appointments/query.py) narrows the listing by date
+      range, doctor, patient, status and created_by_staff. It is combined
+      with the role scope above, never widens it.
+
+    History:
+    - By default only the hot `appointments` table is read.
+    - include_history=True also reads `appointments_archive`;
+      archived rows are flagged with `archived = 1`.
+
+    Clinics:
+    - Rows come from the current clinic's shard.
+    - all_clinics=True (manage_appointments only) queries every clinic
+      shard in parallel and merges the results; rows carry `clinic`.
     """
+    query = query or AppointmentQuery()
+
     # Full view: manage_appointments 
     if user.has_permission("manage_appointments"):
-        return fetchall(
-            """
-            SELECT a.id, a.patient_id, a.doctor_id, a.appointment_timestamp, 
-                a.arrival_timestamp, a.status, a.notes, a.created_by_staff, 
-                a.deleted_at, a.created_at, a.updated_at, 
-                d.name AS doctor_name, 
-                p.name AS patient_name
-            FROM appointments a
-            JOIN user_details d ON a.doctor_id = d.user_id
-            JOIN user_details p ON a.patient_id = p.user_id
-            WHERE a.deleted_at IS NULL
-            ORDER BY a.appointment_timestamp DESC 
-            """
+        return _fetch_appointments(
+            FULL_VIEW_QUERY,
+            query,
+            include_history,
+            all_clinics
         )
     
     # Special view: Clinic_receptionist 
     if user.has_role("clinic_receptionist"):
-        return fetchall(
+        return _fetch_appointments(
             """
-            SELECT a.id, a.appointment_timestamp, 
+            SELECT STRAIGHT_JOIN a.id, a.appointment_timestamp, 
             a.arrival_timestamp, a.status, a.notes, 
-            a.created_at, 
+            a.created_at, a.updated_at, 
             d.name AS doctor_name, 
-            p.name AS patient_name
-        FROM appointments a
+            p.name AS patient_name,
+            {archived} AS archived
+        FROM {source} a {index}
         JOIN user_details d ON a.doctor_id = d.user_id
         JOIN user_details p ON a.patient_id = p.user_id
-        WHERE a.deleted_at IS NULL
-        ORDER BY a.appointment_timestamp DESC 
-            """ 
+        WHERE a.deleted_at IS NULL {filters}
+            """,
+            query,
+            include_history
         )
         
     # Read-only access with scoped view
     if user.has_permission("view_appointments"):
         if user.has_role("doctor"):
-            return fetchall(
+            return _fetch_appointments(
                 """
-                SELECT a.id, a.appointment_timestamp, a.status,
-                       p.name AS patient_name
-                FROM appointments a
+                SELECT STRAIGHT_JOIN a.id, a.appointment_timestamp, a.status, a.updated_at,
+                       p.name AS patient_name,
+                       {archived} AS archived
+                FROM {source} a {index}
                 JOIN user_details p ON a.patient_id = p.user_id
-                WHERE a.doctor_id = %s AND a.deleted_at IS NULL
-                ORDER BY a.appointment_timestamp DESC
+                WHERE a.deleted_at IS NULL {filters}
                 """, 
-                (user.id,)
+                query.scoped(doctor_id=user.id),
+                include_history
             )
         
         if user.has_role("patient"):
-            return fetchall(
+            return _fetch_appointments(
                 """
-                SELECT a.id, a.appointment_timestamp, a.status,
-                       d.name AS doctor_name
-                FROM appointments a
+                SELECT STRAIGHT_JOIN a.id, a.appointment_timestamp, a.status, a.updated_at,
+                       d.name AS doctor_name,
+                       {archived} AS archived
+                FROM {source} a {index}
                 JOIN user_details d ON a.doctor_id = d.user_id
-                WHERE a.patient_id = %s AND a.deleted_at IS NULL
-                ORDER BY a.appointment_timestamp DESC
+                WHERE a.deleted_at IS NULL {filters}
                 """, 
-                (user.id,)
+                query.scoped(patient_id=user.id),
+                include_history
             )
         
         # Other roles with view_appointments but no scope
@@ -112,6 +142,69 @@ def list_appointments_for(user) -> list[dict]:
      # User has no permission at all
     return []
 
+def list_doctor_choices_for(user) -> list[dict]:
+    """
+    Doctors for the listing's doctor filter (user_id, name).
+
+    Authorization:
+    - manage_appointments / clinic receptionist / patient: all doctors
+    - others: empty list (doctors only see their own appointments)
+    """
+    if not (user.has_permission("manage_appointments") or user.has_role("clinic_receptionist")
+            or user.has_role("patient")):
+        return []
+    return list_doctors()
+
+def _fetch_appointments(query: str, filters: AppointmentQuery, include_history: bool,
+                        all_clinics: bool = False) -> list[dict]:
+    """
+    Helper function that runs a listing query against the hot table and,
+    optionally, the archive, newest first; on every clinic shard if `all_clinics`.
+
+    `query` is a template for `AppointmentQuery.statements`. `filters` None
+    means nothing is visible.
+    """
+    if filters is None:
+        return []
+
+    # One index-ordered statement per table, merged here instead of a filesorted UNION
+    results = []
+    for _, statement, parameters in filters.statements(query, include_history):
+        if all_clinics:
+            results.append(fan_out(statement, parameters, order_by="appointment_timestamp", reverse=True))
+        else:
+            results.append(fetchall(statement, parameters))
+    if len(results) == 1:
+        return results[0]
+    return list(heapq.merge(*results, key=lambda row: row["appointment_timestamp"], reverse=True))
+
+def explain_listing(filters: AppointmentQuery, include_history: bool = False) -> list[dict]:
+    """
+    EXPLAIN the full-view listing statements for `filters`, exactly as
+    `list_appointments_for` sends them.
+
+    Returns one dict per statement:
+        {"source", "expected", "key", "type", "extra", "ok"}: ok when the
+        appointment table drives the plan through the expected index and no
+        step needs a filesort or temporary table.
+    """
+    plans = []
+    for source, statement, parameters in filters.statements(FULL_VIEW_QUERY, include_history):
+        rows = fetchall(f"EXPLAIN {statement}", parameters)
+        first = rows[0]
+        extra = "; ".join(row.get("Extra") or "" for row in rows if row.get("Extra"))
+        expected = filters.index_for(source)
+        plans.append({
+            "source": source,
+            "expected": expected,
+            "key": first["key"] if first["table"] == "a" else f"{first['table']} first",
+            "type": first["type"],
+            "extra": extra,
+            "ok": (first["table"] == "a" and first["key"] == expected
+                   and "filesort" not in extra and "temporary" not in extra),
+        })
+    return plans
+
 def create_appointment_for(user, data: dict) -> int:
     """
     Create a new appointment if the user is authorized.
@@ -143,39 +236,22 @@ def create_appointment_for(user, data: dict) -> int:
     if not doctor_id or not appt_date or not appt_time:
         raise ValueError("Missing required appointment data")
     
-    # Patient resolution
+    # Patient resolution: own id, or a user name resolved inside the INSERT below
     if user.has_role("patient"):
-        patient_id = user.id
+        patient_column, patient_key = "id", user.id
     elif user.has_permission("create_user"):
         user_name = data.get("user_name")
         if not user_name:
             raise ValueError("Patient username is required")
-        
-        row = fetchone("SELECT id FROM users WHERE user_name = %s",(data.get("user_name"),))
-        if not row:
-            raise ValueError("Patient not found")
-        
-        patient_id = row["id"]
+        patient_column, patient_key = "user_name", user_name
     else:
         raise ValueError("Patient does not exist. Create user first.")
 
-    try:
-        patient_id = int(patient_id)
-    except (TypeError, ValueError):
-        raise ValueError("Invalid patient ID")   
-    
     # Validate doctor
     try:
         doctor_id = int(doctor_id)
     except (TypeError, ValueError):
         raise ValueError("Invalid doctor ID")
-    
-    # Role check
-    if not _user_has_role(patient_id, "patient"):
-        raise ValueError("Selected patient is not a valid patient.")
-    
-    if not _user_has_role(doctor_id, "doctor"):
-        raise ValueError("Selected doctor is not a valid doctor.")
 
     # Parse timestamp safely
     try:
@@ -197,40 +273,63 @@ def create_appointment_for(user, data: dict) -> int:
     
     # Patient, self application creation
     elif user.has_permission("create_appointments") and user.has_role("patient"):
-        if patient_id != user.id:
-            raise ValueError("Patient can only create appointments for themselves")
         created_by_staff = None
         status = "requested"
     
     else:
         raise ValueError("User is not allowed to create appointments")
-    
-    # Insert appointment atomically
-    with transaction():
-        _, appointment_id = execute(
-            """
-            INSERT INTO appointments (patient_id, doctor_id, appointment_timestamp, status, notes, created_by_staff)
-            VALUES (%s, %s, %s, %s, %s, %s)    
-            """,
-            (patient_id, doctor_id, appt_ts, status, notes, created_by_staff)
-        )
 
+    catalog = get_role_catalog()
+    patient_role_id, doctor_role_id = catalog.id_of("patient"), catalog.id_of("doctor")
+    if patient_role_id is None or doctor_role_id is None:
+        raise ValueError("Registration configuration error.")
+
+    # One statement resolves the patient, checks both roles (user_roles primary
+    # key lookups) and inserts; nothing is written unless every check passes.
+    # A single statement is atomic on its own, so no BEGIN round trip either.
+    inserted, appointment_id = execute_commit(
+        f"""
+        INSERT INTO appointments (patient_id, doctor_id, appointment_timestamp, status, notes, created_by_staff)
+        SELECT p.id, %s, %s, %s, %s, %s
+        FROM users p
+        WHERE p.{patient_column} = %s
+            AND EXISTS (SELECT 1 FROM user_roles WHERE user_id = p.id AND role_id = %s)
+            AND EXISTS (SELECT 1 FROM user_roles WHERE user_id = %s AND role_id = %s)
+        """,
+        (doctor_id, appt_ts, status, notes, created_by_staff,
+         patient_key, patient_role_id, doctor_id, doctor_role_id)
+    )
+    if not inserted:
+        _raise_create_failure(patient_column, patient_key, doctor_id, patient_role_id, doctor_role_id)
+
+    invalidate_doctor_calendar(doctor_id)
     return appointment_id
 
-def _user_has_role(user_id: int, role_name: str) -> bool:
+def _raise_create_failure(patient_column: str, patient_key, doctor_id: int,
+                          patient_role_id: int, doctor_role_id: int):
     """
-    Helper function that returns True if the given user_id has the specified role.
+    Helper function that explains why the INSERT ... SELECT above inserted nothing.
+    Runs only on the failure path.
     """
-    return fetchone(
-        """
-        SELECT 1
-        FROM user_roles ur
-        JOIN roles r ON r.id = ur.role_id
-        WHERE ur.user_id = %s AND r.name = %s
-        LIMIT 1
+    row = fetchone(
+        f"""
+        SELECT
+            (SELECT id FROM users WHERE {patient_column} = %s) AS patient_id,
+            EXISTS (
+                SELECT 1 FROM users p JOIN user_roles ur ON ur.user_id = p.id
+                WHERE p.{patient_column} = %s AND ur.role_id = %s
+            ) AS is_patient,
+            EXISTS (SELECT 1 FROM user_roles WHERE user_id = %s AND role_id = %s) AS is_doctor
         """,
-        (user_id, role_name)
-    ) is not None
+        (patient_key, patient_key, patient_role_id, doctor_id, doctor_role_id)
+    )
+    if row["patient_id"] is None:
+        raise ValueError("Patient not found")
+    if not row["is_patient"]:
+        raise ValueError("Selected patient is not a valid patient.")
+    if not row["is_doctor"]:
+        raise ValueError("Selected doctor is not a valid doctor.")
+    raise ValueError("Appointment could not be created")
 
 def _parse_appointment_datetime(date_str: str, time_str: str) -> datetime:
     """
@@ -277,6 +376,8 @@ def update_appointment_status_for(user, data: dict) -> int:
     Data integrity:
     - Only valid status transitions are allowed.
     - Status changes are atomic.
+    - A cancelled or no_show future slot is offered to or booked for the
+      best waitlist candidate in the same transaction (see waitlist.py).
 
     Raises:
         ValueError if authorization or transition is invalid.
@@ -306,7 +407,7 @@ def update_appointment_status_for(user, data: dict) -> int:
     # Fetch and Validate appointment using appointment_id
     appointment = fetchone(
         """
-        SELECT id, patient_id, doctor_id, status
+        SELECT id, patient_id, doctor_id, appointment_timestamp, status
         FROM appointments
         WHERE id = %s
         """,
@@ -354,7 +455,7 @@ def update_appointment_status_for(user, data: dict) -> int:
     
     # Update appointment atomically
     with transaction():
-        _, appointment_id = execute(
+        execute(
             """
             UPDATE appointments
             SET status = %s, notes = COALESCE(%s, notes)
@@ -362,6 +463,26 @@ def update_appointment_status_for(user, data: dict) -> int:
             """,
             (new_status, notes, appointment_id)
         )
+        # Hand the freed slot to the waitlist in the same transaction
+        backfill = None
+        if new_status in {"cancelled", "no_show"}:
+            backfill = backfill_slot(user, appointment)
+        # Completed, cancelled or no-show patients leave today's waiting queue
+        if appointment["appointment_timestamp"].date() == datetime.now().date():
+            queue_changed()
+
+    # A backfill booking reuses the same slot, so one invalidation covers both
+    invalidate_doctor_calendar(appointment["doctor_id"])
+
+    audit_log.record(
+        user.id, "appointment.status", "appointment", appointment_id,
+        {"from": current_status, "to": new_status}
+    )
+    if backfill:
+        audit_log.record(
+            user.id, f"waitlist.{backfill['action']}", "waitlist", backfill["entry_id"],
+            {"slot_of": appointment_id, "appointment_id": backfill["appointment_id"]}
+        )
     
     return appointment_id
 
@@ -0,0 +1,481 @@
+"""
+Appointment waitlist and cancellation backfill.
+
+Patients (or staff on their behalf) join the waitlist for a doctor or a
+specialization with an acceptable date range and a priority. When an
+appointment is cancelled or marked no_show, `backfill_slot` picks the
+best waiting entry for that doctor and day and, in the same transaction
+as the status change, either books the slot for it or offers it
+(`WAITLIST_BACKFILL = "book" | "offer" | "off"`).
+
+Candidate selection:
+- each clinic keeps an in-memory index of waiting entries: one heap per
+  (doctor, day) and per (specialization, day), ordered by
+  (-priority, created_at, id)
+- a cancellation peeks at two heaps: O(log n), no waitlist scan
+- the index is refreshed from rows whose `updated_at` moved since the
+  last refresh (joins, leaves, offers, bookings in any worker)
+- stale heap entries are dropped lazily; the chosen entry is re-checked
+  with `SELECT ... FOR UPDATE` before it is used
+"""
+
+import heapq
+import threading
+import time
+from datetime import date, datetime, timedelta
+
+from flask import current_app
+
+from app.db import after_commit, current_clinic, execute, fetchall, fetchone, transaction
+from app.audit.service import audit_log
+from app.auth.catalog import get_role_catalog
+from app.appointments.calendar import invalidate_doctor_calendar
+from app.users.directory import get_doctor, has_specialization
+
+_WAITLIST_COLUMNS = """
+    SELECT w.id, w.patient_id, w.doctor_id, w.specialization, w.earliest_date,
+        w.latest_date, w.priority, w.status, w.created_at, w.updated_at
+    FROM waitlist w
+"""
+
+# Transactions commit after their updated_at: re-read rows this recent
+_WATERMARK_LAG = timedelta(seconds=60)
+
+
+class WaitlistIndex:
+    """
+    In-memory priority index of waiting entries for one clinic shard.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._heaps = {}        # (kind, target, day) -> [(-priority, created_at, id, seq)]
+        self._live = {}         # entry id -> (row, seq)
+        self._seq = 0
+        self._watermark = None  # DB time of the last refresh
+        self._refreshed_at = 0.0
+        self._pruned_on = None
+
+    def refresh(self, min_interval: float = 0.0):
+        """Pick up waitlist changes committed since the last refresh."""
+        with self._lock:
+            if self._watermark is not None and time.monotonic() - self._refreshed_at < min_interval:
+                return
+            watermark = fetchone("SELECT NOW() AS now")["now"]
+            if self._watermark is None:
+                rows = fetchall(
+                    f"{_WAITLIST_COLUMNS} WHERE w.status = 'waiting' AND w.latest_date >= CURDATE()"
+                )
+            else:
+                rows = fetchall(
+                    f"{_WAITLIST_COLUMNS} WHERE w.updated_at >= %s",
+                    (self._watermark - _WATERMARK_LAG,)
+                )
+            for row in rows:
+                self._apply(row)
+            self._watermark = watermark
+            self._refreshed_at = time.monotonic()
+            if self._pruned_on != date.today():
+                self._prune(date.today())
+
+    def discard(self, entry_id: int):
+        """Forget an entry that is no longer waiting (its heap items go stale)."""
+        with self._lock:
+            self._live.pop(entry_id, None)
+
+    def best(self, doctor_id: int, specialization: str, day: date, limit: int = 5) -> list[dict]:
+        """
+        Return up to `limit` waiting entries that accept `doctor_id` (directly or
+        through its specialization) on `day`, best first. Entries stay indexed.
+        """
+        keys = [("doctor", doctor_id, day)]
+        if specialization:
+            keys.append(("spec", specialization.lower(), day))
+
+        with self._lock:
+            heaps = [self._heaps[key] for key in keys if key in self._heaps]
+            taken, result = [], []
+            while len(result) < limit:
+                heap = self._best_heap(heaps)
+                if heap is None:
+                    break
+                item = heapq.heappop(heap)
+                taken.append((heap, item))
+                result.append(self._live[item[2]][0])
+            for heap, item in taken:
+                heapq.heappush(heap, item)
+            return result
+
+    def _best_heap(self, heaps):
+        best = None
+        for heap in heaps:
+            # Drop stale tops: left the waitlist or re-indexed since
+            while heap and self._live.get(heap[0][2], (None, None))[1] != heap[0][3]:
+                heapq.heappop(heap)
+            if heap and (best is None or heap[0] < best[0]):
+                best = heap
+        return best
+
+    def _apply(self, row: dict):
+        live = self._live.get(row["id"])
+        if live and live[0] == row:
+            return  # re-read within the watermark lag, already indexed
+        self._live.pop(row["id"], None)
+        if row["status"] != "waiting":
+            return
+
+        self._seq += 1
+        self._live[row["id"]] = (row, self._seq)
+        item = (-row["priority"], row["created_at"], row["id"], self._seq)
+
+        day = max(row["earliest_date"], date.today())
+        while day <= row["latest_date"]:
+            if row["doctor_id"]:
+                heapq.heappush(self._heaps.setdefault(("doctor", row["doctor_id"], day), []), item)
+            else:
+                key = ("spec", row["specialization"].lower(), day)
+                heapq.heappush(self._heaps.setdefault(key, []), item)
+            day += timedelta(days=1)
+
+    def _prune(self, today: date):
+        for key in [key for key in self._heaps if key[2] < today]:
+            del self._heaps[key]
+        self._live = {
+            entry_id: entry for entry_id, entry in self._live.items()
+            if entry[0]["latest_date"] >= today
+        }
+        self._pruned_on = today
+
+
+_indexes = {}   # clinic -> WaitlistIndex
+_indexes_lock = threading.Lock()
+
+def get_waitlist_index() -> WaitlistIndex:
+    """Return the waitlist index of the current clinic, refreshed if it is due."""
+    clinic = current_clinic()
+    with _indexes_lock:
+        index = _indexes.get(clinic)
+        if index is None:
+            index = _indexes[clinic] = WaitlistIndex()
+    index.refresh(current_app.config["WAITLIST_REFRESH_INTERVAL"])
+    return index
+
+
+def backfill_slot(user, appointment: dict) -> dict:
+    """
+    Offer or book a freed slot for the best waitlist candidate.
+    Call inside the `transaction()` that cancels the appointment.
+
+    `appointment` must contain id, patient_id, doctor_id and appointment_timestamp.
+
+    Returns:
+        {"entry_id", "patient_id", "action", "appointment_id"} or None
+    """
+    mode = current_app.config["WAITLIST_BACKFILL"]
+    slot = appointment["appointment_timestamp"]
+    if mode not in {"book", "offer"} or slot <= datetime.now():
+        return None
+
+    doctor = get_doctor(appointment["doctor_id"])
+    index = get_waitlist_index()
+    candidates = index.best(
+        appointment["doctor_id"], doctor["specialization"] if doctor else None, slot.date()
+    )
+    if not candidates:
+        return None
+
+    # The slot may already have been given to someone else
+    taken = fetchone(
+        """
+        SELECT id FROM appointments
+        WHERE doctor_id = %s AND appointment_timestamp = %s
+            AND status IN ('requested', 'confirmed') AND deleted_at IS NULL
+        LIMIT 1
+        FOR UPDATE
+        """,
+        (appointment["doctor_id"], slot)
+    )
+    if taken:
+        return None
+
+    for candidate in candidates:
+        if candidate["patient_id"] == appointment["patient_id"]:
+            continue
+
+        # Re-check under a row lock: another worker may have used this entry
+        entry = fetchone(
+            "SELECT id, status FROM waitlist WHERE id = %s FOR UPDATE",
+            (candidate["id"],)
+        )
+        if not entry or entry["status"] != "waiting":
+            after_commit(lambda entry_id=candidate["id"]: index.discard(entry_id))
+            continue
+
+        appointment_id = None
+        if mode == "book":
+            _, appointment_id = execute(
+                """
+                INSERT INTO appointments (patient_id, doctor_id, appointment_timestamp, status, notes, created_by_staff)
+                VALUES (%s, %s, %s, 'confirmed', %s, %s)
+                """,
+                (candidate["patient_id"], appointment["doctor_id"], slot,
+                 "Booked from waitlist", user.id if user.has_permission("create_user") else None)
+            )
+            execute(
+                "UPDATE waitlist SET status = 'booked', appointment_id = %s WHERE id = %s",
+                (appointment_id, candidate["id"])
+            )
+        else:
+            execute(
+                """
+                UPDATE waitlist
+                SET status = 'offered', offered_doctor_id = %s, offered_timestamp = %s
+                WHERE id = %s
+                """,
+                (appointment["doctor_id"], slot, candidate["id"])
+            )
+        # Only once committed: a rollback leaves the entry waiting
+        after_commit(lambda entry_id=candidate["id"]: index.discard(entry_id))
+
+        return {
+            "entry_id": candidate["id"],
+            "patient_id": candidate["patient_id"],
+            "action": "booked" if mode == "book" else "offered",
+            "appointment_id": appointment_id,
+        }
+
+    return None
+
+
+def list_waitlist_for(user) -> list[dict]:
+    """
+    Return waitlist entries visible to the user, newest first.
+
+    Authorization:
+    - manage_appointments / clinic receptionist: all open entries
+    - patient: own entries
+    - others: empty list
+    """
+    query = f"""
+        SELECT w.id, w.patient_id, w.doctor_id, w.specialization, w.earliest_date,
+            w.latest_date, w.priority, w.status, w.offered_doctor_id, w.offered_timestamp,
+            w.appointment_id, w.created_at,
+            p.name AS patient_name, d.name AS doctor_name, od.name AS offered_doctor_name
+        FROM waitlist w
+        JOIN user_details p ON p.user_id = w.patient_id
+        LEFT JOIN user_details d ON d.user_id = w.doctor_id
+        LEFT JOIN user_details od ON od.user_id = w.offered_doctor_id
+    """
+    if user.has_permission("manage_appointments") or user.has_role("clinic_receptionist"):
+        return fetchall(
+            f"""
+            {query}
+            WHERE w.status IN ('waiting', 'offered') AND w.latest_date >= CURDATE()
+            ORDER BY w.priority DESC, w.created_at
+            """
+        )
+
+    if user.has_role("patient"):
+        return fetchall(
+            f"{query} WHERE w.patient_id = %s ORDER BY w.created_at DESC",
+            (user.id,)
+        )
+
+    return []
+
+
+def join_waitlist_for(user, data: dict) -> int:
+    """
+    Add a patient to the waitlist.
+
+    Authorization rules:
+    - patient: for themselves, default priority
+    - staff with `create_user`: for any patient (by username), with a priority
+
+    A patient may not hold two waiting/offered entries for the same doctor
+    or specialization with overlapping dates.
+
+    Raises:
+        ValueError if validation or authorization is invalid.
+
+    Returns:
+        waitlist_id(int)
+    """
+    doctor_id = data.get("doctor_id") or None
+    specialization = (data.get("specialization") or "").strip() or None
+    earliest = data.get("earliest_date")
+    latest = data.get("latest_date")
+
+    if not doctor_id and not specialization:
+        raise ValueError("Choose a doctor or a specialization")
+    if doctor_id and specialization:
+        raise ValueError("Choose either a doctor or a specialization, not both")
+
+    try:
+        earliest = datetime.strptime(earliest or "", "%Y-%m-%d").date()
+        latest = datetime.strptime(latest or "", "%Y-%m-%d").date()
+    except ValueError:
+        raise ValueError("Invalid date range")
+
+    max_days = current_app.config["WAITLIST_MAX_DAYS"]
+    if latest < earliest or latest < date.today():
+        raise ValueError("Invalid date range")
+    if (latest - earliest).days >= max_days:
+        raise ValueError(f"Date range can span at most {max_days} days")
+
+    if doctor_id:
+        try:
+            doctor_id = int(doctor_id)
+        except (TypeError, ValueError):
+            raise ValueError("Invalid doctor ID")
+        if not get_doctor(doctor_id):
+            raise ValueError("Selected doctor is not a valid doctor.")
+    elif not has_specialization(specialization):
+        raise ValueError("No doctor with this specialization")
+
+    # Patient resolution
+    priority = 0
+    if user.has_role("patient"):
+        patient_id = user.id
+    elif user.has_permission("create_user"):
+        row = fetchone(
+            """
+            SELECT u.id,
+                EXISTS (SELECT 1 FROM user_roles ur WHERE ur.user_id = u.id AND ur.role_id = %s) AS is_patient
+            FROM users u
+            WHERE u.user_name = %s
+            """,
+            (get_role_catalog().id_of("patient"), data.get("user_name"))
+        )
+        if not row:
+            raise ValueError("Patient not found")
+        if not row["is_patient"]:
+            raise ValueError("Selected patient is not a valid patient.")
+        patient_id = row["id"]
+        try:
+            priority = max(0, min(int(data.get("priority") or 0), 100))
+        except ValueError:
+            raise ValueError("Invalid priority")
+    else:
+        raise ValueError("User is not allowed to join the waitlist")
+
+    with transaction():
+        # Serializes joins of this patient, so two requests cannot both pass the check below
+        fetchone("SELECT id FROM users WHERE id = %s FOR UPDATE", (patient_id,))
+        overlapping = fetchone(
+            """
+            SELECT id FROM waitlist
+            WHERE patient_id = %s AND status IN ('waiting', 'offered')
+                AND doctor_id <=> %s AND specialization <=> %s
+                AND earliest_date <= %s AND latest_date >= %s
+            LIMIT 1
+            """,
+            (patient_id, doctor_id, specialization, latest, earliest)
+        )
+        if overlapping:
+            raise ValueError("Patient is already on the waitlist for these dates")
+
+        _, waitlist_id = execute(
+            """
+            INSERT INTO waitlist (patient_id, doctor_id, specialization, earliest_date, latest_date, priority)
+            VALUES (%s, %s, %s, %s, %s, %s)
+            """,
+            (patient_id, doctor_id, specialization, earliest, latest, priority)
+        )
+
+    return waitlist_id
+
+
+def respond_to_waitlist_for(user, data: dict) -> int:
+    """
+    Accept an offered slot, or leave the waitlist.
+
+    Authorization rules:
+    - patient: own entries
+    - manage_appointments / clinic receptionist: any entry
+
+    Behavior:
+    - accept: books the offered slot if it is still free; otherwise the
+      entry goes back to waiting
+    - leave: cancels the entry
+
+    Raises:
+        ValueError if authorization or the action is invalid.
+
+    Returns:
+        appointment_id(int) for accept, waitlist_id(int) for leave
+    """
+    action = data.get("action")
+    try:
+        waitlist_id = int(data.get("waitlist_id"))
+    except (TypeError, ValueError):
+        raise ValueError("Invalid waitlist entry")
+    if action not in {"accept", "leave"}:
+        raise ValueError("Invalid waitlist action")
+
+    staff = user.has_permission("manage_appointments") or user.has_role("clinic_receptionist")
+
+    with transaction():
+        entry = fetchone(
+            """
+            SELECT id, patient_id, status, offered_doctor_id, offered_timestamp
+            FROM waitlist WHERE id = %s FOR UPDATE
+            """,
+            (waitlist_id,)
+        )
+        if not entry:
+            raise ValueError("Waitlist entry not found")
+        if not staff and not (user.has_role("patient") and entry["patient_id"] == user.id):
+            raise ValueError("User is not allowed to update this waitlist entry")
+
+        if action == "leave":
+            if entry["status"] not in {"waiting", "offered"}:
+                raise ValueError("Waitlist entry is already closed")
+            execute("UPDATE waitlist SET status = 'cancelled' WHERE id = %s", (waitlist_id,))
+            result_id = waitlist_id
+
+        else:
+            if entry["status"] != "offered":
+                raise ValueError("There is no open offer for this entry")
+            taken = fetchone(
+                """
+                SELECT id FROM appointments
+                WHERE doctor_id = %s AND appointment_timestamp = %s
+                    AND status IN ('requested', 'confirmed') AND deleted_at IS NULL
+                LIMIT 1
+                FOR UPDATE
+                """,
+                (entry["offered_doctor_id"], entry["offered_timestamp"])
+            )
+            if taken or entry["offered_timestamp"] <= datetime.now():
+                execute(
+                    """
+                    UPDATE waitlist
+                    SET status = 'waiting', offered_doctor_id = NULL, offered_timestamp = NULL
+                    WHERE id = %s
+                    """,
+                    (waitlist_id,)
+                )
+                result_id = None
+            else:
+                _, result_id = execute(
+                    """
+                    INSERT INTO appointments (patient_id, doctor_id, appointment_timestamp, status, notes, created_by_staff)
+                    VALUES (%s, %s, %s, 'confirmed', %s, %s)
+                    """,
+                    (entry["patient_id"], entry["offered_doctor_id"], entry["offered_timestamp"],
+                     "Booked from waitlist", user.id if staff else None)
+                )
+                execute(
+                    "UPDATE waitlist SET status = 'booked', appointment_id = %s WHERE id = %s",
+                    (result_id, waitlist_id)
+                )
+
+    if result_id is None:
+        raise ValueError("The offered slot is no longer available; you are back on the waitlist")
+
+    if action == "accept":
+        invalidate_doctor_calendar(entry["offered_doctor_id"])
+
+    audit_log.record(user.id, f"waitlist.{action}", "waitlist", waitlist_id)
+    return result_id
@@ -0,0 +1,16 @@
+from flask import render_template, request
+from flask_login import login_required, current_user
+from . import bp
+from app.utils.permissions import permissions_required
+from .service import audit_log, list_audit_events_for
+
+@bp.route("/", methods=["GET"])
+@login_required
+@permissions_required("manage_users")
+def list_events():
+    """
+    Audit trail of appointment status and role changes.
+    Events still queued for the background writer appear after the next flush.
+    """
+    data = list_audit_events_for(current_user, request.args)
+    return render_template("audit/list.html", stats=audit_log.stats(), filters=request.args, **data)
\ No newline at end of file
@@ -0,0 +1,194 @@
+"""
+Audit domain service.
+
+Records who changed which appointment status or role without adding
+a synchronous INSERT to those write paths:
+- services call `audit_log.record(...)` after their transaction commits
+- events go onto a bounded in-process queue
+- a background writer bulk-inserts them in batches
+
+Durability:
+- the queue is drained completely at interpreter shutdown (atexit)
+- failed batches are kept and retried on the next flush (at-least-once)
+- when the queue is full the caller waits briefly for the writer, then
+  writes its own event synchronously rather than dropping it
+
+Backpressure is visible through `audit_log.stats()`.
+"""
+
+import json
+import queue
+import threading
+from collections import deque
+from datetime import datetime
+
+from app.db import current_clinic, executemany, fetchall, transaction, use_clinic
+from app.utils.write_behind import BackgroundFlusher
+
+
+class AuditLog(BackgroundFlusher):
+    name = "audit-writer"
+
+    def __init__(self):
+        super().__init__()
+        self.batch_size = 500
+        self.enqueue_timeout = 0.05
+        self._queue = None
+        self._retry = deque()
+        self._stats_lock = threading.Lock()
+        self._stats = {
+            "enqueued": 0,
+            "written": 0,
+            "sync_writes": 0,
+            "failed_batches": 0,
+            "high_water": 0,
+        }
+
+    def init_app(self, app):
+        config = app.config
+        self.batch_size = config["AUDIT_BATCH_SIZE"]
+        self.enqueue_timeout = config["AUDIT_ENQUEUE_TIMEOUT"]
+        self._queue = queue.Queue(maxsize=config["AUDIT_QUEUE_SIZE"])
+        super().init_app(app, config["AUDIT_FLUSH_INTERVAL"])
+
+    def record(self, actor_id, action: str, entity: str, entity_id: int, details: dict = None):
+        """
+        Enqueue an audit event. Call after the audited change has committed.
+
+        Usage:
+            audit_log.record(user.id, "appointment.status", "appointment", 42, {"from": "requested", "to": "confirmed"})
+        """
+        event = (
+            current_clinic(),
+            actor_id, action, entity, int(entity_id),
+            json.dumps(details) if details is not None else None,
+            datetime.now(),
+        )
+
+        if self._queue is None:
+            return
+
+        self._ensure_thread()
+        try:
+            self._queue.put_nowait(event)
+        except queue.Full:
+            # Backpressure: let the writer catch up, then fall back to a direct write
+            self.wake()
+            try:
+                self._queue.put(event, timeout=self.enqueue_timeout)
+            except queue.Full:
+                self._insert([event])
+                self._count("sync_writes")
+                return
+
+        depth = self._queue.qsize()
+        with self._stats_lock:
+            self._stats["enqueued"] += 1
+            self._stats["high_water"] = max(self._stats["high_water"], depth)
+        if depth >= self.batch_size:
+            self.wake()
+
+    def stats(self) -> dict:
+        """Queue depth and counters for monitoring backpressure."""
+        with self._stats_lock:
+            stats = dict(self._stats)
+        stats["depth"] = self._queue.qsize() if self._queue is not None else 0
+        stats["pending_retry"] = len(self._retry)
+        return stats
+
+    def _drain(self):
+        batch = []
+        while self._retry and len(batch) < self.batch_size:
+            batch.append(self._retry.popleft())
+        while len(batch) < self.batch_size:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _write(self, batch):
+        self._insert(batch)
+        with self._stats_lock:
+            self._stats["written"] += len(batch)
+
+    def _restore(self, batch):
+        self._count("failed_batches")
+        self._retry.extendleft(reversed(batch))
+
+    def _insert(self, events):
+        # Each event is written to the clinic shard it happened in
+        by_clinic = {}
+        for clinic, *event in events:
+            by_clinic.setdefault(clinic, []).append(event)
+
+        for clinic, rows in by_clinic.items():
+            with use_clinic(clinic), transaction():
+                executemany(
+                    """
+                    INSERT INTO audit_log (actor_id, action, entity, entity_id, details, created_at)
+                    VALUES (%s, %s, %s, %s, %s, %s)
+                    """,
+                    rows
+                )
+
+    def _count(self, key):
+        with self._stats_lock:
+            self._stats[key] += 1
+
+
+audit_log = AuditLog()
+
+
+def list_audit_events_for(user, data: dict) -> dict:
+    """
+    Return audit events, newest first, one page at a time.
+
+    Authorization:
+    - manage_users: full view
+    - others: empty list
+
+    Filters (all optional): entity, entity_id, actor_id, before_id (keyset cursor).
+    """
+    if not user.has_permission("manage_users"):
+        return {"events": [], "next_before_id": None}
+
+    page_size = 100
+    conditions = []
+    parameters = []
+
+    entity = data.get("entity")
+    if entity:
+        conditions.append("l.entity = %s")
+        parameters.append(entity)
+        entity_id = data.get("entity_id")
+        if entity_id and str(entity_id).isdigit():
+            conditions.append("l.entity_id = %s")
+            parameters.append(int(entity_id))
+
+    actor_id = data.get("actor_id")
+    if actor_id and str(actor_id).isdigit():
+        conditions.append("l.actor_id = %s")
+        parameters.append(int(actor_id))
+
+    before_id = data.get("before_id")
+    if before_id and str(before_id).isdigit():
+        conditions.append("l.id < %s")
+        parameters.append(int(before_id))
+
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+    events = fetchall(
+        f"""
+        SELECT l.id, l.actor_id, u.user_name AS actor_name, l.action,
+            l.entity, l.entity_id, l.details, l.created_at
+        FROM audit_log l
+        LEFT JOIN users u ON u.id = l.actor_id
+        {where}
+        ORDER BY l.id DESC
+        LIMIT %s
+        """,
+        (*parameters, page_size)
+    )
+
+    next_before_id = events[-1]["id"] if len(events) == page_size else None
+    return {"events": events, "next_before_id": next_before_id}
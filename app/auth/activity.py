@@ -0,0 +1,54 @@
+"""
+Login activity (`users.last_login`, `users.login_count`).
+
+Successful logins are buffered in a write-behind buffer instead of
+updating the user's row on the login path. Logins of the same user are
+merged (latest time, summed count), and every flush writes up to
+`_CHUNK` users with one multi-row UPDATE per clinic, every
+`LOGIN_ACTIVITY_FLUSH_INTERVAL` seconds and at shutdown. The user
+administration list therefore trails real logins by at most that interval.
+
+Usage:
+    record_login_activity(row["id"])
+"""
+
+from datetime import datetime
+
+from app.db import execute
+from app.utils.write_behind import WriteBehind
+
+# Users per UPDATE statement
+_CHUNK = 500
+
+
+def _merge_activity(old: tuple, new: tuple) -> tuple:
+    return max(old[0], new[0]), old[1] + new[1]
+
+def _persist_activity(batch: dict):
+    """Write buffered {user_id: (last_login, logins)} to `users`."""
+    # Sorted ids: concurrent flushes from several workers lock rows in the same order
+    items = sorted(batch.items())
+    for start in range(0, len(items), _CHUNK):
+        chunk = items[start:start + _CHUNK]
+        # Another worker may already have written a later login
+        last_login = " ".join(
+            ["WHEN %s THEN IF(last_login IS NULL OR last_login < %s, %s, last_login)"] * len(chunk)
+        )
+        login_count = " ".join(["WHEN %s THEN %s"] * len(chunk))
+        execute(
+            f"""
+            UPDATE users
+            SET last_login = CASE id {last_login} END,
+                login_count = login_count + CASE id {login_count} END
+            WHERE id IN ({", ".join(["%s"] * len(chunk))})
+            """,
+            [value for user_id, (at, _) in chunk for value in (user_id, at, at)]
+            + [value for user_id, (_, logins) in chunk for value in (user_id, logins)]
+            + [user_id for user_id, _ in chunk]
+        )
+
+login_activity = WriteBehind(_persist_activity, merge=_merge_activity, name="activity-writer")
+
+def record_login_activity(user_id: int):
+    """Buffer one successful login of `user_id` (no query on the login path)."""
+    login_activity.put(user_id, (datetime.now().replace(microsecond=0), 1))
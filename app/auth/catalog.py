@@ -0,0 +1,86 @@
+"""
+Role catalog.
+
+Roles, permissions and their mapping are seeded by SQL and are not
+editable at runtime, so each process builds them once per clinic shard
+(every shard is its own database, so role ids may differ) and resolves
+role ids to names and permissions from memory. The rows are loaded with a
+single query and kept in the shared cache, so other workers build from
+there; `reset_role_catalog` makes every worker rebuild.
+"""
+
+import threading
+
+from app.db import current_clinic, fetchall
+from app.utils.shared_cache import shared_cache
+
+
+class RoleCatalog:
+    def __init__(self, rows: list[dict]):
+        self.names = {}          # role_id -> role name
+        self.ids = {}            # role name -> role_id
+        self.permissions = {}    # role_id -> set of permission names
+
+        for row in rows:
+            role_id = row["role_id"]
+            self.names[role_id] = row["role_name"]
+            self.ids[row["role_name"]] = role_id
+            perms = self.permissions.setdefault(role_id, set())
+            if row["permission_name"]:
+                perms.add(row["permission_name"])
+
+    def id_of(self, role_name: str):
+        return self.ids.get(role_name)
+
+    def roles_for(self, role_ids) -> list[str]:
+        return sorted(self.names[r] for r in role_ids if r in self.names)
+
+    def permissions_for(self, role_ids) -> list[str]:
+        perms = set()
+        for role_id in role_ids:
+            perms |= self.permissions.get(role_id, set())
+        return sorted(perms)
+
+    def role_names(self) -> list[str]:
+        return sorted(self.ids)
+
+
+CATALOG = "rbac"
+
+_catalogs = {}      # clinic -> (shared-cache generation, RoleCatalog)
+_catalog_lock = threading.Lock()
+
+def get_role_catalog() -> RoleCatalog:
+    """
+    Return the role catalog of the current clinic shard, loading it on first
+    use and again after `reset_role_catalog` (in any process).
+    Must be called inside an app context.
+    """
+    clinic = current_clinic()
+    namespace = f"{CATALOG}:{clinic}"
+    generation = shared_cache.generation(namespace)
+    cached = _catalogs.get(clinic)
+    if cached is None or cached[0] != generation:
+        with _catalog_lock:
+            cached = _catalogs.get(clinic)
+            if cached is None or cached[0] != generation:
+                rows = shared_cache.get(namespace, "rows")
+                if rows is None:
+                    rows = fetchall(
+                        """
+                        SELECT r.id AS role_id, r.name AS role_name, p.name AS permission_name
+                        FROM roles r
+                        LEFT JOIN role_permissions rp ON rp.role_id = r.id
+                        LEFT JOIN permissions p ON p.id = rp.permission_id
+                        ORDER BY r.id
+                        """
+                    )
+                    shared_cache.set(namespace, "rows", rows)
+                cached = _catalogs[clinic] = (generation, RoleCatalog(rows))
+    return cached[1]
+
+def reset_role_catalog():
+    """Drop the current clinic's cached catalog in every process (e.g. after re-seeding roles)."""
+    clinic = current_clinic()
+    _catalogs.pop(clinic, None)
+    shared_cache.invalidate(f"{CATALOG}:{clinic}")
@@ -0,0 +1,123 @@
+"""
+Signed session principal.
+
+At login the session receives a compact signed principal:
+    [user_id, user_name, email, role_ids, auth_version, clinic]
+
+`load_user` rebuilds the `User` from it and the in-memory role catalog
+instead of querying users/roles/permissions on every request. The
+principal is only valid on the clinic shard it was issued for.
+
+Revocation:
+- `users.auth_version` is bumped whenever a user's roles change or the
+  account is deactivated (see `bump_auth_version`).
+- The principal is only trusted while its version matches the current
+  one. Versions are kept in the shared cache for `PRINCIPAL_VERSION_TTL`
+  seconds and dropped there when the change commits, so with a shared
+  backend every worker sees a revocation at once (the TTL only bounds a
+  refill racing the commit). With the in-process backend other workers
+  see it within the TTL.
+"""
+
+from flask import current_app, session
+from itsdangerous import BadSignature, URLSafeSerializer
+
+from app.auth.catalog import get_role_catalog
+from app.auth.models import User
+from app.db import after_commit, current_clinic, execute, fetchall, fetchone
+from app.utils.shared_cache import shared_cache
+
+SESSION_KEY = "principal"
+
+# "<clinic>:<user_id>" -> [auth_version or None if inactive]
+VERSIONS = "auth_version"
+
+
+def _serializer() -> URLSafeSerializer:
+    return URLSafeSerializer(current_app.config["SECRET_KEY"], salt="session-principal")
+
+def store_principal(row: dict, role_ids: list = None):
+    """
+    Embed a signed principal for the user in `row` into the session.
+    `row` must contain id, user_name, email and auth_version.
+    """
+    if not current_app.config["SESSION_PRINCIPAL"]:
+        return
+
+    if role_ids is None:
+        role_ids = [r["role_id"] for r in fetchall(
+            "SELECT role_id FROM user_roles WHERE user_id = %s", (row["id"],)
+        )]
+
+    session[SESSION_KEY] = _serializer().dumps(
+        [row["id"], row["user_name"], row["email"], sorted(role_ids), row["auth_version"], current_clinic()]
+    )
+    _remember_version(row["id"], row["auth_version"])
+
+def clear_principal():
+    session.pop(SESSION_KEY, None)
+
+def load_principal(user_id) -> User:
+    """
+    Rebuild the user from the session principal.
+    Returns None if there is no valid, current principal for `user_id`.
+    """
+    token = session.get(SESSION_KEY)
+    if not token:
+        return None
+
+    try:
+        uid, user_name, email, role_ids, version, clinic = _serializer().loads(token)
+    except (BadSignature, ValueError, TypeError):
+        clear_principal()
+        return None
+
+    # User ids are per shard: the same id on another clinic is another person
+    if clinic != current_clinic() or str(uid) != str(user_id) or current_auth_version(uid) != version:
+        clear_principal()
+        return None
+
+    catalog = get_role_catalog()
+    row = {"id": uid, "user_name": user_name, "email": email}
+    return User.from_row(row, catalog.roles_for(role_ids), catalog.permissions_for(role_ids))
+
+def current_auth_version(user_id: int):
+    """
+    Return the user's auth_version (None if inactive), kept in the shared
+    cache for `PRINCIPAL_VERSION_TTL` seconds.
+    """
+    cached = shared_cache.get(VERSIONS, _version_key(user_id))
+    if cached is not None:
+        return cached[0]
+
+    row = fetchone(
+        "SELECT auth_version FROM users WHERE id = %s AND is_active = 1",
+        (user_id,)
+    )
+    version = row["auth_version"] if row else None
+    _remember_version(user_id, version)
+    return version
+
+def bump_auth_version(*user_ids):
+    """
+    Invalidate session principals of the given users.
+    Call inside the same `transaction()` as the role or activation change;
+    cached versions are dropped in every worker once it commits.
+    """
+    if not user_ids:
+        return
+    placeholders = ", ".join(["%s"] * len(user_ids))
+    execute(
+        f"UPDATE users SET auth_version = auth_version + 1 WHERE id IN ({placeholders})",
+        tuple(int(u) for u in user_ids)
+    )
+    keys = [_version_key(user_id) for user_id in user_ids]
+    after_commit(lambda: shared_cache.delete(VERSIONS, *keys))
+
+def _version_key(user_id) -> str:
+    return f"{current_clinic()}:{int(user_id)}"
+
+def _remember_version(user_id: int, version):
+    shared_cache.set(
+        VERSIONS, _version_key(user_id), [version], ttl=current_app.config["PRINCIPAL_VERSION_TTL"]
+    )
@@ -1,9 +1,13 @@
-from flask import flash, redirect, render_template, request, url_for
+from flask import flash, g, redirect, render_template, request, session, url_for
 from flask_login import login_user, logout_user, login_required, current_user
 from werkzeug.security import generate_password_hash, check_password_hash
 from . import bp
 from app.db import fetchone, execute, transaction
 from app.auth.models import User
+from app.auth.activity import record_login_activity
+from app.auth.principal import store_principal, clear_principal
+from app.auth.throttle import login_throttle
+from app.utils.metrics import record_login
 from app.utils.navigation import landing_for_user
 
 @bp.route("/login", methods=["GET", "POST"])
@@ -24,23 +28,46 @@ def login():
         flash("Must provide username and password")
         return render_template("auth/login.html")
     
+    # Throttle bursts before touching the DB or the password hash
+    retry_after = login_throttle.check(user_name, request.remote_addr)
+    if retry_after:
+        record_login("throttled")
+        flash(f"Too many login attempts. Try again in {retry_after} seconds.")
+        return render_template("auth/login.html"), 429
+
     # Check valid username and password
     row = fetchone(
     """
-    SELECT id, user_name, email, password_hash
+    SELECT id, user_name, email, password_hash, failed_logins, locked_until, auth_version
     FROM users
     WHERE user_name = %s AND is_active = 1
     """,
     (user_name,)
 )
 
+    # Lockout persisted by another worker or before a restart
+    if row:
+        retry_after = login_throttle.locked_in_db(user_name, row)
+        if retry_after:
+            record_login("locked")
+            flash(f"Too many login attempts. Try again in {retry_after} seconds.")
+            return render_template("auth/login.html"), 429
+
     if not row or not check_password_hash(row["password_hash"], password):
+        login_throttle.record_failure(user_name, row)
+        record_login("failure")
         flash("Incorrect username or password")
         return render_template("auth/login.html")
-    
+
+    login_throttle.record_success(user_name, row)
+    record_login_activity(row["id"])
+    record_login("success")
+
     # Create user session
     user = User.from_row(row)
     login_user(user)
+    session["clinic"] = g.clinic
+    store_principal(row)
 
     # Redirect user to landing page
     flash("Logged in successfully!")
@@ -63,6 +90,8 @@ def logout():
     """Log user out"""
 
     logout_user()
+    clear_principal()
+    session.pop("clinic", None)
     flash("Logged out")
     return redirect(url_for("main.index"))
 
@@ -0,0 +1,193 @@
+"""
+Login throttling.
+
+Rejects login bursts before they reach MySQL or the password KDF:
+- token bucket per client IP and per username
+- lockout after `MAX_FAILED_LOGINS` consecutive failures for `LOCKOUT_DURATION`
+
+Throttle state lives in a backend (in-process by default). A shared
+backend can be plugged in with `THROTTLE_BACKEND = "package.module:Class"`
+so every worker sees the same buckets and lockouts.
+
+Lockout state of known users is persisted to `users.failed_logins` and
+`users.locked_until` through a write-behind buffer, so failed attempts
+never add a synchronous UPDATE to the login path.
+"""
+
+import threading
+import time
+from datetime import datetime
+from importlib import import_module
+
+from app.db import current_clinic, executemany
+from app.utils.write_behind import WriteBehind
+
+
+class MemoryThrottleBackend:
+    """
+    In-process throttle state.
+
+    Backend interface (implemented by shared backends too):
+    - take(key, capacity, rate) -> float: consume one token, return 0 or seconds to wait
+    - get(key) / set(key, value, ttl) / delete(key): small expiring values
+    """
+
+    def __init__(self, app=None):
+        self._lock = threading.Lock()
+        self._buckets = {}
+        self._values = {}
+
+    def take(self, key: str, capacity: float, rate: float) -> float:
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated = self._buckets.get(key, (capacity, now))
+            tokens = min(capacity, tokens + (now - updated) * rate)
+            if tokens < 1:
+                self._buckets[key] = (tokens, now)
+                return (1 - tokens) / rate
+            self._buckets[key] = (tokens - 1, now)
+
+            # Full buckets carry no information
+            if len(self._buckets) > 100_000:
+                self._prune(now, capacity, rate)
+            return 0.0
+
+    def get(self, key: str):
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                return None
+            value, expires = entry
+            if expires <= time.monotonic():
+                del self._values[key]
+                return None
+            return value
+
+    def set(self, key: str, value, ttl: float):
+        with self._lock:
+            self._values[key] = (value, time.monotonic() + ttl)
+
+    def delete(self, key: str):
+        with self._lock:
+            self._values.pop(key, None)
+
+    def _prune(self, now, capacity, rate):
+        self._buckets = {
+            k: (tokens, updated) for k, (tokens, updated) in self._buckets.items()
+            if tokens + (now - updated) * rate < capacity
+        }
+        self._values = {k: v for k, v in self._values.items() if v[1] > now}
+
+
+def _persist_lockouts(batch: dict):
+    """Write buffered {user_id: (failed_logins, locked_until)} to `users`."""
+    executemany(
+        """
+        UPDATE users
+        SET failed_logins = %s, locked_until = %s
+        WHERE id = %s
+        """,
+        [(failed, locked_until, user_id) for user_id, (failed, locked_until) in batch.items()]
+    )
+
+
+def _user_key(user_name: str) -> str:
+    # Usernames are unique per clinic shard
+    return f"{current_clinic()}:{user_name.lower()}"
+
+
+class LoginThrottle:
+    """
+    Pre-authentication throttle for `/auth/login`.
+
+    Usage:
+        retry_after = login_throttle.check(user_name, ip)
+        ...
+        login_throttle.record_failure(user_name, row)
+        login_throttle.record_success(user_name, row)
+    """
+
+    def __init__(self):
+        self.backend = None
+        self.persist = WriteBehind(_persist_lockouts, name="lockout-writer")
+
+    def init_app(self, app):
+        config = app.config
+        self.max_failures = config["MAX_FAILED_LOGINS"]
+        self.lockout = config["LOCKOUT_DURATION"]
+        self.ip_burst = config["LOGIN_IP_BURST"]
+        self.ip_rate = config["LOGIN_IP_RATE"]
+        self.user_burst = config["LOGIN_USER_BURST"]
+        self.user_rate = config["LOGIN_USER_RATE"]
+
+        backend = config.get("THROTTLE_BACKEND")
+        if backend:
+            module_name, _, class_name = backend.partition(":")
+            self.backend = getattr(import_module(module_name), class_name)(app)
+        else:
+            self.backend = MemoryThrottleBackend(app)
+
+        self.persist.init_app(app, config["LOCKOUT_FLUSH_INTERVAL"])
+
+    def check(self, user_name: str, ip: str) -> int:
+        """
+        Consume one attempt for this IP and username.
+        Returns 0 if the attempt may proceed, otherwise seconds to wait.
+        """
+        user_key = _user_key(user_name)
+
+        locked_for = self.backend.get(f"lock:{user_key}")
+        if locked_for:
+            return max(1, int(locked_for - time.time()))
+
+        wait = self.backend.take(f"ip:{ip}", self.ip_burst, self.ip_rate)
+        if not wait:
+            wait = self.backend.take(f"user:{user_key}", self.user_burst, self.user_rate)
+        return int(wait) + 1 if wait else 0
+
+    def locked_in_db(self, user_name: str, row: dict) -> int:
+        """
+        Honour a lockout persisted by another process or before a restart.
+        Returns seconds remaining, or 0.
+        """
+        locked_until = row.get("locked_until")
+        if not locked_until:
+            return 0
+        remaining = (locked_until - datetime.now()).total_seconds()
+        if remaining <= 0:
+            return 0
+        self.backend.set(f"lock:{_user_key(user_name)}", time.time() + remaining, remaining)
+        return int(remaining) + 1
+
+    def record_failure(self, user_name: str, row: dict = None):
+        """Count a failed attempt; lock the username once the limit is reached."""
+        user_key = _user_key(user_name)
+        ttl = self.lockout.total_seconds()
+
+        failures = self.backend.get(f"fail:{user_key}")
+        if failures is None:
+            # Resume a count persisted before a restart (but not a spent lockout)
+            failures = (row or {}).get("failed_logins") or 0
+            if failures >= self.max_failures:
+                failures = 0
+        failures += 1
+
+        locked_until = None
+        if failures >= self.max_failures:
+            self.backend.set(f"lock:{user_key}", time.time() + ttl, ttl)
+            self.backend.delete(f"fail:{user_key}")
+            locked_until = datetime.now() + self.lockout
+        else:
+            self.backend.set(f"fail:{user_key}", failures, ttl)
+
+        if row:
+            self.persist.put(row["id"], (failures, locked_until))
+
+    def record_success(self, user_name: str, row: dict):
+        """Reset failure state; only touches the DB if there was something to reset."""
+        self.backend.delete(f"fail:{_user_key(user_name)}")
+        if row.get("failed_logins") or row.get("locked_until"):
+            self.persist.put(row["id"], (0, None))
+
+
+login_throttle = LoginThrottle()
@@ -0,0 +1,194 @@
+"""
+Flask CLI commands.
+
+Commands import their services lazily so `flask --help` and other
+short-lived CLI processes stay cheap.
+
+Usage:
+    flask seed
+    flask purge-idempotency-keys
+    flask appointments archive --horizon-days 365
+    flask appointments export --from 2025-01-01 --to 2025-12-31 --format csv
+    flask appointments reminders
+    flask appointments explain
+    flask profiles report users.list_users
+    flask users import patients.csv --staff admin
+"""
+
+import click
+from flask.cli import AppGroup
+
+appointments_cli = AppGroup("appointments", help="Appointment maintenance commands.")
+
+
+@appointments_cli.command("archive")
+@click.option("--horizon-days", type=int, default=None, help="Archive finalized appointments older than this.")
+@click.option("--batch-size", type=int, default=None, help="Rows moved per transaction.")
+@click.option("--max-batches", type=int, default=None, help="Stop after this many batches.")
+@click.option("--pause", type=float, default=0.0, help="Seconds to sleep between batches.")
+@click.option("--clinic", "clinics", multiple=True, help="Clinic shard(s) to archive (default: all).")
+def archive_command(horizon_days, batch_size, max_batches, pause, clinics):
+    """Move old finalized appointments into the archive table."""
+    from app.appointments.archive import archive_appointments
+    from app.db import use_clinic
+
+    for clinic in _clinics(clinics):
+        with use_clinic(clinic):
+            archived = archive_appointments(horizon_days, batch_size, max_batches, pause)
+        click.echo(f"[{clinic}] Archived {archived} appointments")
+
+
+@appointments_cli.command("export")
+@click.option("--from", "date_from", required=True, help="First day, YYYY-MM-DD.")
+@click.option("--to", "date_to", required=True, help="Last day (inclusive), YYYY-MM-DD.")
+@click.option("--format", "export_format", type=click.Choice(["csv", "ndjson"]), default="csv")
+@click.option("--output", type=click.File("w", encoding="utf-8"), default="-", help="Output file (default stdout).")
+@click.option("--clinic", default=None, help="Clinic shard to export (default: DEFAULT_CLINIC).")
+def export_command(date_from, date_to, export_format, output, clinic):
+    """Stream appointments with doctor/patient names and fees for reporting."""
+    from app.appointments.export import export_rows, parse_export_range, to_csv, to_ndjson
+    from app.db import use_clinic
+
+    try:
+        start, end = parse_export_range(date_from, date_to)
+    except ValueError as e:
+        raise click.BadParameter(str(e))
+
+    with use_clinic(_clinics([clinic] if clinic else [])[0]):
+        rows = export_rows(start, end)
+        for chunk in (to_csv(rows) if export_format == "csv" else to_ndjson(rows)):
+            output.write(chunk)
+
+
+@appointments_cli.command("reminders")
+@click.option("--once", is_flag=True, help="Run a single scheduler tick and exit.")
+@click.option("--interval", type=float, default=None, help="Seconds between ticks.")
+@click.option("--clinic", "clinics", multiple=True, help="Clinic shard(s) to serve (default: all).")
+def reminders_command(once, interval, clinics):
+    """Dispatch reminders for upcoming confirmed appointments (run one instance)."""
+    from flask import current_app
+    from app.appointments.reminders import ReminderScheduler, run_schedulers
+
+    schedulers = [ReminderScheduler(current_app, clinic) for clinic in _clinics(clinics)]
+    if once:
+        for scheduler in schedulers:
+            sent = scheduler.tick()
+            click.echo(f"[{scheduler.clinic}] Sent {sent} reminders, {len(scheduler)} scheduled")
+        return
+
+    run_schedulers(schedulers, interval or current_app.config["REMINDER_POLL_INTERVAL"])
+
+
+@appointments_cli.command("explain")
+@click.option("--history", is_flag=True, help="Also check appointments_archive.")
+@click.option("--clinic", default=None, help="Clinic shard to check (default: DEFAULT_CLINIC).")
+def explain_command(history, clinic):
+    """EXPLAIN the listing SQL of every filter combination: its index, no filesort."""
+    from app.appointments.query import filter_combinations
+    from app.appointments.service import explain_listing
+    from app.db import use_clinic
+
+    failures = 0
+    with use_clinic(_clinics([clinic] if clinic else [])[0]):
+        for filters in filter_combinations():
+            label = "+".join(filters.equals) or "-"
+            if filters.start:
+                label += " (date range)"
+            for plan in explain_listing(filters, history):
+                source = plan["source"]
+                failures += not plan["ok"]
+                click.echo(
+                    f"{'ok  ' if plan['ok'] else 'FAIL'} {source:<21} {label:<55} "
+                    f"key={plan['key']} type={plan['type']} {plan['extra']}"
+                )
+    if failures:
+        raise click.ClickException(f"{failures} plan(s) do not use the expected index")
+
+
+@click.command("seed")
+@click.option("--clinic", "clinics", multiple=True, help="Clinic shard(s) to seed (default: all).")
+def seed_command(clinics):
+    """Seed the default admin (and dev data in development) into empty databases."""
+    from app.seed import seed_all_clinics
+
+    for clinic in seed_all_clinics(_clinics(clinics)):
+        click.echo(f"[{clinic}] Seed check complete")
+
+
+@click.command("purge-idempotency-keys")
+@click.option("--clinic", "clinics", multiple=True, help="Clinic shard(s) to purge (default: all).")
+def purge_idempotency_keys_command(clinics):
+    """Delete expired idempotency keys."""
+    from app.db import use_clinic
+    from app.utils.idempotency import purge_expired_keys
+
+    for clinic in _clinics(clinics):
+        with use_clinic(clinic):
+            deleted = purge_expired_keys()
+        click.echo(f"[{clinic}] Purged {deleted} expired idempotency keys")
+
+
+profiles_cli = AppGroup("profiles", help="Request profiles written by the profiling hook.")
+
+
+@profiles_cli.command("report")
+@click.argument("endpoint")
+@click.option("--top", type=int, default=25, help="Number of functions to list.")
+def profiles_report_command(endpoint, top):
+    """Merge the profiles of ENDPOINT (e.g. users.list_users) and print a JSON summary."""
+    import json
+    from app.utils.profiling import report
+
+    try:
+        click.echo(json.dumps(report(endpoint, top), indent=2))
+    except (OSError, ValueError) as e:
+        raise click.ClickException(str(e))
+
+
+users_cli = AppGroup("users", help="User account commands.")
+
+
+@users_cli.command("import")
+@click.argument("csv_file", type=click.File("r", encoding="utf-8-sig"))
+@click.option("--staff", required=True, help="User name recorded as created_by_staff.")
+@click.option("--clinic", default=None, help="Clinic shard to import into (default: DEFAULT_CLINIC).")
+def users_import_command(csv_file, staff, clinic):
+    """Create patient accounts from a CSV (name, user_name, email[, password])."""
+    from app.audit.service import audit_log
+    from app.db import fetchone, use_clinic
+    from app.users.bulk import provision_patients, read_provisioning_csv
+
+    with use_clinic(_clinics([clinic] if clinic else [])[0]):
+        staff_row = fetchone("SELECT id FROM users WHERE user_name = %s AND is_active = 1", (staff,))
+        if not staff_row:
+            raise click.BadParameter(f"Unknown user '{staff}'", param_hint="--staff")
+        try:
+            result = provision_patients(read_provisioning_csv(csv_file), staff_row["id"])
+        except ValueError as e:
+            raise click.ClickException(str(e))
+        audit_log.flush_all()
+
+    for line, user_name, reason in result["failed"]:
+        click.echo(f"line {line}: {user_name or '-'}: {reason}", err=True)
+    click.echo(f"Created {len(result['created'])} users, {len(result['failed'])} rows failed")
+
+
+def _clinics(requested) -> list[str]:
+    """Validate --clinic options; no option means every clinic (or the default for single-clinic commands)."""
+    from flask import current_app
+
+    shards = current_app.config["CLINIC_SHARDS"]
+    for clinic in requested:
+        if clinic not in shards:
+            raise click.BadParameter(f"Unknown clinic '{clinic}'", param_hint="--clinic")
+    if requested:
+        return list(requested)
+    return [current_app.config["DEFAULT_CLINIC"]] + [c for c in shards if c != current_app.config["DEFAULT_CLINIC"]]
+
+
+def register_cli(app):
+    app.cli.add_command(seed_command)
+    app.cli.add_command(purge_idempotency_keys_command)
+    app.cli.add_command(appointments_cli)
+    app.cli.add_command(profiles_cli)
+    app.cli.add_command(users_cli)
@@ -5,11 +5,44 @@ from dotenv import load_dotenv
 # Load .env file (so environment variables are ready.)
 load_dotenv()
 
+def parse_clinic_shards(value: str, defaults: dict) -> dict:
+    """
+    Parse CLINIC_SHARDS into {clinic: connection settings}.
+
+    Format: "code=database[@host[:port]],..." e.g. "main=clinicdb,north=clinic_north@10.0.0.7"
+    User and password are shared; missing host/port fall back to MYSQL_HOST/MYSQL_PORT.
+    Empty value: a single "default" clinic using MYSQL_DATABASE.
+    """
+    if not value:
+        return {"default": dict(defaults)}
+
+    shards = {}
+    for entry in value.split(","):
+        code, _, target = entry.strip().partition("=")
+        database, _, address = target.partition("@")
+        host, _, port = address.partition(":")
+        shards[code.strip()] = dict(
+            defaults,
+            database=database.strip(),
+            host=host or defaults["host"],
+            port=int(port) if port else defaults["port"],
+        )
+    return shards
+
 class Config:
     # Flask core settings
     SECRET_KEY = os.getenv("FLASK_SECRET")
     FLASK_ENV = os.getenv("FLASK_ENV", "development")
 
+    # Startup settings
+    SEED_ON_STARTUP = os.getenv("SEED_ON_STARTUP", "0") == "1"  # otherwise run `flask seed`
+    LAZY_BLUEPRINTS = os.getenv("LAZY_BLUEPRINTS", "0") == "1"
+
+    # Template caches
+    TEMPLATE_BYTECODE_CACHE = os.getenv("TEMPLATE_BYTECODE_CACHE", "1") == "1"
+    TEMPLATE_CACHE_DIR = os.getenv("TEMPLATE_CACHE_DIR")  # default: per-user temp dir
+    FRAGMENT_CACHE_SIZE = int(os.getenv("FRAGMENT_CACHE_SIZE", 20000))  # rendered rows, 0 disables
+
     # Session settings
     SESSION_COOKIE_HTTPONLY = True
     SESSION_COOKIE_SECURE = False
@@ -17,13 +50,104 @@ class Config:
     PERMANENT_SESSION_LIFETIME = timedelta(days=7)
     REMEMBER_COOKIE_DURATION = timedelta(days=30)
 
+    # Signed session principal: skip the per-request user/roles query
+    SESSION_PRINCIPAL = os.getenv("SESSION_PRINCIPAL", "1") == "1"
+    PRINCIPAL_VERSION_TTL = float(os.getenv("PRINCIPAL_VERSION_TTL", 5))  # seconds
+
     # Security settings
     MAX_FAILED_LOGINS = 5
     LOCKOUT_DURATION = timedelta(minutes=5)
 
+    # Login throttling (token buckets: burst size, tokens refilled per second)
+    LOGIN_IP_BURST = int(os.getenv("LOGIN_IP_BURST", 20))
+    LOGIN_IP_RATE = float(os.getenv("LOGIN_IP_RATE", 0.5))
+    LOGIN_USER_BURST = int(os.getenv("LOGIN_USER_BURST", 10))
+    LOGIN_USER_RATE = float(os.getenv("LOGIN_USER_RATE", 0.1))
+    THROTTLE_BACKEND = os.getenv("THROTTLE_BACKEND")  # "module:Class", default in-process
+    LOCKOUT_FLUSH_INTERVAL = float(os.getenv("LOCKOUT_FLUSH_INTERVAL", 5))
+    LOGIN_ACTIVITY_FLUSH_INTERVAL = float(os.getenv("LOGIN_ACTIVITY_FLUSH_INTERVAL", 5))  # last_login, login_count
+
     # --- Database settings ---
     MYSQL_HOST = os.getenv("MYSQL_HOST", "127.0.0.1")
     MYSQL_PORT = int(os.getenv("MYSQL_PORT", 3306))
     MYSQL_USER = os.getenv("MYSQL_USER", "clinic")
     MYSQL_PASSWORD = os.getenv("MYSQL_PASSWORD")
-    MYSQL_DATABASE = os.getenv("MYSQL_DATABASE", "clinicdb")
\ No newline at end of file
+    MYSQL_DATABASE = os.getenv("MYSQL_DATABASE", "clinicdb")
+    DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", 8))  # idle connections kept per clinic
+
+    # --- Clinic sharding ---
+    # Users and appointments of each clinic live in that clinic's database
+    CLINIC_SHARDS = parse_clinic_shards(os.getenv("CLINIC_SHARDS"), {
+        "host": MYSQL_HOST,
+        "port": MYSQL_PORT,
+        "user": MYSQL_USER,
+        "password": MYSQL_PASSWORD,
+        "database": MYSQL_DATABASE,
+    })
+    DEFAULT_CLINIC = os.getenv("DEFAULT_CLINIC", next(iter(CLINIC_SHARDS)))
+
+    # --- Idempotency keys (create endpoints) ---
+    IDEMPOTENCY_TTL = int(os.getenv("IDEMPOTENCY_TTL", 86400))  # seconds
+    IDEMPOTENCY_PENDING_TIMEOUT = int(os.getenv("IDEMPOTENCY_PENDING_TIMEOUT", 60))  # abandoned reservations
+
+    # --- User administration listing ---
+    USERS_PAGE_SIZE = int(os.getenv("USERS_PAGE_SIZE", 50))
+    USERS_COUNT_CAP = int(os.getenv("USERS_COUNT_CAP", 10000))  # filtered totals stop counting here
+    USERS_COUNT_TTL = float(os.getenv("USERS_COUNT_TTL", 30))  # seconds; dropped early when users or roles change
+
+    # --- Bulk patient provisioning (CSV upload / flask users import) ---
+    # Per upload; hashing ~0.1 s/password must fit in one request (WEB_TIMEOUT). The CLI has no limit.
+    BULK_IMPORT_MAX_ROWS = int(os.getenv("BULK_IMPORT_MAX_ROWS", 200))
+    BULK_IMPORT_CHUNK = int(os.getenv("BULK_IMPORT_CHUNK", 500))  # rows per transaction
+    BULK_HASH_WORKERS = int(os.getenv("BULK_HASH_WORKERS", 0))  # password hashing processes; 0 = CPU count
+
+    # --- Shared cache (principal versions, role catalog, doctor directory) ---
+    SHARED_CACHE_BACKEND = os.getenv("SHARED_CACHE_BACKEND")  # "module:Class"; default mmap file or in-process
+    SHARED_CACHE_PATH = os.getenv("SHARED_CACHE_PATH", "")  # mmap file shared by workers; empty = this process only
+    SHARED_CACHE_SLOTS = int(os.getenv("SHARED_CACHE_SLOTS", 16384))  # 512-byte entries
+    SHARED_CACHE_LARGE_SLOTS = int(os.getenv("SHARED_CACHE_LARGE_SLOTS", 64))  # 64 KiB entries
+    SHARED_CACHE_TTL = float(os.getenv("SHARED_CACHE_TTL", 300))  # seconds; doctor directory
+
+    # --- Waitlist backfill ---
+    WAITLIST_BACKFILL = os.getenv("WAITLIST_BACKFILL", "offer")  # "offer", "book" or "off"
+    WAITLIST_MAX_DAYS = int(os.getenv("WAITLIST_MAX_DAYS", 30))  # longest acceptable date range
+    WAITLIST_REFRESH_INTERVAL = float(os.getenv("WAITLIST_REFRESH_INTERVAL", 2))  # seconds
+
+    # --- Check-in queue (waiting-room display, doctor dashboard) ---
+    CHECKIN_REFRESH_INTERVAL = float(os.getenv("CHECKIN_REFRESH_INTERVAL", 30))  # seconds; fallback without a shared cache
+    CHECKIN_POLL_INTERVAL = int(os.getenv("CHECKIN_POLL_INTERVAL", 15))  # seconds between browser polls
+
+    # --- Doctor calendar ---
+    CALENDAR_CACHE_TTL = float(os.getenv("CALENDAR_CACHE_TTL", 300))  # seconds; fallback (e.g. availability edited in SQL)
+
+    # --- Profiling (X-Profile: 1 from manage_users, or sampled) ---
+    PROFILING_ENABLED = os.getenv("PROFILING_ENABLED", "0") == "1"
+    PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", 0))  # fraction of all requests
+    PROFILE_DIR = os.getenv("PROFILE_DIR", "profiles")
+
+    # --- Metrics (/metrics, Prometheus text format) ---
+    METRICS_ENABLED = os.getenv("METRICS_ENABLED", "1") == "1"
+    METRICS_TOKEN = os.getenv("METRICS_TOKEN", "")  # scrapers send "Authorization: Bearer <token>"; unset = admins only
+    METRICS_DIR = os.getenv("METRICS_DIR", "")  # per-worker snapshots; empty = this process only
+    METRICS_SNAPSHOT_INTERVAL = float(os.getenv("METRICS_SNAPSHOT_INTERVAL", 5))  # seconds
+
+    # --- Archival settings ---
+    ARCHIVE_HORIZON_DAYS = int(os.getenv("ARCHIVE_HORIZON_DAYS", 365))
+    ARCHIVE_BATCH_SIZE = int(os.getenv("ARCHIVE_BATCH_SIZE", 500))
+
+    # --- Analytics settings ---
+    ANALYTICS_WINDOW_DAYS = int(os.getenv("ANALYTICS_WINDOW_DAYS", 90))
+
+    # --- Audit log settings ---
+    AUDIT_QUEUE_SIZE = int(os.getenv("AUDIT_QUEUE_SIZE", 10000))
+    AUDIT_BATCH_SIZE = int(os.getenv("AUDIT_BATCH_SIZE", 500))
+    AUDIT_FLUSH_INTERVAL = float(os.getenv("AUDIT_FLUSH_INTERVAL", 2))
+    AUDIT_ENQUEUE_TIMEOUT = float(os.getenv("AUDIT_ENQUEUE_TIMEOUT", 0.05))  # seconds to wait when full
+
+    # --- Reminder settings ---
+    REMINDER_LEAD = timedelta(hours=int(os.getenv("REMINDER_LEAD_HOURS", 24)))
+    REMINDER_WINDOW = timedelta(hours=int(os.getenv("REMINDER_WINDOW_HOURS", 24)))  # loaded beyond the lead
+    REMINDER_BATCH_SIZE = int(os.getenv("REMINDER_BATCH_SIZE", 100))
+    REMINDER_POLL_INTERVAL = float(os.getenv("REMINDER_POLL_INTERVAL", 30))
+    REMINDER_NOTIFIER = os.getenv("REMINDER_NOTIFIER")  # "module:Class", default log notifier
+    REMINDER_LOG_FILE = os.getenv("REMINDER_LOG_FILE")
@@ -6,5 +6,3 @@ bp = Blueprint(
     template_folder="templates",
     url_prefix='/admin'
 )
-
-from . import routes
\ No newline at end of file
@@ -1,5 +1,5 @@
-from flask import render_template
-from flask_login import login_required
+from flask import current_app, render_template
+from flask_login import login_required, current_user
 from . import bp
 from app.utils.permissions import permissions_required
 
@@ -8,5 +8,10 @@ from app.utils.permissions import permissions_required
 @login_required
 @permissions_required('manage_users', 'manage_appointments', 'manage_doctors')
 def dashboard():
-    return render_template("admin/dashboard.html")
+    analytics = None
+    if current_user.has_permission("manage_appointments"):
+        from .analytics import get_daily_analytics
+        analytics = get_daily_analytics(current_app.config["ANALYTICS_WINDOW_DAYS"])
+
+    return render_template("admin/dashboard.html", analytics=analytics)
 
@@ -7,5 +7,3 @@ bp = Blueprint(
     url_prefix='/clinic_receptionist'
 
 )
-
-from . import routes
\ No newline at end of file
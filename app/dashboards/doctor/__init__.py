@@ -7,5 +7,3 @@ bp = Blueprint(
     url_prefix='/doctor'
     
 )
-
-from . import routes
\ No newline at end of file
@@ -1,5 +1,5 @@
-from flask import render_template
-from flask_login import login_required
+from flask import current_app, flash, redirect, render_template, request, url_for
+from flask_login import login_required, current_user
 from . import bp
 from app.utils.permissions import permissions_required
 
@@ -8,4 +8,33 @@ from app.utils.permissions import permissions_required
 @login_required
 @permissions_required('view_doctors')
 def dashboard():
-    return render_template("doctor/dashboard.html")
\ No newline at end of file
+    """Doctor workspace with today's waiting queue (polled from memory)."""
+    from app.appointments.checkin import waiting_queue_for
+
+    try:
+        queue = waiting_queue_for(current_user)
+    except ValueError:
+        queue = {"doctors": []}
+    return render_template(
+        "doctor/dashboard.html",
+        queue=queue,
+        poll_interval=current_app.config["CHECKIN_POLL_INTERVAL"]
+    )
+
+@bp.route('/calendar')
+@login_required
+@permissions_required('view_appointments')
+def calendar():
+    """
+    Week or month calendar of a doctor's slots and appointments.
+    Scope (own calendar vs. any doctor) is enforced in the service.
+    """
+    from app.appointments.calendar import get_doctor_calendar_for
+
+    try:
+        data = get_doctor_calendar_for(current_user, request.args)
+    except ValueError as e:
+        flash (str(e))
+        return redirect(url_for("appointments.list_appointments"))
+
+    return render_template("doctor/calendar.html", **data)
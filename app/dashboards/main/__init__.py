@@ -5,5 +5,3 @@ bp = Blueprint(
     __name__, 
     template_folder="templates"
     )
-
-from . import routes
\ No newline at end of file
@@ -1,45 +1,242 @@
+import heapq
+import os
+import threading
+import time
 import pymysql
-from pymysql.cursors import DictCursor
-from flask import current_app, g
+from pymysql.constants import SERVER_STATUS
+from pymysql.cursors import DictCursor, SSDictCursor
+from flask import current_app, g, has_app_context
 from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+from app.utils.metrics import observe_query, record_connection_opened, record_rollback
 
-def db_connect():
-    """ 
-    Establish a PyMySQL connection with MySQL db.
+# Per-clinic connection pools, rebuilt after fork (sockets must not be shared)
+_pools = {}
+_pools_pid = None
+_pools_lock = threading.Lock()
+
+class ConnectionPool:
     """
-    try:
-        connection = pymysql.connect(
-            host = current_app.config["MYSQL_HOST"],
-            port = current_app.config["MYSQL_PORT"],
-            user = current_app.config["MYSQL_USER"],
-            password = current_app.config["MYSQL_PASSWORD"],
-            database = current_app.config["MYSQL_DATABASE"],
-            charset = 'utf8mb4',
-            cursorclass = DictCursor
-        )
+    Small LIFO pool of PyMySQL connections for one clinic shard.
+
+    - acquire(): reuse an idle connection (pinged if it sat idle a while) or open one
+    - release(): end any open transaction/snapshot and keep up to `size` idle
+    """
+
+    def __init__(self, settings: dict, size: int, idle_check: float = 30.0, clinic: str = ""):
+        self.clinic = clinic
+        self.settings = settings
+        self.size = size
+        self.idle_check = idle_check
+        self._idle = []
+        self._lock = threading.Lock()
+        self.in_use = 0
+
+    def connect(self, cursorclass=DictCursor):
+        try:
+            connection = pymysql.connect(
+                host = self.settings["host"],
+                port = self.settings["port"],
+                user = self.settings["user"],
+                password = self.settings["password"],
+                database = self.settings["database"],
+                charset = 'utf8mb4',
+                cursorclass = cursorclass
+            )
+        except pymysql.Error as e:
+            raise Exception(e)
+        record_connection_opened(self.clinic)
         return connection
-    except pymysql.Error as e:
-        raise Exception(e)
+
+    def acquire(self):
+        with self._lock:
+            idle = self._idle.pop() if self._idle else None
+            self.in_use += 1
+        try:
+            if idle is None:
+                return self.connect()
+            connection, released_at = idle
+            if time.monotonic() - released_at > self.idle_check:
+                connection.ping(reconnect=True)
+            return connection
+        except Exception:
+            with self._lock:
+                self.in_use -= 1
+            raise
+
+    def release(self, connection):
+        keep = True
+        try:
+            if connection.server_status & SERVER_STATUS.SERVER_STATUS_IN_TRANS:
+                connection.rollback()
+        except Exception:
+            keep = False
+
+        with self._lock:
+            self.in_use -= 1
+            if keep and connection.open and len(self._idle) < self.size:
+                self._idle.append((connection, time.monotonic()))
+                return
+        try:
+            connection.close()
+        except Exception:
+            pass
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"in_use": self.in_use, "idle": len(self._idle), "size": self.size}
+
+def get_pool(clinic: str, app=None) -> ConnectionPool:
+    """
+    Return the connection pool of a clinic shard (created on first use per process).
+    """
+    global _pools, _pools_pid
+    if _pools_pid != os.getpid():
+        with _pools_lock:
+            if _pools_pid != os.getpid():
+                _pools, _pools_pid = {}, os.getpid()
+
+    pool = _pools.get(clinic)
+    if pool is None:
+        config = (app or current_app).config
+        shards = config["CLINIC_SHARDS"]
+        if clinic not in shards:
+            raise ValueError("Unknown clinic")
+        with _pools_lock:
+            pool = _pools.setdefault(clinic, ConnectionPool(shards[clinic], config["DB_POOL_SIZE"], clinic=clinic))
+    return pool
+
+def close_pools():
+    """
+    Close every idle pooled connection in this process.
+    Call before fork() so workers never share sockets with the master.
+    """
+    with _pools_lock:
+        pools = list(_pools.values())
+        _pools.clear()
+    for pool in pools:
+        with pool._lock:
+            idle, pool._idle = pool._idle, []
+        for connection, _ in idle:
+            try:
+                connection.close()
+            except Exception:
+                pass
+
+def pool_stats() -> dict:
+    """Connection usage per clinic shard in this process."""
+    return {clinic: pool.stats() for clinic, pool in list(_pools.items())}
+
+def current_clinic() -> str:
+    """
+    Return the clinic shard for the current context: `g.clinic` if set
+    (per request, or inside `use_clinic()`), otherwise the default clinic.
+    """
+    if has_app_context():
+        clinic = g.get("clinic")
+        if clinic:
+            return clinic
+        return current_app.config["DEFAULT_CLINIC"]
+    return None
+
+def db_connect(cursorclass=DictCursor, clinic=None):
+    """ 
+    Establish a dedicated (unpooled) PyMySQL connection with the clinic's MySQL db.
+    """
+    return get_pool(clinic or current_clinic()).connect(cursorclass)
     
 def get_db():
     """ 
-    Return a per-request PyMySQL connection stored on `flask.g`.
+    Return a per-request PyMySQL connection for the current clinic, stored on `flask.g`.
+    Connections are borrowed from the clinic's pool and returned by `close_db()`.
     """
+    clinic = current_clinic()
+    if "db" in g and g.get("db_clinic") != clinic:
+        close_db()
     if "db" not in g:
-        g.db = db_connect()
+        g.db = get_pool(clinic).acquire()
+        g.db_clinic = clinic
     return g.db
 
 def close_db(e=None):
     """
-    Close the db connection for the request if it exists.
+    Return the db connection for the request to its pool if it exists.
     """
     db = g.pop("db", None)
+    clinic = g.pop("db_clinic", None)
     if db is not None:
         try:
-            db.close()
+            get_pool(clinic).release(db)
         except Exception:
             pass
 
+@contextmanager
+def use_clinic(clinic: str):
+    """
+    Run DB helpers against another clinic shard inside the block.
+
+    Usage:
+        with use_clinic("north"):
+            rows = fetchall("SELECT ...")
+    """
+    saved_clinic = g.get("clinic")
+    saved_db = g.pop("db", None)
+    saved_db_clinic = g.pop("db_clinic", None)
+    g.clinic = clinic
+    try:
+        yield
+    finally:
+        close_db()
+        g.clinic = saved_clinic
+        if saved_db is not None:
+            g.db = saved_db
+            g.db_clinic = saved_db_clinic
+
+def fan_out(query, parameters=None, clinics=None, order_by=None, reverse=False) -> list[dict]:
+    """
+    Run the same SELECT on several clinic shards in parallel and merge the rows.
+    Each row is tagged with its `clinic`. If every shard returns rows sorted by
+    `order_by`, the merged list is sorted too.
+
+    Usage:
+        rows = fan_out("SELECT ... ORDER BY appointment_timestamp DESC",
+                       order_by="appointment_timestamp", reverse=True)
+    """
+    app = current_app._get_current_object()
+    clinics = list(clinics or app.config["CLINIC_SHARDS"])
+
+    def run(clinic):
+        pool = get_pool(clinic, app)
+        connection = pool.acquire()
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute(query, parameters or ())
+                rows = cursor.fetchall()
+        finally:
+            pool.release(connection)
+        for row in rows:
+            row["clinic"] = clinic
+        return rows
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=len(clinics)) as executor:
+        results = list(executor.map(run, clinics))
+    observe_query(time.perf_counter() - started, len(clinics))
+
+    if order_by is None:
+        return [row for rows in results for row in rows]
+    return list(heapq.merge(*results, key=lambda row: row[order_by], reverse=reverse))
+
+def _execute(cursor, query, parameters=None, many=False):
+    """Run a statement on `cursor` and charge its time to the request's DB metrics."""
+    started = time.perf_counter()
+    try:
+        if many:
+            return cursor.executemany(query, parameters)
+        return cursor.execute(query, parameters or ())
+    finally:
+        observe_query(time.perf_counter() - started)
+
 def fetchone(query, parameters=None) -> dict:
     """
     Helper function to execute a SELECT query and return a single row dict.
@@ -49,7 +246,7 @@ def fetchone(query, parameters=None) -> dict:
     """
     connection = get_db()
     with connection.cursor() as cursor:
-        cursor.execute(query, parameters or ())
+        _execute(cursor, query, parameters)
         return cursor.fetchone()
 
 def fetchall(query, parameters=None) -> list[dict]:
@@ -61,9 +258,52 @@ def fetchall(query, parameters=None) -> list[dict]:
     """
     connection = get_db()
     with connection.cursor() as cursor:
-        cursor.execute(query, parameters or ())
+        _execute(cursor, query, parameters)
+        return cursor.fetchall()
+
+def fetchall_tuples(query, parameters=None) -> tuple[tuple]:
+    """
+    Helper function to execute a SELECT query and return rows as plain tuples.
+    Cheaper than dict rows for bulk numeric pulls (e.g. loading into arrays).
+
+    Usage:
+        rows = fetchall_tuples("SELECT doctor_id, status + 0 FROM appointments")
+    """
+    connection = get_db()
+    with connection.cursor(pymysql.cursors.Cursor) as cursor:
+        _execute(cursor, query, parameters)
         return cursor.fetchall()
 
+def stream(query, parameters=None, batch_size=1000):
+    """
+    Helper function to execute a large SELECT and yield row dicts with constant memory.
+
+    Uses a dedicated connection with a server-side (unbuffered) cursor, so rows
+    are pulled from MySQL in `batch_size` chunks as the caller consumes them.
+    The per-request connection stays free for other queries.
+
+    Usage:
+        for row in stream("SELECT * FROM appointments WHERE appointment_timestamp >= %s", (start,)):
+            ...
+    """
+    connection = db_connect(cursorclass=SSDictCursor)
+    cursor = connection.cursor()
+    try:
+        _execute(cursor, query, parameters)
+        while True:
+            # Unbuffered: time each batch pulled from the server, not the caller's work
+            started = time.perf_counter()
+            rows = cursor.fetchmany(batch_size)
+            observe_query(time.perf_counter() - started, 0)
+            if not rows:
+                break
+            yield from rows
+    finally:
+        # Closing an unbuffered cursor reads every remaining row off the socket
+        # (e.g. an aborted export): drop the socket and detach the cursor instead
+        connection.close()
+        cursor.connection = None
+
 def execute_commit(query, parameters=None) -> tuple[int, int]:
     """
     WARNING: Do NOT use inside a `transaction()` block. This function commits immediately.
@@ -75,7 +315,7 @@ def execute_commit(query, parameters=None) -> tuple[int, int]:
     """
     connection = get_db()
     with connection.cursor() as cursor:
-        cursor.execute(query, parameters or ())
+        _execute(cursor, query, parameters)
     connection.commit()
     return cursor.rowcount, cursor.lastrowid
 
@@ -88,9 +328,23 @@ def execute(query, parameters=None) -> tuple[int, int]:
     """
     connection = get_db()
     with connection.cursor() as cursor:
-        cursor.execute(query, parameters or ())
+        _execute(cursor, query, parameters)
     return cursor.rowcount, cursor.lastrowid
 
+def executemany(query, seq_of_parameters) -> int:
+    """
+    Helper function to execute a batched INSERT/UPDATE/DELETE without committing. Returns rowcount.
+    PyMySQL rewrites `INSERT ... VALUES` into a single multi-row statement.
+
+    Usage:
+        with transaction():
+            executemany("INSERT INTO user_roles (user_id, role_id) VALUES (%s, %s)", rows)
+    """
+    connection = get_db()
+    with connection.cursor() as cursor:
+        _execute(cursor, query, seq_of_parameters, many=True)
+    return cursor.rowcount
+
 @contextmanager
 def transaction():
     """
@@ -106,12 +360,35 @@ def transaction():
     - Use `execute()` for write operations inside this block.
     - Do NOT use `execute_commit()` inside a transaction.
     - Any exception inside the block triggers a rollback.        
+    - Use `after_commit()` for side effects that must not happen on rollback.
     """
     db = get_db()
+    pending = g.setdefault("after_commit", [])
+    pending.append([])
     try:
         db.begin()
         yield
         db.commit()
     except Exception:
+        pending.pop()
         db.rollback()
-        raise
\ No newline at end of file
+        record_rollback(current_clinic())
+        raise
+    for callback in pending.pop():
+        callback()
+
+def after_commit(callback):
+    """
+    Run `callback()` once the innermost open `transaction()` commits
+    (immediately outside a transaction). Dropped if it rolls back.
+
+    Usage:
+        with transaction():
+            execute("DELETE FROM user_roles ...")
+            after_commit(lambda: shared_cache.invalidate("doctors:main"))
+    """
+    pending = g.get("after_commit")
+    if pending:
+        pending[-1].append(callback)
+    else:
+        callback()
\ No newline at end of file
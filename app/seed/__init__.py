@@ -7,8 +7,7 @@ def can_seed():
     """
     Returns True if no user exists in DB.
     """
-    count = fetchone("SELECT COUNT(*) AS c FROM users")["c"]
-    return count == 0
+    return fetchone("SELECT 1 AS found FROM users LIMIT 1") is None
 
 def run_seed_if_needed():
     if not can_seed():
@@ -29,9 +28,26 @@ def run_seed_if_needed():
         
         # Commit if everything succeeds
         db.commit()
+
+        # Other workers may have cached the empty clinic
+        from app.users.service import signal_users_changed
+        signal_users_changed("doctor")
     
     except Exception:
         # Rollback on any failure
         db.rollback()
         raise
 
+def seed_all_clinics(clinics=None) -> list[str]:
+    """
+    Seed every (or the given) clinic shard that has no users yet.
+    Returns the clinics that were checked.
+    """
+    from flask import current_app
+    from app.db import use_clinic
+
+    clinics = list(clinics or current_app.config["CLINIC_SHARDS"])
+    for clinic in clinics:
+        with use_clinic(clinic):
+            run_seed_if_needed()
+    return clinics
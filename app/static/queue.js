@@ -0,0 +1,56 @@
+// Check-in queue: renders /appointments/queue.json into a container and polls it.
+
+function renderQueue(container, data) {
+    const cell = (tag, text) => {
+        const element = document.createElement(tag);
+        element.textContent = text;
+        return element;
+    };
+
+    container.replaceChildren();
+    if (!data.doctors.length) {
+        container.append(cell("p", "Nobody is waiting."));
+        return;
+    }
+
+    for (const doctor of data.doctors) {
+        container.append(cell("h5", doctor.doctor_name || `Doctor #${doctor.doctor_id}`));
+        if (!doctor.waiting.length) {
+            container.append(cell("p", "Nobody is waiting."));
+            continue;
+        }
+
+        const table = document.createElement("table");
+        table.className = "table table-bordered table-sm align-middle mb-4";
+        const head = table.createTHead().insertRow();
+        for (const title of ["#", "Patient", "Appointment", "Arrived", "Estimated wait"]) {
+            head.append(cell("th", title));
+        }
+        const body = table.createTBody();
+        for (const entry of doctor.waiting) {
+            const row = body.insertRow();
+            row.append(
+                cell("td", entry.position),
+                cell("td", entry.patient_name || ""),
+                cell("td", entry.appointment_time),
+                cell("td", entry.arrived_at),
+                cell("td", entry.wait_minutes ? `${entry.wait_minutes} min` : "Next")
+            );
+        }
+        container.append(table);
+    }
+}
+
+function pollQueue(container, url, initial, seconds) {
+    renderQueue(container, initial);
+    setInterval(async () => {
+        try {
+            const response = await fetch(url, { headers: { Accept: "application/json" } });
+            if (response.ok) {
+                renderQueue(container, await response.json());
+            }
+        } catch (e) {
+            // Keep showing the last queue; the next poll retries
+        }
+    }, seconds * 1000);
+}
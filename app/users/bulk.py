@@ -0,0 +1,204 @@
+"""
+Bulk patient provisioning (CSV upload and `flask users import`).
+
+For migrating a paper register without one round trip per patient:
+- rows are validated in memory, then checked against existing user names
+  and emails with one set-based query (uq_users_user_name / uq_users_email)
+- passwords are hashed across a process pool
+- users, roles and user_details are inserted with `executemany` in chunked
+  transactions; a chunk rejected by a row (e.g. a concurrent insert of the
+  same user name, a value too long) is retried row by row so only the
+  offending rows fail. Connection errors and deadlocks abort the import;
+  chunks committed before it are kept.
+
+CSV columns: name, user_name, email and optionally password (defaults to
+the system password of staff-created users).
+"""
+
+import csv
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import pymysql
+from flask import current_app
+from werkzeug.security import generate_password_hash
+
+from app.audit.service import audit_log
+from app.auth.catalog import get_role_catalog
+from app.db import executemany, fetchall, transaction
+from app.users.service import DEFAULT_SYSTEM_PASSWORD, signal_users_changed
+
+REQUIRED_COLUMNS = ("name", "user_name", "email")
+
+# Below this many rows, starting worker processes costs more than it saves
+_POOL_THRESHOLD = 8
+
+
+def read_provisioning_csv(text_stream, max_rows: int = None) -> list[dict]:
+    """
+    Parse a provisioning CSV into row dicts tagged with their `line` number.
+
+    Raises:
+        ValueError if required columns are missing or the file has too many rows.
+    """
+    reader = csv.DictReader(text_stream)
+    columns = {(c or "").strip().lower() for c in reader.fieldnames or []}
+    missing = [c for c in REQUIRED_COLUMNS if c not in columns]
+    if missing:
+        raise ValueError(f"CSV is missing column(s): {', '.join(missing)}")
+
+    rows = []
+    for record in reader:
+        row = {(k or "").strip().lower(): (v or "").strip() for k, v in record.items() if k}
+        if not any(row.values()):
+            continue
+        row["line"] = reader.line_num
+        rows.append(row)
+        if max_rows and len(rows) > max_rows:
+            raise ValueError(f"CSV has more than {max_rows} rows; import larger files with `flask users import`")
+    if not rows:
+        raise ValueError("CSV has no rows")
+    return rows
+
+def provision_patients_for(user, rows: list[dict]) -> dict:
+    """
+    Create patient accounts for every valid row.
+
+    Authorization:
+    - Caller must have the `create_user` permission.
+
+    Returns:
+        {"created": [(line, user_id), ...], "failed": [(line, user_name, reason), ...]}
+    """
+    if not user.has_permission("create_user"):
+        raise ValueError("User is not allowed to create users")
+    return provision_patients(rows, user.id)
+
+def provision_patients(rows: list[dict], created_by_staff: int) -> dict:
+    """Provision `rows` as patients created by `created_by_staff` (no authorization check)."""
+    role_id = get_role_catalog().id_of("patient")
+    if role_id is None:
+        raise ValueError("Registration configuration error.")
+
+    valid, failed = _validate(rows)
+    valid = _drop_existing(valid, failed)
+
+    hashes = hash_passwords([row.get("password") or DEFAULT_SYSTEM_PASSWORD for row in valid])
+    for row, password_hash in zip(valid, hashes):
+        row["password_hash"] = password_hash
+
+    created = []
+    chunk_size = current_app.config["BULK_IMPORT_CHUNK"]
+    for start in range(0, len(valid), chunk_size):
+        chunk = valid[start:start + chunk_size]
+        try:
+            ids = _insert_chunk(chunk, role_id, created_by_staff)
+        except (pymysql.IntegrityError, pymysql.DataError):
+            # Isolate the rows that broke the chunk
+            ids = {}
+            for row in chunk:
+                try:
+                    ids.update(_insert_chunk([row], role_id, created_by_staff))
+                except pymysql.IntegrityError:
+                    failed.append((row["line"], row["user_name"], "User name or email already exists"))
+                except pymysql.DataError as e:
+                    failed.append((row["line"], row["user_name"], _mysql_message(e)))
+        for row in chunk:
+            user_id = ids.get(row["user_name"].lower())
+            if user_id is not None:
+                created.append((row["line"], user_id))
+                audit_log.record(created_by_staff, "user.create", "user", user_id, {"bulk": True})
+
+    failed.sort()
+    return {"created": created, "failed": failed}
+
+def hash_passwords(passwords: list[str]) -> list[str]:
+    """Hash passwords in parallel worker processes (salted, so every hash differs)."""
+    workers = current_app.config["BULK_HASH_WORKERS"] or os.cpu_count() or 1
+    if len(passwords) < _POOL_THRESHOLD or workers == 1:
+        return [generate_password_hash(p) for p in passwords]
+
+    # spawn: never fork a threaded web worker (pools, background writers)
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context) as executor:
+        chunksize = max(1, len(passwords) // (workers * 4))
+        return list(executor.map(generate_password_hash, passwords, chunksize=chunksize))
+
+def _mysql_message(error: pymysql.MySQLError) -> str:
+    """The server's message of a PyMySQL error (args are (code, message))."""
+    return str(error.args[1]) if len(error.args) > 1 else str(error)
+
+def _validate(rows: list[dict]) -> tuple[list[dict], list[tuple]]:
+    valid, failed = [], []
+    seen_names, seen_emails = set(), set()
+    for row in rows:
+        user_name, email = row.get("user_name", ""), row.get("email", "")
+        if not row.get("name") or not user_name or not email:
+            failed.append((row["line"], user_name, "Missing required user data"))
+        elif "@" not in email:
+            failed.append((row["line"], user_name, "Invalid email"))
+        # Unique keys use a case-insensitive collation
+        elif user_name.lower() in seen_names:
+            failed.append((row["line"], user_name, "Duplicate user name in file"))
+        elif email.lower() in seen_emails:
+            failed.append((row["line"], user_name, "Duplicate email in file"))
+        else:
+            seen_names.add(user_name.lower())
+            seen_emails.add(email.lower())
+            valid.append(row)
+    return valid, failed
+
+def _drop_existing(rows: list[dict], failed: list) -> list[dict]:
+    """One query for every user name and email that already exists."""
+    if not rows:
+        return rows
+    placeholders = ", ".join(["%s"] * len(rows))
+    existing = fetchall(
+        f"""
+        SELECT user_name, email FROM users
+        WHERE user_name IN ({placeholders}) OR email IN ({placeholders})
+        """,
+        [row["user_name"] for row in rows] + [row["email"] for row in rows]
+    )
+    taken_names = {r["user_name"].lower() for r in existing}
+    taken_emails = {r["email"].lower() for r in existing}
+
+    kept = []
+    for row in rows:
+        if row["user_name"].lower() in taken_names:
+            failed.append((row["line"], row["user_name"], "User name already exists"))
+        elif row["email"].lower() in taken_emails:
+            failed.append((row["line"], row["user_name"], "Email already exists"))
+        else:
+            kept.append(row)
+    return kept
+
+def _insert_chunk(chunk: list[dict], role_id: int, created_by_staff: int) -> dict:
+    """Insert users, roles and details of `chunk` in one transaction. Returns lower(user_name) -> id."""
+    with transaction():
+        executemany(
+            """
+            INSERT INTO users (user_name, email, password_hash, created_by_staff)
+            VALUES (%s, %s, %s, %s)
+            """,
+            [(r["user_name"], r["email"], r["password_hash"], created_by_staff) for r in chunk]
+        )
+        placeholders = ", ".join(["%s"] * len(chunk))
+        ids = {
+            r["user_name"].lower(): r["id"]
+            for r in fetchall(
+                f"SELECT id, user_name FROM users WHERE user_name IN ({placeholders})",
+                [r["user_name"] for r in chunk]
+            )
+        }
+        executemany(
+            "INSERT INTO user_roles (user_id, role_id) VALUES (%s, %s)",
+            [(ids[r["user_name"].lower()], role_id) for r in chunk]
+        )
+        executemany(
+            "INSERT INTO user_details (user_id, name) VALUES (%s, %s)",
+            [(ids[r["user_name"].lower()], r["name"]) for r in chunk]
+        )
+        signal_users_changed()
+    return ids
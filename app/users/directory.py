@@ -0,0 +1,70 @@
+"""
+Doctor directory.
+
+Every doctor of a clinic (users with the doctor role and a doctor_details
+row) with name and specialization, loaded with one query and kept in the
+shared cache, so doctor lookups in listings, calendars and the waitlist
+need no query per request and no copy per worker.
+
+Lookups of one doctor or specialization use the cached directory when it
+is cached, and otherwise a single-row query cached under its own key (a
+directory larger than a cache slot is never cached).
+
+Role changes, user creation and seeding call
+`invalidate_doctor_directory()` once they commit; every worker reloads
+on its next lookup. `SHARED_CACHE_TTL` bounds staleness otherwise.
+"""
+
+from flask import current_app
+
+from app.auth.catalog import get_role_catalog
+from app.db import current_clinic, fetchall, fetchone
+from app.utils.shared_cache import shared_cache
+
+_DOCTOR_COLUMNS = """
+    SELECT dd.user_id, ud.name, dd.specialization
+    FROM doctor_details dd
+    JOIN user_details ud ON ud.user_id = dd.user_id
+    WHERE EXISTS (SELECT 1 FROM user_roles ur WHERE ur.user_id = dd.user_id AND ur.role_id = %s)
+"""
+
+
+def _namespace() -> str:
+    return f"doctors:{current_clinic()}"
+
+def _cached(key: str, load):
+    """`load()` through the shared cache (wrapped in a list, so None is cached too)."""
+    entry = shared_cache.get(_namespace(), key)
+    if entry is None:
+        entry = [load()]
+        shared_cache.set(_namespace(), key, entry, ttl=current_app.config["SHARED_CACHE_TTL"])
+    return entry[0]
+
+def list_doctors() -> list[dict]:
+    """Doctors of the current clinic ordered by name: [{"user_id", "name", "specialization"}]."""
+    return _cached("all", lambda: fetchall(
+        f"{_DOCTOR_COLUMNS} ORDER BY ud.name", (get_role_catalog().id_of("doctor"),)
+    ))
+
+def get_doctor(doctor_id: int):
+    """The directory entry of `doctor_id`, or None if it is not a doctor."""
+    doctors = shared_cache.get(_namespace(), "all")
+    if doctors is not None:
+        return next((d for d in doctors[0] if d["user_id"] == doctor_id), None)
+    # Directory not cached (not loaded yet, or too large for the cache): this row only
+    return _cached(f"id:{int(doctor_id)}", lambda: fetchone(
+        f"{_DOCTOR_COLUMNS} AND dd.user_id = %s", (get_role_catalog().id_of("doctor"), doctor_id)
+    ))
+
+def has_specialization(specialization: str) -> bool:
+    doctors = shared_cache.get(_namespace(), "all")
+    if doctors is not None:
+        return any(d["specialization"] == specialization for d in doctors[0])
+    return _cached(f"spec:{specialization}", lambda: fetchone(
+        f"{_DOCTOR_COLUMNS} AND dd.specialization = %s LIMIT 1",
+        (get_role_catalog().id_of("doctor"), specialization)
+    ) is not None)
+
+def invalidate_doctor_directory():
+    """Reload the current clinic's directory in every worker (call after commit)."""
+    shared_cache.invalidate(_namespace())
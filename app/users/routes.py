@@ -1,8 +1,15 @@
-from flask import flash, redirect, render_template, request, url_for
+import io
+
+from flask import current_app, flash, redirect, render_template, request, url_for
 from flask_login import login_required, current_user
 from . import bp
 from app.utils.permissions import permissions_required
-from .service import create_user_by_staff, list_users_for, assign_role_to, remove_role_of
+from app.utils.idempotency import idempotent, request_idempotency_key
+from .service import (
+    create_user_by_staff, list_users_for, assign_role_to, remove_role_of,
+    bulk_assign_role_for, bulk_remove_role_for,
+)
+from .bulk import provision_patients_for, read_provisioning_csv
 
 @bp.route("/create_user", methods=["GET","POST"])
 @login_required
@@ -13,7 +20,10 @@ def create_user():
         return render_template("users/create.html")
     
     try:
-        user_id = create_user_by_staff(current_user, request.form)
+        user_id, _ = idempotent(
+            "users.create", current_user.id, request_idempotency_key(),
+            lambda: create_user_by_staff(current_user, request.form)
+        )
     except ValueError as e:
         flash (str(e))
         return redirect(url_for("users.create_user"))
@@ -21,13 +31,39 @@ def create_user():
     flash("User created successfully", "success")
     return redirect(url_for("appointments.create_appointment"))
 
+@bp.route("/import_users", methods=["GET","POST"])
+@login_required
+@permissions_required("create_user")
+def import_users():
+
+    if request.method == "GET":
+        return render_template("users/import.html")
+
+    upload = request.files.get("file")
+    if not upload or not upload.filename:
+        flash("Choose a CSV file to import")
+        return redirect(url_for("users.import_users"))
+
+    try:
+        rows = read_provisioning_csv(
+            io.TextIOWrapper(upload.stream, encoding="utf-8-sig", newline=""),
+            current_app.config["BULK_IMPORT_MAX_ROWS"]
+        )
+        result = provision_patients_for(current_user, rows)
+    except ValueError as e:
+        flash (str(e))
+        return redirect(url_for("users.import_users"))
+
+    flash(f"{len(result['created'])} users created, {len(result['failed'])} rows failed", "success")
+    return render_template("users/import.html", result=result)
+
 @bp.route("/list_users", methods=["GET"])
 @login_required
 @permissions_required("manage_users")
 def list_users():
 
-    data = list_users_for(current_user)
-    return render_template("users/list.html", **data)
+    data = list_users_for(current_user, request.args)
+    return render_template("users/list.html", filters=request.args, **data)
 
 @bp.route("/assign_role", methods=["POST"])
 @login_required
@@ -53,4 +89,32 @@ def remove_role():
         return redirect(url_for("users.list_users"))
 
     flash("Role successfully removed", "success")
-    return redirect(url_for("users.list_users"))
\ No newline at end of file
+    return redirect(url_for("users.list_users"))
+
+@bp.route("/bulk_roles", methods=["POST"])
+@login_required
+@permissions_required("manage_users")
+def bulk_roles():
+    action = request.form.get("action")
+    if action not in ("assign", "remove"):
+        flash("Unknown role action")
+        return redirect(url_for("users.list_users"))
+
+    try:
+        if action == "assign":
+            result = bulk_assign_role_for(current_user, request.form)
+        else:
+            result = bulk_remove_role_for(current_user, request.form)
+    except ValueError as e:
+        flash (str(e))
+        return redirect(url_for("users.list_users"))
+
+    verb = "assigned to" if action == "assign" else "removed from"
+    flash(f"Role {verb} {len(result['changed'])} users", "success")
+    if result["skipped"]:
+        # Group skipped users by reason to keep the message short
+        reasons = {}
+        for user_id, reason in result["skipped"]:
+            reasons.setdefault(reason, []).append(str(user_id))
+        flash("; ".join(f"{reason}: user {', '.join(ids)}" for reason, ids in reasons.items()))
+    return redirect(url_for("users.list_users"))
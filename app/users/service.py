@@ -12,8 +12,18 @@ Security model:
 - This module does not expose routes or UI concerns
 """
 
+import hashlib
+import json
+
+from flask import current_app
 from werkzeug.security import generate_password_hash
-from app.db import fetchone, fetchall, execute, transaction
+
+from app.db import after_commit, current_clinic, fetchone, fetchall, execute, executemany, transaction
+from app.auth.catalog import get_role_catalog
+from app.auth.principal import bump_auth_version
+from app.audit.service import audit_log
+from app.users.directory import invalidate_doctor_directory
+from app.utils.shared_cache import shared_cache
 
 # TEMPORARY: system-created users use a default password
 # MUST be replaced with reset-on-first-login or token flow
@@ -84,46 +94,154 @@ def create_user_by_staff(user, data: dict) -> int:
                 """,
                 (user_id, name)
             )
+            signal_users_changed()
 
     except Exception:
          raise ValueError("User creation failed")
     
     return user_id
     
-def list_users_for(user):
+def list_users_for(user, data: dict = None) -> dict:
     """
-    Return all active users with their roles
+    Return active users with their roles, one page at a time (by user name).
 
     Authorization:
     - manage_users: full view
     - others: empty list
 
+    Filters (all optional):
+    - role: role name
+    - q: user name or name prefix
+    - locked: "1" locked out now, "0" not locked
+    - after: keyset cursor (user name of the previous page's last row)
+
     Behaviour:
-    - Returns all active users
-    - Returns full role list for admin UI role assignment
+    - Pages walk `uq_users_user_name`; roles of the page come from one
+      lookup on `user_roles` resolved through the in-memory role catalog
+    - `total` is a table estimate without filters, otherwise a count capped
+      at USERS_COUNT_CAP (`total_capped` is then True); totals are shared
+      by all workers for USERS_COUNT_TTL seconds or until users or roles change
     """
-     
-    if user.has_permission("manage_users"):
-        users = fetchall(
+    if not user.has_permission("manage_users"):
+        return {"users": [], "roles": [], "total": 0, "total_capped": False, "next_after": None}
+
+    data = data or {}
+    config = current_app.config
+    catalog = get_role_catalog()
+    conditions = ["u.is_active = 1"]
+    parameters = []
+
+    role_name = data.get("role")
+    if role_name:
+        conditions.append("u.id IN (SELECT user_id FROM user_roles WHERE role_id = %s)")
+        parameters.append(catalog.id_of(role_name) or 0)
+
+    prefix = (data.get("q") or "").strip()
+    if prefix:
+        pattern = _like_prefix(prefix)
+        conditions.append(
+            "(u.user_name LIKE %s OR u.id IN (SELECT user_id FROM user_details WHERE name LIKE %s))"
+        )
+        parameters.extend([pattern, pattern])
+
+    locked = data.get("locked")
+    if locked == "1":
+        conditions.append("u.locked_until > NOW()")
+    elif locked == "0":
+        conditions.append("(u.locked_until IS NULL OR u.locked_until <= NOW())")
+
+    filtered = len(conditions) > 1
+    where = " AND ".join(conditions)
+    total, total_capped = _approximate_user_total(where, parameters, filtered)
+
+    after = data.get("after")
+    if after:
+        conditions.append("u.user_name > %s")
+        parameters.append(after)
+
+    page_size = config["USERS_PAGE_SIZE"]
+    users = fetchall(
+        f"""
+        SELECT u.id AS user_id, u.user_name, u.email, u.contact_no,
+            u.last_login, u.login_count, u.failed_logins, u.locked_until,
+            u.created_by_staff, u.created_at, u.updated_at
+        FROM users u
+        WHERE {" AND ".join(conditions)}
+        ORDER BY u.user_name
+        LIMIT %s
+        """,
+        (*parameters, page_size + 1)
+    )
+    next_after = None
+    if len(users) > page_size:
+        users = users[:page_size]
+        next_after = users[-1]["user_name"]
+
+    # Roles of this page only
+    if users:
+        role_ids = {}
+        placeholders = ", ".join(["%s"] * len(users))
+        for row in fetchall(
+            f"SELECT user_id, role_id FROM user_roles WHERE user_id IN ({placeholders})",
+            [u["user_id"] for u in users]
+        ):
+            role_ids.setdefault(row["user_id"], []).append(row["role_id"])
+        for u in users:
+            u["roles"] = ",".join(catalog.roles_for(role_ids.get(u["user_id"], [])))
+
+    return {
+        "users": users,
+        "roles": catalog.role_names(),
+        "total": total,
+        "total_capped": total_capped,
+        "next_after": next_after,
+    }
+
+def _approximate_user_total(where: str, parameters: list, filtered: bool) -> tuple[int, bool]:
+    """Cheap total for the listing header: (count, capped)."""
+    namespace = f"users:{current_clinic()}"
+    key = hashlib.sha1(json.dumps([where, parameters]).encode()).hexdigest()
+    cached = shared_cache.get(namespace, key)
+    if cached is not None:
+        return tuple(cached)
+
+    total = _count_users(where, parameters, filtered)
+    shared_cache.set(namespace, key, total, ttl=current_app.config["USERS_COUNT_TTL"])
+    return total
+
+def _count_users(where: str, parameters: list, filtered: bool) -> tuple[int, bool]:
+    if not filtered:
+        # InnoDB's row estimate: no scan at all
+        row = fetchone(
             """
-            SELECT u.id AS user_id, u.user_name, u.email, u.contact_no, 
-                u.last_login, u.failed_logins, u.locked_until, 
-                u.created_by_staff, u.created_at, u.updated_at,
-                GROUP_CONCAT(DISTINCT r.name ORDER BY r.name) AS roles
-            FROM users u
-            JOIN user_roles ur ON ur.user_id = u.id
-            JOIN roles r ON r.id = ur.role_id
-            WHERE is_active = 1
-            GROUP BY u.id
-            ORDER BY u.user_name
+            SELECT TABLE_ROWS AS estimate FROM information_schema.TABLES
+            WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = 'users'
             """
         )
+        return int(row["estimate"] or 0) if row else 0, False
 
-        roles = fetchall("SELECT name FROM roles ORDER BY name")
-
-        return {"users": users, "roles": roles}
+    cap = current_app.config["USERS_COUNT_CAP"]
+    row = fetchone(
+        f"SELECT COUNT(*) AS count FROM (SELECT 1 FROM users u WHERE {where} LIMIT %s) AS page",
+        (*parameters, cap + 1)
+    )
+    return min(row["count"], cap), row["count"] > cap
 
-    return {"users": [], "roles": []}
+def signal_users_changed(*role_names):
+    """
+    Once the current transaction commits, make every worker drop what it
+    derived from users and roles: listing totals and, if the doctor role
+    is among `role_names`, the doctor directory.
+    """
+    namespace = f"users:{current_clinic()}"
+    after_commit(lambda: shared_cache.invalidate(namespace))
+    if "doctor" in role_names:
+        after_commit(invalidate_doctor_directory)
+
+def _like_prefix(prefix: str) -> str:
+    """LIKE pattern matching `prefix` literally at the start."""
+    escaped = prefix.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+    return escaped + "%"
     
 def assign_role_to(user, data: dict) -> int:
     """
@@ -135,50 +253,14 @@ def assign_role_to(user, data: dict) -> int:
     Returns:
         Target_user_id(int)
     """
-    # Authorization
-    if not user.has_permission("manage_users"):
-         raise ValueError("User is not allowed to change roles")
-    
-    # Extract and validate
     target_user_id = data.get("user_id")
-    role_name = data.get("role")
-
-    if not target_user_id or not role_name:
+    if not target_user_id or not data.get("role"):
          raise ValueError("Missing role assignment data") 
-    
-    if not fetchone("SELECT id FROM users WHERE id = %s", (target_user_id,)):
-        raise ValueError("Target user not found")
-   
-    row = fetchone("SELECT id FROM roles WHERE name = %s",(role_name,))
-    if not row:
-        raise ValueError("Role not found") 
-    
-    role_id = row["id"]
-
-    # Prevent duplicates
-    user_role_exists = fetchone(
-        """
-        SELECT 1 
-        FROM user_roles 
-        WHERE user_id = %s AND role_id = %s
-        LIMIT 1
-        """,
-        (target_user_id, role_id)
-    )
-    if user_role_exists:
-         raise ValueError("User already has this role")
 
-    # Insert role atomically
-    with transaction():
-        execute(
-            """
-            INSERT INTO user_roles (user_id, role_id)
-            VALUES (%s, %s)
-            """,
-            (target_user_id, role_id)
-        )
-    
-    return target_user_id
+    result = bulk_assign_role_for(user, {"user_ids": [target_user_id], "role": data.get("role")})
+    if result["skipped"]:
+        raise ValueError(result["skipped"][0][1])
+    return int(target_user_id)
 
 def remove_role_of(user, data: dict) -> int:
     """
@@ -188,72 +270,157 @@ def remove_role_of(user, data: dict) -> int:
     - Caller must have the `manage_users` permission.
 
     Behavior:
-    - - Can't remove a role the user dosen't have
+    - Can't remove a role the user dosen't have
     - Can't remove the last remaining role
     - Can't remove own `admin` role
 
     Returns:
         target_user_id (int)
     """
+    target_user_id = data.get("user_id")
+    if not target_user_id or not data.get("role"):
+        raise ValueError("Missing role removal data")
 
-    # Authorization
+    result = bulk_remove_role_for(user, {"user_ids": [target_user_id], "role": data.get("role")})
+    if result["skipped"]:
+        raise ValueError(result["skipped"][0][1])
+    return int(target_user_id)
+
+def bulk_assign_role_for(user, data: dict) -> dict:
+    """
+    Assign one role to many users with one validation query and one multi-row INSERT.
+
+    Authorization:
+    - Caller must have the `manage_users` permission.
+
+    Behavior:
+    - Unknown users and users who already have the role are skipped
+    - All other users get the role in one transaction
+
+    Returns:
+        {"changed": [user_id, ...], "skipped": [(user_id, reason), ...]}
+    """
     if not user.has_permission("manage_users"):
-        raise ValueError("User is not allowed to change roles")
-    
-    # Extract and validate
-    target_user_id = data.get("user_id")
-    role_name = data.get("role")
+         raise ValueError("User is not allowed to change roles")
+    user_ids, role_name, role_id = _bulk_role_input(data)
 
-    if not target_user_id or not role_name:
-        raise ValueError("Missing role removal data")
-    
-    if not fetchone("SELECT id FROM users WHERE id = %s", (target_user_id,)):
-        raise ValueError("Target user not found")
-   
-    row = fetchone("SELECT id FROM roles WHERE name = %s",(role_name,))
-    if not row:
-        raise ValueError("Role not found")
+    placeholders = ", ".join(["%s"] * len(user_ids))
+    with transaction():
+        found = {
+            row["id"]: row["has_role"]
+            for row in fetchall(
+                f"""
+                SELECT u.id, COALESCE(MAX(ur.role_id = %s), 0) AS has_role
+                FROM users u
+                LEFT JOIN user_roles ur ON ur.user_id = u.id
+                WHERE u.id IN ({placeholders})
+                GROUP BY u.id
+                """,
+                (role_id, *user_ids)
+            )
+        }
+        changed, skipped = [], []
+        for user_id in user_ids:
+            if user_id not in found:
+                skipped.append((user_id, "Target user not found"))
+            elif found[user_id]:
+                skipped.append((user_id, "User already has this role"))
+            else:
+                changed.append(user_id)
+
+        if changed:
+            # IGNORE: a concurrent grant of the same role is not an error
+            executemany(
+                "INSERT IGNORE INTO user_roles (user_id, role_id) VALUES (%s, %s)",
+                [(user_id, role_id) for user_id in changed]
+            )
+            # Invalidate the users' session principals and shared caches
+            bump_auth_version(*changed)
+            signal_users_changed(role_name)
 
-    # Prevent self-admin lockout
-    if user.id == int(target_user_id) and role_name == "admin":
-        raise ValueError("Admin cannot remove their own admin role")
+    for user_id in changed:
+        audit_log.record(user.id, "role.assign", "user", user_id, {"role": role_name})
+    return {"changed": changed, "skipped": skipped}
 
-    role_id = row["id"]
+def bulk_remove_role_for(user, data: dict) -> dict:
+    """
+    Remove one role from many users with one validation query and one multi-row DELETE.
 
-    # Ensure user actually have the role
-    user_role = fetchone(
-        """
-        SELECT 1
-        FROM user_roles
-        WHERE user_id = %s AND role_id = %s
-        LIMIT 1
-        """,
-        (target_user_id, role_id)
-    )
-    if not user_role:
-        raise ValueError("User does not have this role")
-
-    # Count roles (prevent orphan users)
-    role_count = fetchone(
-        """
-        SELECT COUNT(*) AS count
-        FROM user_roles
-        WHERE user_id = %s
-        """,
-        (target_user_id,)
-    )["count"]
+    Authorization:
+    - Caller must have the `manage_users` permission.
 
-    if role_count <= 1:
-        raise ValueError("User must have at least one role")
+    Behavior:
+    - Skips unknown users, users without the role, users for whom it is the
+      last role, and the caller's own `admin` role
+    - The users' role rows are locked while validating, so concurrent
+      removals cannot leave a user without roles
 
-    # Remove role atomically
+    Returns:
+        {"changed": [user_id, ...], "skipped": [(user_id, reason), ...]}
+    """
+    if not user.has_permission("manage_users"):
+        raise ValueError("User is not allowed to change roles")
+    user_ids, role_name, role_id = _bulk_role_input(data)
+
+    placeholders = ", ".join(["%s"] * len(user_ids))
     with transaction():
-        execute(
-            """
-            DELETE FROM user_roles
-            WHERE user_id = %s AND role_id = %s
-            """,
-            (target_user_id, role_id)
-        )
+        found = {
+            row["id"]: row
+            for row in fetchall(
+                f"""
+                SELECT u.id, COUNT(ur.role_id) AS role_count,
+                    COALESCE(MAX(ur.role_id = %s), 0) AS has_role
+                FROM users u
+                LEFT JOIN user_roles ur ON ur.user_id = u.id
+                WHERE u.id IN ({placeholders})
+                GROUP BY u.id
+                FOR UPDATE
+                """,
+                (role_id, *user_ids)
+            )
+        }
+        changed, skipped = [], []
+        for user_id in user_ids:
+            row = found.get(user_id)
+            if row is None:
+                skipped.append((user_id, "Target user not found"))
+            # Prevent self-admin lockout
+            elif user_id == user.id and role_name == "admin":
+                skipped.append((user_id, "Admin cannot remove their own admin role"))
+            elif not row["has_role"]:
+                skipped.append((user_id, "User does not have this role"))
+            # Prevent orphan users
+            elif row["role_count"] <= 1:
+                skipped.append((user_id, "User must have at least one role"))
+            else:
+                changed.append(user_id)
+
+        if changed:
+            execute(
+                f"DELETE FROM user_roles WHERE role_id = %s AND user_id IN ({', '.join(['%s'] * len(changed))})",
+                (role_id, *changed)
+            )
+            # Invalidate the users' session principals and shared caches
+            bump_auth_version(*changed)
+            signal_users_changed(role_name)
 
-    return target_user_id
\ No newline at end of file
+    for user_id in changed:
+        audit_log.record(user.id, "role.remove", "user", user_id, {"role": role_name})
+    return {"changed": changed, "skipped": skipped}
+
+def _bulk_role_input(data) -> tuple[list[int], str, int]:
+    """Validate `user_ids` (list) and `role`; role ids come from the in-memory catalog."""
+    raw_ids = data.getlist("user_ids") if hasattr(data, "getlist") else data.get("user_ids") or []
+    role_name = data.get("role")
+    if not raw_ids or not role_name:
+        raise ValueError("Missing role assignment data")
+
+    try:
+        user_ids = list(dict.fromkeys(int(user_id) for user_id in raw_ids))
+    except (TypeError, ValueError):
+        raise ValueError("Invalid user id")
+
+    role_id = get_role_catalog().id_of(role_name)
+    if role_id is None:
+        raise ValueError("Role not found")
+    return user_ids, role_name, role_id
@@ -0,0 +1,33 @@
+from flask import current_app, g, request, session
+
+def resolve_clinic():
+    """
+    Select the clinic shard for the current request (registered as `before_request`).
+
+    Order:
+    - the clinic the session logged in to (user ids are only valid within their shard;
+      a logged-in session without a valid clinic is logged out)
+    - `X-Clinic` header (e.g. set per host by the reverse proxy) or the login form's `clinic`
+    - DEFAULT_CLINIC
+    """
+    shards = current_app.config["CLINIC_SHARDS"]
+
+    clinic = session.get("clinic")
+    if clinic not in shards:
+        if "_user_id" in session:
+            # Logged in without a (known) clinic, e.g. before sharding: the user id
+            # would be resolved on whatever shard the client asks for. Not
+            # logout_user(), which loads that user first.
+            session.clear()
+        clinic = request.headers.get("X-Clinic") or request.form.get("clinic")
+    if clinic not in shards:
+        clinic = current_app.config["DEFAULT_CLINIC"]
+
+    g.clinic = clinic
+
+def clinic_context():
+    """Template context: configured clinics and the current one."""
+    return {
+        "clinics": list(current_app.config["CLINIC_SHARDS"]),
+        "current_clinic": g.get("clinic"),
+    }
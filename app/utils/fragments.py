@@ -0,0 +1,98 @@
+"""
+Template rendering caches.
+
+- Jinja bytecode cache: compiled templates are stored on disk, so
+  restarted workers load them instead of recompiling every template.
+- Fragment cache: rendered HTML of a single list row, keyed by the row's
+  id and `updated_at` plus whatever else the markup depends on. Lists
+  of thousands of mostly unchanged rows only render the changed ones.
+
+Usage (template):
+    {% set key = fragment_key("appointment", appt.id, appt.updated_at, row_scope) %}
+    {% set html = fragments.get(key) %}
+    {% if html is none %}
+        {% set html %}{% include "appointments/_row.html" %}{% endset %}
+        {% set html = fragments.put(key, html) %}
+    {% endif %}
+    {{ html }}
+"""
+
+import os
+import threading
+from collections import OrderedDict
+
+from flask import g
+from jinja2 import FileSystemBytecodeCache
+
+
+class FragmentCache:
+    """
+    Bounded in-process LRU of rendered fragments.
+
+    A key of None means "not cacheable": `get` misses and `put` only
+    returns the HTML, so templates need no special case.
+    """
+
+    def __init__(self, max_entries: int = 20_000):
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        if key is None:
+            return None
+        with self._lock:
+            html = self._entries.get(key)
+            if html is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return html
+
+    def put(self, key, html):
+        if key is None or not self.max_entries:
+            return html
+        with self._lock:
+            self._entries[key] = html
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return html
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses}
+
+
+fragment_cache = FragmentCache()
+
+
+def fragment_key(kind: str, row_id, updated_at, *scope):
+    """
+    Cache key for one rendered row, or None if the row has no `updated_at`.
+    `scope` carries everything else the markup depends on (viewer role,
+    status, joined columns such as names, clinic view, ...), since joined
+    tables do not move `updated_at`. Keys are per clinic shard.
+    """
+    if row_id is None or updated_at is None:
+        return None
+    return (kind, g.get("clinic"), row_id, updated_at, *scope)
+
+
+def init_template_caches(app):
+    """Install the bytecode cache and expose the fragment cache to templates."""
+    config = app.config
+    if config["TEMPLATE_BYTECODE_CACHE"]:
+        directory = config.get("TEMPLATE_CACHE_DIR")
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        app.jinja_env.bytecode_cache = FileSystemBytecodeCache(directory)
+
+    fragment_cache.max_entries = config["FRAGMENT_CACHE_SIZE"]
+    app.jinja_env.globals.update(fragments=fragment_cache, fragment_key=fragment_key)
@@ -0,0 +1,154 @@
+"""
+Idempotency keys for create endpoints.
+
+Forms carry a hidden `idempotency_key` (API clients send an
+`Idempotency-Key` header). The first request with a key reserves it in
+`idempotency_keys` before any validation query, password hash or insert
+runs, then stores the id it created. Retries with the same key get that
+id back without running the create again.
+
+Keys are scoped per clinic shard, user and endpoint, and expire after
+`IDEMPOTENCY_TTL` seconds. Reservations left behind by a crashed request
+can be taken over after `IDEMPOTENCY_PENDING_TIMEOUT` seconds.
+
+Usage:
+    appointment_id, replayed = idempotent(
+        "appointments.create", current_user.id, request_idempotency_key(),
+        lambda: create_appointment_for(current_user, request.form)
+    )
+"""
+
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+from flask import current_app, request
+
+from app.db import current_clinic, execute_commit, fetchone
+
+MAX_KEY_LENGTH = 64
+
+# Recently completed keys of this process: (clinic, scope, user_id, key) -> (result_id, expires)
+_recent = OrderedDict()
+_recent_lock = threading.Lock()
+_RECENT_MAX = 10_000
+
+
+def new_idempotency_key() -> str:
+    """Fresh key for a rendered form (template global)."""
+    return uuid.uuid4().hex
+
+def request_idempotency_key() -> str:
+    """
+    Return the idempotency key of the current request, or None.
+
+    Raises:
+        ValueError if the key is malformed.
+    """
+    key = (request.headers.get("Idempotency-Key") or request.form.get("idempotency_key") or "").strip()
+    if not key:
+        return None
+    if len(key) > MAX_KEY_LENGTH or not key.isprintable():
+        raise ValueError("Invalid idempotency key")
+    return key
+
+def idempotent(scope: str, user_id: int, key: str, create) -> tuple[int, bool]:
+    """
+    Run `create()` at most once per (scope, user, key).
+
+    Returns:
+        (result_id, replayed): replayed is True when the id comes from an
+        earlier request with the same key.
+
+    Raises:
+        ValueError if the same key is still being processed by another request,
+        or whatever `create()` raises (the key is then released for a retry).
+    """
+    if not key:
+        return create(), False
+
+    cache_key = (current_clinic(), scope, user_id, key)
+    with _recent_lock:
+        cached = _recent.get(cache_key)
+    if cached and cached[1] > time.monotonic():
+        return cached[0], True
+
+    if not _reserve(scope, user_id, key):
+        row = fetchone(
+            """
+            SELECT result_id FROM idempotency_keys
+            WHERE user_id = %s AND scope = %s AND idem_key = %s
+            """,
+            (user_id, scope, key)
+        )
+        if row and row["result_id"] is not None:
+            _remember(cache_key, row["result_id"])
+            return row["result_id"], True
+        raise ValueError("This request is already being processed. Please wait and refresh.")
+
+    try:
+        result_id = create()
+    except Exception:
+        execute_commit(
+            """
+            DELETE FROM idempotency_keys
+            WHERE user_id = %s AND scope = %s AND idem_key = %s AND result_id IS NULL
+            """,
+            (user_id, scope, key)
+        )
+        raise
+
+    execute_commit(
+        """
+        UPDATE idempotency_keys SET result_id = %s
+        WHERE user_id = %s AND scope = %s AND idem_key = %s
+        """,
+        (result_id, user_id, scope, key)
+    )
+    _remember(cache_key, result_id)
+    return result_id, False
+
+def purge_expired_keys(batch_size: int = 1000) -> int:
+    """Delete expired keys of the current clinic in small batches. Returns rows deleted."""
+    total = 0
+    while True:
+        deleted, _ = execute_commit(
+            "DELETE FROM idempotency_keys WHERE expires_at < NOW() LIMIT %s",
+            (batch_size,)
+        )
+        total += deleted
+        if deleted < batch_size:
+            return total
+
+def _reserve(scope: str, user_id: int, key: str) -> bool:
+    """
+    Claim the key. Returns False if a live reservation or result already exists.
+    Expired keys and abandoned reservations are taken over in place.
+    """
+    config = current_app.config
+    stale = (
+        "(expires_at < NOW() OR (result_id IS NULL AND "
+        f"created_at < NOW() - INTERVAL {int(config['IDEMPOTENCY_PENDING_TIMEOUT'])} SECOND))"
+    )
+    # Assignments run left to right: `expires_at` must be updated last
+    affected, _ = execute_commit(
+        f"""
+        INSERT INTO idempotency_keys (user_id, scope, idem_key, expires_at)
+        VALUES (%s, %s, %s, NOW() + INTERVAL %s SECOND)
+        ON DUPLICATE KEY UPDATE
+            result_id = IF({stale}, NULL, result_id),
+            created_at = IF({stale}, NOW(), created_at),
+            expires_at = IF({stale}, VALUES(expires_at), expires_at)
+        """,
+        (user_id, scope, key, int(config["IDEMPOTENCY_TTL"]))
+    )
+    # 1 = inserted, 2 = took over a stale row, 0 = live duplicate
+    return affected > 0
+
+def _remember(cache_key: tuple, result_id: int):
+    expires = time.monotonic() + current_app.config["IDEMPOTENCY_TTL"]
+    with _recent_lock:
+        _recent[cache_key] = (result_id, expires)
+        if len(_recent) > _RECENT_MAX:
+            _recent.popitem(last=False)
@@ -0,0 +1,357 @@
+"""
+Prometheus-style metrics (`GET /metrics`, text exposition format).
+
+Exposed series:
+- clinic_http_requests_total{endpoint,method,status}
+- clinic_http_request_duration_seconds{endpoint} (histogram)
+- clinic_db_queries_total{endpoint} / clinic_db_seconds_total{endpoint}
+  (time spent in the `app/db.py` helpers; "background" outside requests)
+- clinic_db_rollbacks_total{clinic} (`transaction()` blocks rolled back)
+- clinic_logins_total{result} (success, failure, throttled, locked)
+- clinic_shared_cache_requests_total{namespace,result} (hit, miss)
+- clinic_db_connections_opened_total{clinic}
+- clinic_db_pool_*{clinic} (connection usage of live worker processes)
+
+Counters are lock-free: every thread writes to its own dicts, which are
+only read (copied) when a snapshot is taken. With several worker processes
+each one writes its snapshot to `METRICS_DIR/<pid>.json` every
+`METRICS_SNAPSHOT_INTERVAL` seconds; a scrape merges all of them. Snapshots
+of exited workers are folded into `dead.json` so counters never go back.
+"""
+
+import hmac
+import json
+import os
+import threading
+import time
+from bisect import bisect_left
+
+from flask import Response, abort, current_app, request
+from flask_login import current_user
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# name -> (type, help, histogram buckets)
+METRICS = {
+    "clinic_http_requests_total": ("counter", "HTTP requests by endpoint, method and status", None),
+    "clinic_http_request_duration_seconds": ("histogram", "Request latency by endpoint", LATENCY_BUCKETS),
+    "clinic_db_queries_total": ("counter", "Queries run through app/db.py helpers", None),
+    "clinic_db_seconds_total": ("counter", "Time spent in app/db.py helpers", None),
+    "clinic_db_rollbacks_total": ("counter", "transaction() blocks rolled back", None),
+    "clinic_logins_total": ("counter", "Login attempts by result", None),
+    "clinic_shared_cache_requests_total": ("counter", "Shared cache lookups by namespace and result", None),
+    "clinic_db_pool_in_use": ("gauge", "Pooled connections checked out", None),
+    "clinic_db_pool_idle": ("gauge", "Idle pooled connections", None),
+    "clinic_db_pool_size": ("gauge", "Maximum idle connections kept per pool", None),
+    "clinic_db_connections_opened_total": ("counter", "MySQL connections opened", None),
+}
+
+DEAD_FILE = "dead.json"
+
+
+class _ThreadMetrics:
+    """Counters of one thread; only that thread writes to them."""
+
+    __slots__ = ("counters", "histograms", "in_request", "started", "status", "queries", "db_seconds")
+
+    def __init__(self):
+        self.counters = {}      # (name, labels) -> value
+        self.histograms = {}    # (name, labels) -> [bucket counts..., sum, count]
+        self.in_request = False
+        self.started = 0.0
+        self.status = 500
+        self.queries = 0
+        self.db_seconds = 0.0
+
+_local = threading.local()
+_stores = []
+_stores_lock = threading.Lock()
+_writer_started = False
+
+
+def _after_fork():
+    # Workers start from zero; the master's counters stay in the master
+    global _local, _stores, _stores_lock, _writer_started
+    _local, _stores, _stores_lock, _writer_started = threading.local(), [], threading.Lock(), False
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_after_fork)
+
+def _store() -> _ThreadMetrics:
+    try:
+        return _local.store
+    except AttributeError:
+        store = _local.store = _ThreadMetrics()
+        with _stores_lock:
+            _stores.append(store)
+        return store
+
+def inc(name: str, labels: tuple = (), amount: float = 1):
+    """Add to a counter. `labels` is a tuple of (name, value) pairs."""
+    counters = _store().counters
+    key = (name, labels)
+    counters[key] = counters.get(key, 0) + amount
+
+def observe(name: str, labels: tuple, value: float):
+    """Record one histogram observation."""
+    histograms = _store().histograms
+    key = (name, labels)
+    buckets = METRICS[name][2]
+    entry = histograms.get(key)
+    if entry is None:
+        entry = histograms[key] = [0] * (len(buckets) + 1) + [0.0, 0]
+    entry[bisect_left(buckets, value)] += 1
+    entry[-2] += value
+    entry[-1] += 1
+
+def observe_query(seconds: float, count: int = 1):
+    """Charge DB time to the current request (called by the app/db.py helpers)."""
+    store = _store()
+    if store.in_request:
+        store.queries += count
+        store.db_seconds += seconds
+        return
+    labels = (("endpoint", "background"),)
+    inc("clinic_db_queries_total", labels, count)
+    inc("clinic_db_seconds_total", labels, seconds)
+
+def record_rollback(clinic: str):
+    inc("clinic_db_rollbacks_total", (("clinic", clinic or ""),))
+
+def record_connection_opened(clinic: str):
+    inc("clinic_db_connections_opened_total", (("clinic", clinic or ""),))
+
+def record_login(result: str):
+    inc("clinic_logins_total", (("result", result),))
+
+# --- Request hooks ---
+
+def init_metrics(app):
+    """Time every request and serve `/metrics` (register before other hooks)."""
+    if not app.config["METRICS_ENABLED"]:
+        return
+    app.before_request(_start_request)
+    app.after_request(_finish_response)
+    app.teardown_request(_end_request)
+    app.add_url_rule("/metrics", "metrics", metrics_view)
+
+def _start_request():
+    if not _writer_started and current_app.config["METRICS_DIR"]:
+        _start_writer(current_app._get_current_object())
+    store = _store()
+    store.in_request = True
+    store.status = 500
+    store.queries = 0
+    store.db_seconds = 0.0
+    store.started = time.perf_counter()
+
+def _finish_response(response):
+    _store().status = response.status_code
+    return response
+
+def _end_request(e=None):
+    store = _store()
+    if not store.in_request:
+        return
+    store.in_request = False
+    elapsed = time.perf_counter() - store.started
+
+    # Unrouted requests (404 scans) share one label to bound cardinality
+    endpoint = (("endpoint", request.endpoint or "unmatched"),)
+    inc("clinic_http_requests_total", endpoint + (("method", request.method), ("status", str(store.status))))
+    observe("clinic_http_request_duration_seconds", endpoint, elapsed)
+    if store.queries:
+        inc("clinic_db_queries_total", endpoint, store.queries)
+        inc("clinic_db_seconds_total", endpoint, store.db_seconds)
+
+def metrics_view():
+    """
+    Prometheus scrape endpoint.
+
+    Authorization:
+    - scrapers: `Authorization: Bearer <METRICS_TOKEN>` (only if the token is set)
+    - logged-in users with manage_users
+    - others: 403 (traffic and login failure rates are not public)
+    """
+    token = current_app.config["METRICS_TOKEN"]
+    scraper = token and hmac.compare_digest(
+        request.headers.get("Authorization", ""), f"Bearer {token}"
+    )
+    if not scraper and not (current_user.is_authenticated and current_user.has_permission("manage_users")):
+        abort(403)
+    return Response(render(), mimetype="text/plain; version=0.0.4")
+
+# --- Snapshots and aggregation ---
+
+def snapshot() -> dict:
+    """Counters, histograms and pool gauges of this process."""
+    counters, histograms = {}, {}
+    with _stores_lock:
+        stores = list(_stores)
+    for store in stores:
+        for key, value in dict(store.counters).items():
+            counters[key] = counters.get(key, 0) + value
+        for key, entry in dict(store.histograms).items():
+            _add_histogram(histograms, key, list(entry))
+
+    from app.db import pool_stats
+    gauges = {}
+    for clinic, stats in pool_stats().items():
+        labels = (("clinic", clinic),)
+        gauges[("clinic_db_pool_in_use", labels)] = stats["in_use"]
+        gauges[("clinic_db_pool_idle", labels)] = stats["idle"]
+        gauges[("clinic_db_pool_size", labels)] = stats["size"]
+    return {"counters": counters, "histograms": histograms, "gauges": gauges}
+
+def write_snapshot(directory: str):
+    """Atomically replace `<directory>/<pid>.json` with this process's snapshot."""
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, f"{os.getpid()}.json")
+    tmp = f"{path}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(_encode(snapshot()), f)
+    os.replace(tmp, path)
+
+def _start_writer(app):
+    global _writer_started
+    with _stores_lock:
+        if _writer_started:
+            return
+        _writer_started = True
+    directory = app.config["METRICS_DIR"]
+    interval = app.config["METRICS_SNAPSHOT_INTERVAL"]
+
+    def run():
+        while True:
+            time.sleep(interval)
+            try:
+                write_snapshot(directory)
+            except Exception:
+                app.logger.exception("metrics snapshot failed")
+
+    threading.Thread(target=run, name="metrics-snapshot", daemon=True).start()
+
+def collect() -> dict:
+    """This process's metrics merged with every other worker's snapshot."""
+    import fcntl
+
+    directory = current_app.config["METRICS_DIR"]
+    if not directory:
+        return snapshot()
+
+    write_snapshot(directory)
+    # Folding and reading under one lock, so no worker is counted twice
+    with open(os.path.join(directory, ".lock"), "w") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        _fold_dead(directory)
+        merged = {"counters": {}, "histograms": {}, "gauges": {}}
+        for name in os.listdir(directory):
+            if name.endswith(".json"):
+                data = _read(os.path.join(directory, name))
+                if data is not None:
+                    _merge(merged, data)
+    return merged
+
+def _fold_dead(directory: str):
+    """Move the counters of exited workers into dead.json and drop their files."""
+    dead = [name for name in os.listdir(directory) if name.endswith(".json") and name != DEAD_FILE and not _alive(name)]
+    if not dead:
+        return
+    dead_path = os.path.join(directory, DEAD_FILE)
+    folded = _read(dead_path) or {"counters": {}, "histograms": {}, "gauges": {}}
+    for name in dead:
+        data = _read(os.path.join(directory, name))
+        if data is not None:
+            data["gauges"] = {}     # connections of an exited worker are gone
+            _merge(folded, data)
+    tmp = f"{dead_path}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(_encode(folded), f)
+    os.replace(tmp, dead_path)
+    for name in dead:
+        os.remove(os.path.join(directory, name))
+
+def _alive(filename: str) -> bool:
+    try:
+        os.kill(int(filename.split(".")[0]), 0)
+    except ValueError:
+        return True     # not a worker file; leave it alone
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+def _read(path: str):
+    try:
+        with open(path, encoding="utf-8") as f:
+            return _decode(json.load(f))
+    except (FileNotFoundError, ValueError):
+        return None
+
+def _merge(into: dict, data: dict):
+    for section in ("counters", "gauges"):
+        target = into[section]
+        for key, value in data[section].items():
+            target[key] = target.get(key, 0) + value
+    for key, entry in data["histograms"].items():
+        _add_histogram(into["histograms"], key, entry)
+
+def _add_histogram(histograms: dict, key: tuple, entry: list):
+    current = histograms.get(key)
+    if current is None:
+        histograms[key] = entry
+    else:
+        for i, value in enumerate(entry):
+            current[i] += value
+
+def _encode(data: dict) -> dict:
+    return {section: [[name, list(labels), value] for (name, labels), value in items.items()]
+            for section, items in data.items()}
+
+def _decode(data: dict) -> dict:
+    return {section: {(name, tuple(map(tuple, labels))): value for name, labels, value in items}
+            for section, items in data.items()}
+
+# --- Exposition ---
+
+def render() -> str:
+    """Prometheus text format (0.0.4) of the merged metrics."""
+    data = collect()
+    series = {}
+    for section in ("counters", "gauges"):
+        for (name, labels), value in data[section].items():
+            series.setdefault(name, []).append((labels, value))
+    for (name, labels), entry in data["histograms"].items():
+        series.setdefault(name, []).append((labels, entry))
+
+    lines = []
+    for name in sorted(series):
+        kind, help_text, buckets = METRICS.get(name, ("untyped", name, None))
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {kind}")
+        for labels, value in sorted(series[name]):
+            if kind != "histogram":
+                lines.append(f"{name}{_labels(labels)} {_number(value)}")
+                continue
+            cumulative = 0
+            for bound, count in zip(buckets + (float("inf"),), value):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else _number(bound)
+                lines.append(f"{name}_bucket{_labels(labels + (('le', le),))} {cumulative}")
+            lines.append(f"{name}_sum{_labels(labels)} {_number(value[-2])}")
+            lines.append(f"{name}_count{_labels(labels)} {value[-1]}")
+    return "\n".join(lines) + "\n"
+
+def _labels(labels: tuple) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape(value)}"' for key, value in labels) + "}"
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def _number(value) -> str:
+    if isinstance(value, float):
+        return repr(round(value, 6))
+    return str(value)
@@ -0,0 +1,157 @@
+"""
+On-demand request profiling.
+
+When `PROFILING_ENABLED` is set, requests run under cProfile if either:
+- they are sampled (`PROFILE_SAMPLE_RATE`, fraction of all requests), or
+- they carry `X-Profile: 1` and the user has `manage_users`
+
+Each profiled request writes to `PROFILE_DIR/<endpoint>/`:
+- `<stamp>.prof`: pstats dump (snakeviz, flameprof, `pstats` all read it)
+- `<stamp>.json`: wall time, time per layer and the slowest functions
+
+Layers (self time of each function, by source file):
+- db:        app/db.py and PyMySQL (socket reads are charged to their caller's layer)
+- template:  Jinja2/MarkupSafe and compiled templates
+- app:       other application code (services, routes, auth)
+- framework: Flask, Werkzeug, Flask-Login and the rest
+
+`flask profiles report` merges the dumps of an endpoint.
+"""
+
+import cProfile
+import json
+import os
+import pstats
+import random
+import time
+
+from flask import current_app, g, request
+from flask_login import current_user
+
+LAYERS = ("db", "template", "app", "framework")
+
+APP_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DB_MODULE = os.path.join(APP_ROOT, "db.py")
+
+
+def init_profiling(app):
+    if not app.config["PROFILING_ENABLED"]:
+        return
+    app.before_request(_start_profile)
+    app.after_request(_stop_profile)
+
+def _wants_profile() -> bool:
+    if request.headers.get("X-Profile") == "1":
+        return current_user.is_authenticated and current_user.has_permission("manage_users")
+    rate = current_app.config["PROFILE_SAMPLE_RATE"]
+    return rate > 0 and random.random() < rate
+
+def _start_profile():
+    if not _wants_profile():
+        return
+    profile = cProfile.Profile()
+    try:
+        profile.enable()
+    except ValueError:
+        return  # another profiler is active in this thread
+    g.profile = profile
+    g.profile_started = time.perf_counter()
+
+def _stop_profile(response):
+    profile = g.pop("profile", None)
+    if profile is None:
+        return response
+    profile.disable()
+    wall = time.perf_counter() - g.pop("profile_started")
+
+    try:
+        path = save_profile(profile, request.endpoint or "unknown", wall)
+        if request.headers.get("X-Profile") == "1":
+            response.headers["X-Profile-File"] = os.path.basename(path)
+    except OSError:
+        current_app.logger.exception("could not write profile")
+    return response
+
+def save_profile(profile: cProfile.Profile, endpoint: str, wall: float) -> str:
+    """Write the .prof dump and JSON summary; returns the .prof path."""
+    directory = os.path.join(current_app.config["PROFILE_DIR"], endpoint)
+    os.makedirs(directory, exist_ok=True)
+    stamp = f"{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}-{random.randrange(16 ** 4):04x}"
+    path = os.path.join(directory, f"{stamp}.prof")
+
+    stats = pstats.Stats(profile)
+    stats.dump_stats(path)
+
+    summary = summarize(stats)
+    summary.update({"endpoint": endpoint, "wall_s": round(wall, 6), "method": request.method, "path": request.path})
+    with open(os.path.join(directory, f"{stamp}.json"), "w", encoding="utf-8") as f:
+        json.dump(summary, f, indent=2)
+    return path
+
+def summarize(stats: pstats.Stats, top: int = 25) -> dict:
+    """Time per layer and the slowest functions (by cumulative time)."""
+    layers = dict.fromkeys(LAYERS, 0.0)
+    entries = stats.stats   # func -> (cc, nc, tottime, cumtime, callers)
+
+    for func, (_, _, tottime, _, callers) in entries.items():
+        layers[_layer_of(func, callers)] += tottime
+
+    slowest = sorted(entries.items(), key=lambda item: item[1][3], reverse=True)[:top]
+    return {
+        "total_s": round(stats.total_tt, 6),
+        "layers_s": {layer: round(seconds, 6) for layer, seconds in layers.items()},
+        "slowest": [
+            {
+                "function": f"{_short_path(filename)}:{line}({name})",
+                "calls": nc,
+                "self_s": round(tottime, 6),
+                "cumulative_s": round(cumtime, 6),
+            }
+            for (filename, line, name), (_, nc, tottime, cumtime, _) in slowest
+        ],
+    }
+
+def _layer_of(func, callers) -> str:
+    filename = func[0]
+    if filename == "~" and callers:
+        # Built-ins (socket reads, str methods) belong to their heaviest caller
+        caller = max(callers.items(), key=lambda item: item[1][2])[0]
+        filename = caller[0]
+    return _classify(filename)
+
+def _classify(filename: str) -> str:
+    path = filename.replace("\\", "/")
+    if filename == DB_MODULE or "/pymysql/" in path:
+        return "db"
+    if "/jinja2/" in path or "/markupsafe/" in path or path.endswith(".html"):
+        return "template"
+    if filename.startswith(APP_ROOT):
+        return "app"
+    return "framework"
+
+def report(endpoint: str, top: int = 25) -> dict:
+    """Merge every dump of `endpoint` and average the per-request summaries."""
+    directory = os.path.join(current_app.config["PROFILE_DIR"], endpoint)
+    dumps = sorted(os.path.join(directory, name) for name in os.listdir(directory) if name.endswith(".prof"))
+    if not dumps:
+        raise ValueError(f"No profiles for endpoint '{endpoint}'")
+
+    walls = []
+    for name in os.listdir(directory):
+        if name.endswith(".json"):
+            with open(os.path.join(directory, name), encoding="utf-8") as f:
+                walls.append(json.load(f)["wall_s"])
+
+    merged = summarize(pstats.Stats(*dumps), top)
+    merged.update({
+        "endpoint": endpoint,
+        "requests": len(dumps),
+        "mean_wall_s": round(sum(walls) / len(walls), 6) if walls else None,
+    })
+    return merged
+
+def _short_path(filename: str) -> str:
+    if filename.startswith(APP_ROOT):
+        return "app" + filename[len(APP_ROOT):]
+    parts = filename.replace("\\", "/").split("/site-packages/")
+    return parts[-1]
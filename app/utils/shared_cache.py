@@ -0,0 +1,400 @@
+"""
+Cross-worker shared cache.
+
+A per-process cache is duplicated in every worker, and an invalidation in
+one worker is invisible to the others until a TTL runs out. This cache is
+shared by every process on the host:
+
+- MmapCacheBackend (SHARED_CACHE_PATH set; gunicorn.conf.py sets it): a
+  memory-mapped file of fixed-size slots. Reads are lock-free: a slot's
+  sequence number is odd while a writer is inside it, and a read that saw
+  it change is retried. Writes hold a flock on the file.
+- MemoryCacheBackend (default): this process only.
+- SHARED_CACHE_BACKEND = "package.module:Class": any store implementing
+  the backend interface, e.g. a networked one shared by several hosts.
+
+Entries live in namespaces. `invalidate(namespace)` bumps the namespace's
+generation, which is part of every key, so all of its entries are dropped
+in every process at once.
+
+Usage:
+    doctors = shared_cache.get("doctors:main", "all")       # None on a miss
+    shared_cache.set("doctors:main", "all", rows, ttl=300)  # JSON-serializable values
+    shared_cache.delete("auth_version", "main:42")
+    shared_cache.invalidate("doctors:main")
+
+Invalidate after the change commits (`app.db.after_commit`), otherwise
+another worker may cache the old rows again before the commit.
+"""
+
+import hashlib
+import json
+import logging
+import mmap
+import os
+import struct
+import threading
+import time
+import weakref
+from collections import OrderedDict
+from contextlib import contextmanager
+from importlib import import_module
+
+from app.utils.metrics import inc
+
+logger = logging.getLogger("app.shared_cache")
+
+
+class MemoryCacheBackend:
+    """
+    In-process cache.
+
+    Backend interface (implemented by shared backends too); values are bytes:
+    - get(key) -> bytes or None
+    - set(key, value, ttl) -> bool: ttl in seconds, None = until evicted;
+      False if the value was not stored (e.g. larger than a slot)
+    - delete(key)
+    - counter(key) -> int / incr(key) -> int: counters (0 if unset) that are
+      never evicted, used for namespace generations
+    """
+
+    def __init__(self, app=None, max_entries: int = 50_000):
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._values = OrderedDict()    # key -> (value, expires or None)
+        self._counters = {}
+
+    def get(self, key: str):
+        entry = self._values.get(key)
+        if entry is None or (entry[1] is not None and entry[1] <= time.monotonic()):
+            return None
+        return entry[0]
+
+    def set(self, key: str, value: bytes, ttl: float = None):
+        expires = time.monotonic() + ttl if ttl else None
+        with self._lock:
+            self._values[key] = (value, expires)
+            self._values.move_to_end(key)
+            while len(self._values) > self.max_entries:
+                self._values.popitem(last=False)
+        return True
+
+    def delete(self, key: str):
+        with self._lock:
+            self._values.pop(key, None)
+
+    def counter(self, key: str) -> int:
+        return self._counters.get(key, 0)
+
+    def incr(self, key: str) -> int:
+        with self._lock:
+            value = self._counters[key] = self._counters.get(key, 0) + 1
+            return value
+
+
+# --- Memory-mapped file backend ---
+
+_MAGIC = b"CLNCACH2"
+_HEADER = struct.Struct("<8sIIII")      # magic, small slots, small slot size, large slots, large slot size
+_COUNTER = struct.Struct("<QQ")         # key hash (0 = free), value
+_SLOT = struct.Struct("<IIQdH6x")       # seq, value length, key hash (0 = free), expires (0 = never), key length
+_SEQ = struct.Struct("<I")
+_U64 = struct.Struct("<Q")
+
+_HEADER_SIZE = 64
+_COUNTERS = 4096           # namespace generations (one per doctor calendar)
+SMALL_SLOT = 512            # principal versions and other scalars
+LARGE_SLOT = 64 * 1024      # directories and catalogs
+_READ_RETRIES = 8
+
+_mmap_backends = weakref.WeakSet()
+
+
+def _after_fork():
+    # A flock is shared by every process holding the same open file, so
+    # each worker opens the file again instead of using the master's
+    for backend in list(_mmap_backends):
+        backend._reset()
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_after_fork)
+
+def _hash(key: bytes) -> int:
+    # Stable across processes (unlike hash()); 0 marks a free entry
+    return int.from_bytes(hashlib.blake2b(key, digest_size=8).digest(), "little") or 1
+
+
+class MmapCacheBackend:
+    """
+    Cache in a memory-mapped file shared by the processes of one host.
+
+    Layout: header, a table of namespace counters, then two regions of
+    slots (SMALL_SLOT and LARGE_SLOT bytes). A key may live in one of two
+    slots of the smallest region its value fits in; when both are taken
+    the one expiring first is overwritten. Values larger than a large slot
+    are not cached.
+
+    Starting with a different layout replaces the file; processes still
+    running with the old layout keep using the old one.
+    """
+
+    def __init__(self, app):
+        config = app.config
+        self.path = config["SHARED_CACHE_PATH"]
+        small, large = config["SHARED_CACHE_SLOTS"], config["SHARED_CACHE_LARGE_SLOTS"]
+        self._header = _HEADER.pack(_MAGIC, small, SMALL_SLOT, large, LARGE_SLOT)
+
+        self._counters_at = _HEADER_SIZE
+        offset = self._counters_at + _COUNTERS * _COUNTER.size
+        self._regions = []      # (offset, slots, slot size)
+        for slots, slot_size in ((small, SMALL_SLOT), (large, LARGE_SLOT)):
+            if slots:
+                self._regions.append((offset, slots, slot_size))
+                offset += slots * slot_size
+        self.size = offset
+
+        self._reset()
+        _mmap_backends.add(self)
+        self._map()     # fail at startup, not on the first request
+
+    def _reset(self):
+        # Also runs in forked children: drop the parent's mapping and descriptor
+        if getattr(self, "_mm", None) is not None:
+            self._mm.close()
+            os.close(self._fd)
+        self._lock = threading.Lock()
+        self._fd = self._mm = None
+
+    def _map(self) -> mmap.mmap:
+        mm = self._mm
+        if mm is not None:
+            return mm
+        with self._lock:
+            if self._mm is None:
+                fd = self._open()
+                self._mm = mmap.mmap(fd, self.size)
+                self._fd = fd
+            return self._mm
+
+    def _open(self) -> int:
+        import fcntl
+
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(f"{self.path}.lock", "a") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+            if os.pread(fd, _HEADER.size, 0) != self._header:
+                if os.fstat(fd).st_size:
+                    os.close(fd)
+                    os.unlink(self.path)
+                    fd = os.open(self.path, os.O_RDWR | os.O_CREAT | os.O_EXCL, 0o600)
+                os.ftruncate(fd, self.size)
+                os.pwrite(fd, self._header, 0)
+            return fd
+
+    @contextmanager
+    def _writing(self):
+        import fcntl
+
+        mm = self._map()
+        with self._lock:
+            fcntl.flock(self._fd, fcntl.LOCK_EX)
+            try:
+                yield mm
+            finally:
+                fcntl.flock(self._fd, fcntl.LOCK_UN)
+
+    def _slots(self, key_hash: int):
+        """(offset, slot size) of both candidate slots in every region."""
+        for offset, slots, slot_size in self._regions:
+            first, second = key_hash % slots, (key_hash >> 32) % slots
+            yield offset + first * slot_size, slot_size
+            if second != first:
+                yield offset + second * slot_size, slot_size
+
+    # --- Slots ---
+
+    def get(self, key: str):
+        key_bytes = key.encode()
+        key_hash = _hash(key_bytes)
+        mm = self._map()
+        now = time.time()
+        for offset, slot_size in self._slots(key_hash):
+            value = self._read(mm, offset, slot_size, key_hash, key_bytes, now)
+            if value is not None:
+                return value
+        return None
+
+    def _read(self, mm, offset, slot_size, key_hash, key_bytes, now):
+        data_at = offset + _SLOT.size
+        for _ in range(_READ_RETRIES):
+            seq, length, slot_hash, expires, key_length = _SLOT.unpack_from(mm, offset)
+            if slot_hash != key_hash:
+                return None
+            if seq & 1 or _SLOT.size + key_length + length > slot_size:
+                continue
+            data = mm[data_at:data_at + key_length + length]
+            if _SEQ.unpack_from(mm, offset)[0] != seq:
+                continue
+            if data[:key_length] != key_bytes or (expires and expires <= now):
+                return None
+            return data[key_length:]
+        # Kept changing under us: a miss is always safe
+        return None
+
+    def set(self, key: str, value: bytes, ttl: float = None):
+        key_bytes = key.encode()
+        key_hash = _hash(key_bytes)
+        needed = _SLOT.size + len(key_bytes) + len(value)
+        region_size = next((size for _, _, size in self._regions if needed <= size), None)
+        if region_size is None:
+            return False
+
+        expires = time.time() + ttl if ttl else 0.0
+        with self._writing() as mm:
+            now = time.time()
+            target, candidates = None, []
+            for offset, slot_size in self._slots(key_hash):
+                holds_key = self._holds(mm, offset, key_hash, key_bytes)
+                if slot_size != region_size:
+                    if holds_key:
+                        self._write(mm, offset)     # stale copy in the other region
+                elif holds_key:
+                    target = offset
+                else:
+                    candidates.append(offset)
+            if target is None:
+                target = min(candidates, key=lambda offset: self._keep_score(mm, offset, now))
+            self._write(mm, target, key_hash, expires, key_bytes, value)
+        return True
+
+    def delete(self, key: str):
+        key_bytes = key.encode()
+        key_hash = _hash(key_bytes)
+        with self._writing() as mm:
+            for offset, _ in self._slots(key_hash):
+                if self._holds(mm, offset, key_hash, key_bytes):
+                    self._write(mm, offset)
+
+    @staticmethod
+    def _holds(mm, offset, key_hash, key_bytes) -> bool:
+        _, _, slot_hash, _, key_length = _SLOT.unpack_from(mm, offset)
+        data_at = offset + _SLOT.size
+        return slot_hash == key_hash and mm[data_at:data_at + key_length] == key_bytes
+
+    @staticmethod
+    def _keep_score(mm, offset, now) -> float:
+        """Eviction order: free or expired slots first, then the soonest to expire."""
+        _, _, slot_hash, expires, _ = _SLOT.unpack_from(mm, offset)
+        if not slot_hash or (expires and expires <= now):
+            return 0.0
+        return expires or float("inf")
+
+    @staticmethod
+    def _write(mm, offset, key_hash=0, expires=0.0, key_bytes=b"", value=b""):
+        """Replace a slot (clear it with the defaults). Caller holds the write lock."""
+        seq = _SEQ.unpack_from(mm, offset)[0]
+        # Odd while writing: readers retry
+        _SEQ.pack_into(mm, offset, (seq + 1) & 0xFFFFFFFF)
+        _SLOT.pack_into(mm, offset, (seq + 1) & 0xFFFFFFFF, len(value), key_hash, expires, len(key_bytes))
+        data_at = offset + _SLOT.size
+        mm[data_at:data_at + len(key_bytes) + len(value)] = key_bytes + value
+        _SEQ.pack_into(mm, offset, (seq + 2) & 0xFFFFFFFF)
+
+    # --- Counters ---
+
+    def counter(self, key: str) -> int:
+        mm = self._map()
+        offset, found = self._counter_at(mm, _hash(key.encode()))
+        return _COUNTER.unpack_from(mm, offset)[1] if found else 0
+
+    def incr(self, key: str) -> int:
+        key_hash = _hash(key.encode())
+        with self._writing() as mm:
+            offset, found = self._counter_at(mm, key_hash)
+            value = (_COUNTER.unpack_from(mm, offset)[1] if found else 0) + 1
+            _U64.pack_into(mm, offset + 8, value)
+            if not found:
+                _U64.pack_into(mm, offset, key_hash)
+            return value
+
+    def _counter_at(self, mm, key_hash: int) -> tuple[int, bool]:
+        """
+        Offset of the counter for `key_hash` and whether it exists. If the
+        table is full, keys share their home entry (extra invalidations only).
+        """
+        home = key_hash % _COUNTERS
+        for i in range(_COUNTERS):
+            offset = self._counters_at + (home + i) % _COUNTERS * _COUNTER.size
+            slot_hash = _U64.unpack_from(mm, offset)[0]
+            if slot_hash == key_hash:
+                return offset, True
+            if not slot_hash:
+                return offset, False
+        return self._counters_at + home * _COUNTER.size, True
+
+
+class SharedCache:
+    """
+    Namespaced JSON values on top of a backend (see module docstring).
+
+    Hits and misses are counted per namespace (the part before ":") in
+    clinic_shared_cache_requests_total.
+    """
+
+    def __init__(self):
+        self.backend = MemoryCacheBackend()
+        self._not_stored = set()    # (namespace, key) already logged
+
+    def init_app(self, app):
+        config = app.config
+        backend = config["SHARED_CACHE_BACKEND"]
+        if backend:
+            module_name, _, class_name = backend.partition(":")
+            self.backend = getattr(import_module(module_name), class_name)(app)
+        elif config["SHARED_CACHE_PATH"]:
+            self.backend = MmapCacheBackend(app)
+        else:
+            self.backend = MemoryCacheBackend(app)
+
+    def get(self, namespace: str, key: str, default=None):
+        raw = self.backend.get(self._key(namespace, key))
+        result = "miss"
+        if raw is not None:
+            try:
+                value = json.loads(raw)
+                result = "hit"
+            except ValueError:
+                pass
+        inc("clinic_shared_cache_requests_total", (("namespace", namespace.partition(":")[0]), ("result", result)))
+        return value if result == "hit" else default
+
+    def set(self, namespace: str, key: str, value, ttl: float = None) -> bool:
+        """Store `value`; False (logged once per key) if the backend could not, e.g. too large."""
+        raw = json.dumps(value, separators=(",", ":"), default=str).encode()
+        if self.backend.set(self._key(namespace, key), raw, ttl) is not False:
+            return True
+        if (namespace, key) not in self._not_stored:
+            self._not_stored.add((namespace, key))
+            logger.warning("shared cache: %s/%s not stored (%d bytes); callers reload it every time",
+                           namespace, key, len(raw))
+        return False
+
+    def delete(self, namespace: str, *keys):
+        for key in keys:
+            self.backend.delete(self._key(namespace, key))
+
+    def generation(self, namespace: str) -> int:
+        return self.backend.counter(f"gen:{namespace}")
+
+    def invalidate(self, namespace: str) -> int:
+        """Drop every entry of `namespace` in all processes. Returns the new generation."""
+        return self.backend.incr(f"gen:{namespace}")
+
+    def _key(self, namespace: str, key: str) -> str:
+        return f"{namespace}@{self.generation(namespace)}:{key}"
+
+
+shared_cache = SharedCache()
@@ -0,0 +1,166 @@
+"""
+Write-behind buffers.
+
+Hot request paths record state changes in memory; a daemon thread
+flushes them to MySQL in batches on an interval and once more at
+interpreter shutdown.
+
+Usage:
+    buffer = WriteBehind(persist_fn, interval=5)
+    buffer.init_app(app)
+    buffer.put(user_id, value)
+"""
+
+import atexit
+import os
+import threading
+
+
+class BackgroundFlusher:
+    """
+    Base class for buffers drained by a background thread.
+
+    Subclasses implement:
+    - `_drain()`: atomically take the pending batch (or None)
+    - `_write(batch)`: persist the batch (runs inside an app context)
+    - `_restore(batch)`: put a batch back after a failed write
+    """
+
+    name = "flusher"
+
+    def __init__(self, interval: float = 5.0):
+        self.interval = interval
+        self.app = None
+        self._pid = None
+        self._thread_lock = threading.Lock()
+        self._wakeup = threading.Event()
+
+    def init_app(self, app, interval: float = None):
+        self.app = app
+        if interval is not None:
+            self.interval = interval
+        atexit.register(self.flush_all)
+
+    def wake(self):
+        """Ask the background thread to flush now instead of at the next interval."""
+        self._wakeup.set()
+
+    def flush(self) -> int:
+        """
+        Persist everything buffered so far. Returns the batch size.
+        Safe to call from any thread; failed batches are restored.
+        """
+        if self.app is None:
+            return 0
+
+        batch = self._drain()
+        if not batch:
+            return 0
+
+        size = len(batch)
+        try:
+            with self.app.app_context():
+                self._write(batch)
+        except Exception:
+            self._restore(batch)
+            raise
+        return size
+
+    def flush_all(self) -> int:
+        """Flush until nothing is left (used at shutdown)."""
+        total = 0
+        while True:
+            written = self.flush()
+            if not written:
+                return total
+            total += written
+
+    def _ensure_thread(self):
+        # Threads do not survive fork(): start one per worker process
+        if self.app is None or self._pid == os.getpid():
+            return
+        with self._thread_lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            threading.Thread(target=self._run, name=self.name, daemon=True).start()
+
+    def _run(self):
+        while True:
+            self._wakeup.wait(self.interval)
+            self._wakeup.clear()
+            try:
+                self.flush_all()
+            except Exception:
+                self.app.logger.exception("%s: flush failed, will retry", self.name)
+
+    def _drain(self):
+        raise NotImplementedError
+
+    def _write(self, batch):
+        raise NotImplementedError
+
+    def _restore(self, batch):
+        raise NotImplementedError
+
+
+class WriteBehind(BackgroundFlusher):
+    """
+    Coalescing write-behind buffer keyed by row.
+
+    Only the latest value per key is kept (or `merge(old, new)` when given),
+    so a burst of updates to one row costs a single write at flush time.
+    Keys are scoped to the clinic shard that was current at `put()` time;
+    `write(batch)` receives one clinic's {key: value} dict inside an open
+    transaction on that clinic's database.
+    """
+
+    def __init__(self, write, merge=None, interval: float = 5.0, name: str = "write-behind"):
+        super().__init__(interval)
+        self.name = name
+        self._write_fn = write
+        self._merge = merge
+        self._lock = threading.Lock()
+        self._pending = {}
+
+    def put(self, key, value):
+        from app.db import current_clinic
+
+        key = (current_clinic(), key)
+        with self._lock:
+            if self._merge is not None and key in self._pending:
+                value = self._merge(self._pending[key], value)
+            self._pending[key] = value
+        self._ensure_thread()
+
+    def pending(self) -> int:
+        return len(self._pending)
+
+    def _drain(self):
+        with self._lock:
+            batch, self._pending = self._pending, {}
+        return batch
+
+    def _write(self, batch):
+        from app.db import transaction, use_clinic
+
+        by_clinic = {}
+        for (clinic, key), value in batch.items():
+            by_clinic.setdefault(clinic, {})[key] = value
+
+        for clinic, items in by_clinic.items():
+            with use_clinic(clinic), transaction():
+                self._write_fn(items)
+            # Only unwritten clinics are restored if a later one fails
+            for key in items:
+                del batch[(clinic, key)]
+
+    def _restore(self, batch):
+        with self._lock:
+            for key, value in batch.items():
+                if key in self._pending:
+                    # Newer value already buffered
+                    if self._merge is not None:
+                        self._pending[key] = self._merge(value, self._pending[key])
+                    continue
+                self._pending[key] = value
@@ -0,0 +1,65 @@
+"""
+Process warm-up.
+
+Run once in the master process before workers are forked (gunicorn
+`preload_app`), so every worker starts with:
+- lazily imported modules already imported
+- all Jinja templates compiled and cached
+- the role catalog loaded
+
+Usage:
+    app = create_app()
+    warm_up(app)
+"""
+
+import importlib
+import time
+
+# Modules imported on first use by routes and CLI commands
+LAZY_MODULES = (
+    "app.appointments.archive",
+    "app.appointments.export",
+    "app.dashboards.admin.analytics",
+)
+
+def warm_up(app) -> dict:
+    """
+    Prime caches in the current process. Returns timings in seconds per step.
+    Steps that need the DB are skipped (and reported) if it is unreachable.
+    """
+    timings = {}
+
+    start = time.perf_counter()
+    for module in LAZY_MODULES:
+        importlib.import_module(module)
+    timings["imports"] = time.perf_counter() - start
+
+    # Blueprint template folders must be registered before compiling
+    lazy = app.extensions.get("lazy_blueprints")
+    if lazy is not None:
+        lazy.ensure_registered()
+
+    start = time.perf_counter()
+    templates = app.jinja_env.list_templates(filter_func=lambda name: name.endswith(".html"))
+    for name in templates:
+        app.jinja_env.get_template(name)
+    timings["templates"] = time.perf_counter() - start
+    timings["template_count"] = len(templates)
+
+    start = time.perf_counter()
+    try:
+        from app.auth.catalog import get_role_catalog
+        from app.db import close_pools, use_clinic
+
+        with app.app_context():
+            for clinic in app.config["CLINIC_SHARDS"]:
+                with use_clinic(clinic):
+                    get_role_catalog()
+        # Pooled connections must not be inherited by forked workers
+        close_pools()
+        timings["caches"] = time.perf_counter() - start
+    except Exception as e:
+        app.logger.warning("warm-up: skipped DB caches (%s)", e)
+        timings["caches"] = None
+
+    return timings
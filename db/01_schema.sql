@@ -10,8 +10,10 @@ CREATE TABLE  IF NOT EXISTS `users` (
     `contact_no` VARCHAR(30),
     `is_active` TINYINT(1) NOT NULL DEFAULT 1,
     `last_login` TIMESTAMP NULL DEFAULT NULL,
+    `login_count` INT UNSIGNED NOT NULL DEFAULT 0,
     `failed_logins` INT NOT NULL DEFAULT 0,
     `locked_until` TIMESTAMP NULL DEFAULT NULL,
+    `auth_version` INT UNSIGNED NOT NULL DEFAULT 0,
     `created_by_staff` INT UNSIGNED NULL DEFAULT NULL,
     `created_at` TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
     `updated_at` TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
@@ -32,6 +34,7 @@ CREATE TABLE IF NOT EXISTS `user_details` (
     `postal_code` VARCHAR(20),
     `country` VARCHAR(100),
     PRIMARY KEY (`user_id`),
+    INDEX `idx_ud_name` (`name`),
     CONSTRAINT `fk_ud_user` FOREIGN KEY (`user_id`) REFERENCES `users`(`id`) ON DELETE CASCADE
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
 
@@ -119,6 +122,7 @@ CREATE TABLE IF NOT EXISTS `appointments` (
     `status` ENUM('requested','confirmed','cancelled','completed','no_show') NOT NULL DEFAULT 'requested',
     `notes` TEXT,
     `created_by_staff` INT UNSIGNED,
+    `reminded_at` TIMESTAMP NULL DEFAULT NULL,
     `deleted_at` TIMESTAMP NULL DEFAULT NULL,
     `created_at` TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
     `updated_at` TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
@@ -126,9 +130,88 @@ CREATE TABLE IF NOT EXISTS `appointments` (
     CONSTRAINT `fk_appointments_patient` FOREIGN KEY (`patient_id`) REFERENCES `users`(`id`),
     CONSTRAINT `fk_appointments_doctor` FOREIGN KEY (`doctor_id`) REFERENCES `users`(`id`),
     CONSTRAINT `fk_appointments_staff` FOREIGN KEY (`created_by_staff`) REFERENCES `users`(`id`), 
-    INDEX `idx_appointments_patient` (`patient_id`),
     INDEX `idx_appointments_doctor` (`doctor_id`),
-    INDEX `idx_appointments_staff` (`created_by_staff`),
     INDEX `idx_appointments_at` (`appointment_timestamp`),
-    INDEX `cidx_appointments_doctor_at` (`doctor_id`, `appointment_timestamp`)
-) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
\ No newline at end of file
+    -- Listing filters (app/appointments/query.py): equality prefix + time range
+    INDEX `cidx_appointments_doctor_at` (`doctor_id`, `appointment_timestamp`),
+    INDEX `cidx_appointments_patient_at` (`patient_id`, `appointment_timestamp`),
+    INDEX `cidx_appointments_staff_at` (`created_by_staff`, `appointment_timestamp`),
+    INDEX `cidx_appointments_status_at` (`status`, `appointment_timestamp`)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+
+-- Appointments Archive (finalized appointments past the archive horizon)
+-- Same columns as `appointments`; rows are immutable once moved here.
+
+CREATE TABLE IF NOT EXISTS `appointments_archive` (
+    `id` INT UNSIGNED NOT NULL,
+    `patient_id` INT UNSIGNED NOT NULL,
+    `doctor_id` INT UNSIGNED NOT NULL,
+    `appointment_timestamp` TIMESTAMP NOT NULL,
+    `arrival_timestamp` TIMESTAMP NULL DEFAULT NULL,
+    `status` ENUM('requested','confirmed','cancelled','completed','no_show') NOT NULL,
+    `notes` TEXT,
+    `created_by_staff` INT UNSIGNED,
+    `deleted_at` TIMESTAMP NULL DEFAULT NULL,
+    `created_at` TIMESTAMP NOT NULL,
+    `updated_at` TIMESTAMP NOT NULL,
+    `archived_at` TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (`id`),
+    INDEX `idx_appointments_archive_at` (`appointment_timestamp`),
+    INDEX `cidx_appointments_archive_doctor_at` (`doctor_id`, `appointment_timestamp`),
+    INDEX `cidx_appointments_archive_patient_at` (`patient_id`, `appointment_timestamp`),
+    INDEX `cidx_appointments_archive_staff_at` (`created_by_staff`, `appointment_timestamp`),
+    INDEX `cidx_appointments_archive_status_at` (`status`, `appointment_timestamp`)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+
+-- Audit Log (appointment status and role changes)
+
+CREATE TABLE IF NOT EXISTS `audit_log` (
+    `id` BIGINT UNSIGNED NOT NULL AUTO_INCREMENT,
+    `actor_id` INT UNSIGNED NULL,
+    `action` VARCHAR(60) NOT NULL,
+    `entity` VARCHAR(30) NOT NULL,
+    `entity_id` INT UNSIGNED NOT NULL,
+    `details` JSON,
+    `created_at` TIMESTAMP(3) NOT NULL,
+    PRIMARY KEY (`id`),
+    INDEX `cidx_audit_entity` (`entity`, `entity_id`),
+    INDEX `idx_audit_actor` (`actor_id`),
+    INDEX `idx_audit_created` (`created_at`)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+
+-- Idempotency keys (retried create requests return the original result)
+
+CREATE TABLE IF NOT EXISTS `idempotency_keys` (
+    `user_id` INT UNSIGNED NOT NULL,
+    `scope` VARCHAR(40) NOT NULL,
+    `idem_key` VARCHAR(64) NOT NULL,
+    `result_id` INT UNSIGNED NULL DEFAULT NULL,
+    `created_at` TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    `expires_at` TIMESTAMP NOT NULL,
+    PRIMARY KEY (`user_id`, `scope`, `idem_key`),
+    INDEX `idx_idempotency_expires` (`expires_at`)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+
+-- Waitlist (cancelled slots are offered to or booked for the best waiting patient)
+
+CREATE TABLE IF NOT EXISTS `waitlist` (
+    `id` INT UNSIGNED NOT NULL AUTO_INCREMENT,
+    `patient_id` INT UNSIGNED NOT NULL,
+    `doctor_id` INT UNSIGNED NULL DEFAULT NULL,
+    `specialization` VARCHAR(255) NULL DEFAULT NULL,
+    `earliest_date` DATE NOT NULL,
+    `latest_date` DATE NOT NULL,
+    `priority` TINYINT UNSIGNED NOT NULL DEFAULT 0,
+    `status` ENUM('waiting','offered','booked','cancelled') NOT NULL DEFAULT 'waiting',
+    `offered_doctor_id` INT UNSIGNED NULL DEFAULT NULL,
+    `offered_timestamp` TIMESTAMP NULL DEFAULT NULL,
+    `appointment_id` INT UNSIGNED NULL DEFAULT NULL,
+    `created_at` TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    `updated_at` TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+    PRIMARY KEY (`id`),
+    CONSTRAINT `fk_waitlist_patient` FOREIGN KEY (`patient_id`) REFERENCES `users`(`id`),
+    CONSTRAINT `fk_waitlist_doctor` FOREIGN KEY (`doctor_id`) REFERENCES `users`(`id`),
+    INDEX `idx_waitlist_patient` (`patient_id`),
+    INDEX `cidx_waitlist_status_latest` (`status`, `latest_date`),
+    INDEX `idx_waitlist_updated` (`updated_at`)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
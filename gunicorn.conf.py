@@ -0,0 +1,82 @@
+"""
+Gunicorn configuration.
+
+    gunicorn -c gunicorn.conf.py wsgi:app
+
+Settings come from the environment:
+- WEB_BIND     (default 0.0.0.0:8000)
+- WEB_WORKERS  (default 2 x CPUs + 1)
+- WEB_THREADS  (default 4; >1 uses the gthread worker)
+- WEB_TIMEOUT  (default 30 seconds)
+- METRICS_DIR  (default ./metrics; per-worker snapshots merged by /metrics)
+- SHARED_CACHE_PATH (default ./cache/shared_cache.bin; mmap file shared by workers)
+"""
+
+import glob
+import multiprocessing
+import os
+
+bind = os.getenv("WEB_BIND", "0.0.0.0:8000")
+workers = int(os.getenv("WEB_WORKERS", multiprocessing.cpu_count() * 2 + 1))
+threads = int(os.getenv("WEB_THREADS", 4))
+worker_class = "gthread" if threads > 1 else "sync"
+timeout = int(os.getenv("WEB_TIMEOUT", 30))
+graceful_timeout = 30
+
+# Import, create and warm up the app once in the master; workers fork warm
+preload_app = True
+
+# Recycle workers occasionally to bound memory growth
+max_requests = int(os.getenv("WEB_MAX_REQUESTS", 5000))
+max_requests_jitter = max_requests // 10
+
+accesslog = "-"
+
+# Workers share metrics through snapshot files (read by app.config at preload)
+os.environ.setdefault("METRICS_DIR", "metrics")
+
+# Workers share principal versions, the role catalog and the doctor directory
+os.environ.setdefault("SHARED_CACHE_PATH", os.path.join("cache", "shared_cache.bin"))
+
+
+def on_starting(server):
+    # Counters start from zero with each server start. Only snapshot files:
+    # METRICS_DIR is operator-configured and may hold anything else.
+    directory = os.environ["METRICS_DIR"]
+    for path in glob.glob(os.path.join(directory, "*.json")) + [os.path.join(directory, ".lock")]:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+    # So does the shared cache (the database may have changed meanwhile)
+    for suffix in ("", ".lock"):
+        try:
+            os.remove(os.environ["SHARED_CACHE_PATH"] + suffix)
+        except FileNotFoundError:
+            pass
+
+
+def post_fork(server, worker):
+    # Per-process state (connection pools, background writers) is created
+    # lazily per pid, so nothing inherited from the master is reused here.
+    server.log.info("worker %s ready", worker.pid)
+
+
+def worker_exit(server, worker):
+    # Drain write-behind buffers and the audit queue, then save final metrics
+    from app.audit.service import audit_log
+    from app.auth.activity import login_activity
+    from app.auth.throttle import login_throttle
+    from app.utils.metrics import write_snapshot
+
+    for flusher in (audit_log, login_throttle.persist, login_activity):
+        try:
+            flusher.flush_all()
+        except Exception:
+            server.log.exception("flush on worker exit failed")
+
+    # Last, so the flushes above are counted too
+    try:
+        write_snapshot(os.environ["METRICS_DIR"])
+    except Exception:
+        server.log.exception("final metrics snapshot failed")
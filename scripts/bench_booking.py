@@ -0,0 +1,188 @@
+"""
+Booking benchmark: per-appointment latency and DB load of `create_appointment_for`.
+
+Books `--bookings` appointments as the seed receptionist (see
+app/seed/seed_dev.py) from `--concurrency` threads, twice:
+- legacy   the previous path: user name lookup, two role-check SELECTs,
+           then BEGIN / INSERT / COMMIT
+- current  `create_appointment_for` (one INSERT ... SELECT plus COMMIT)
+
+For each it reports booking latency (mean, p50, p95, p99), throughput and
+statements sent to MySQL per booking (the session `Questions` counter).
+The appointments it creates are deleted afterwards.
+
+Needs a seeded database (`flask seed` with FLASK_ENV=development).
+
+Usage:
+    python scripts/bench_booking.py --bookings 500 --concurrency 8
+    python scripts/bench_booking.py --output booking.json
+"""
+
+import argparse
+import json
+import os
+import statistics
+import sys
+import threading
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import create_app
+from app.appointments.service import create_appointment_for
+from app.auth.catalog import get_role_catalog
+from app.auth.models import User
+from app.db import close_db, execute, execute_commit, fetchall, fetchone, get_db, transaction, use_clinic
+
+
+def legacy_create(user, data: dict) -> int:
+    """The booking path before the single-statement insert (receptionist branch)."""
+    row = fetchone("SELECT id FROM users WHERE user_name = %s", (data["user_name"],))
+    if not row:
+        raise ValueError("Patient not found")
+    patient_id, doctor_id = row["id"], int(data["doctor_id"])
+    for user_id, role_name in ((patient_id, "patient"), (doctor_id, "doctor")):
+        if not fetchone(
+            """
+            SELECT 1 FROM user_roles ur JOIN roles r ON r.id = ur.role_id
+            WHERE ur.user_id = %s AND r.name = %s LIMIT 1
+            """,
+            (user_id, role_name)
+        ):
+            raise ValueError(f"Selected {role_name} is not valid")
+    at = datetime.strptime(f"{data['appt_date']} {data['appt_time']}", "%Y-%m-%d %H:%M")
+    with transaction():
+        _, appointment_id = execute(
+            """
+            INSERT INTO appointments (patient_id, doctor_id, appointment_timestamp, status, notes, created_by_staff)
+            VALUES (%s, %s, %s, %s, %s, %s)
+            """,
+            (patient_id, doctor_id, at, "confirmed", data["notes"], user.id)
+        )
+    return appointment_id
+
+def questions() -> int:
+    with get_db().cursor() as cursor:
+        cursor.execute("SHOW SESSION STATUS LIKE 'Questions'")
+        return int(cursor.fetchone()["Value"])
+
+def run(app, clinic: str, create, user, bookings: int, concurrency: int, patients, doctor_id: int) -> dict:
+    latencies, statements, created, errors = [], [], [], []
+    lock = threading.Lock()
+    counter = iter(range(bookings))
+    base = datetime.now().replace(second=0, microsecond=0) + timedelta(days=400)
+
+    def worker():
+        with app.app_context(), use_clinic(clinic):
+            while True:
+                with lock:
+                    n = next(counter, None)
+                if n is None:
+                    return
+                at = base + timedelta(minutes=15 * n)
+                data = {
+                    "user_name": patients[n % len(patients)],
+                    "doctor_id": str(doctor_id),
+                    "appt_date": at.strftime("%Y-%m-%d"),
+                    "appt_time": at.strftime("%H:%M"),
+                    "notes": "bench_booking",
+                }
+                before = questions()
+                started = time.perf_counter()
+                try:
+                    appointment_id = create(user, data)
+                except ValueError as e:
+                    with lock:
+                        errors.append(str(e))
+                    continue
+                elapsed = time.perf_counter() - started
+                # -1: the SHOW STATUS itself is counted
+                sent = questions() - before - 1
+                with lock:
+                    latencies.append(elapsed)
+                    statements.append(sent)
+                    created.append(appointment_id)
+
+    started = time.perf_counter()
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    wall = time.perf_counter() - started
+
+    with app.app_context(), use_clinic(clinic):
+        for i in range(0, len(created), 500):
+            ids = created[i:i + 500]
+            execute_commit(f"DELETE FROM appointments WHERE id IN ({', '.join(['%s'] * len(ids))})", ids)
+
+    latencies.sort()
+
+    def quantile(q):
+        if not latencies:
+            return None
+        return round(latencies[min(len(latencies) - 1, int(q * len(latencies)))] * 1000, 3)
+
+    return {
+        "bookings": len(latencies),
+        "errors": len(errors),
+        "throughput_per_s": round(len(latencies) / wall, 1) if wall else None,
+        "mean_ms": round(statistics.fmean(latencies) * 1000, 3) if latencies else None,
+        "p50_ms": quantile(0.50),
+        "p95_ms": quantile(0.95),
+        "p99_ms": quantile(0.99),
+        "statements_per_booking": round(statistics.fmean(statements), 2) if statements else None,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--bookings", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--clinic", default=None, help="Clinic shard (default: DEFAULT_CLINIC).")
+    parser.add_argument("--staff", default="st_cr_ron", help="Receptionist user name to book as.")
+    parser.add_argument("--doctor", default="dr_khan", help="Doctor user name.")
+    parser.add_argument("--output", help="Write the JSON report here as well.")
+    args = parser.parse_args()
+
+    app = create_app()
+    clinic = args.clinic or app.config["DEFAULT_CLINIC"]
+    with app.app_context(), use_clinic(clinic):
+        staff = fetchone("SELECT id, user_name, email FROM users WHERE user_name = %s", (args.staff,))
+        doctor = fetchone("SELECT id FROM users WHERE user_name = %s", (args.doctor,))
+        if not staff or not doctor:
+            sys.exit("Seed users not found: run `flask seed` in development first")
+        role_ids = [r["role_id"] for r in fetchall("SELECT role_id FROM user_roles WHERE user_id = %s", (staff["id"],))]
+        catalog = get_role_catalog()
+        user = User.from_row(staff, catalog.roles_for(role_ids), catalog.permissions_for(role_ids))
+        patients = [r["user_name"] for r in fetchall(
+            """
+            SELECT u.user_name FROM users u
+            JOIN user_roles ur ON ur.user_id = u.id
+            WHERE ur.role_id = %s
+            ORDER BY u.id LIMIT 50
+            """,
+            (catalog.id_of("patient"),)
+        )]
+        close_db()
+
+    report = {"config": vars(args)}
+    for name, create in (("legacy", legacy_create), ("current", create_appointment_for)):
+        report[name] = run(app, clinic, create, user, args.bookings, args.concurrency, patients, doctor["id"])
+
+    legacy, current = report["legacy"], report["current"]
+    if legacy["p50_ms"] and current["p50_ms"]:
+        report["change"] = {
+            "p50": f"{(current['p50_ms'] / legacy['p50_ms'] - 1) * 100:+.1f}%",
+            "p95": f"{(current['p95_ms'] / legacy['p95_ms'] - 1) * 100:+.1f}%",
+            "statements_per_booking": round(current["statements_per_booking"] - legacy["statements_per_booking"], 2),
+        }
+
+    output = json.dumps(report, indent=2, sort_keys=True)
+    print(output)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(output + "\n")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+"""
+Startup benchmark: cold start and first-request latency.
+
+Each run starts a fresh interpreter and measures:
+- import_s         `import app`
+- create_app_s     `create_app()`
+- warm_up_s        `warm_up(app)`
+- first_request_s  first GET of each path through the test client, after warm-up
+
+Prints JSON (median/max per metric) and exits 1 if a bound is exceeded.
+
+Usage:
+    python scripts/bench_startup.py --runs 5 --max-cold-start 3.0 --max-first-request 0.25
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+CHILD = r"""
+import json, sys, time
+t0 = time.perf_counter()
+import app as app_module
+t1 = time.perf_counter()
+application = app_module.create_app()
+t2 = time.perf_counter()
+if "--no-warmup" not in sys.argv:
+    from app.warmup import warm_up
+    warm_up(application)
+t3 = time.perf_counter()
+client = application.test_client()
+first = {}
+for path in sys.argv[1].split(","):
+    start = time.perf_counter()
+    client.get(path)
+    first[path] = time.perf_counter() - start
+print(json.dumps({
+    "import_s": t1 - t0,
+    "create_app_s": t2 - t1,
+    "warm_up_s": t3 - t2,
+    "first_request_s": max(first.values()),
+    "first_request_by_path": first,
+}))
+"""
+
+def run_once(paths: list[str], warmup: bool) -> dict:
+    args = [sys.executable, "-c", CHILD, ",".join(paths)]
+    if not warmup:
+        args.append("--no-warmup")
+    output = subprocess.run(args, cwd=ROOT, check=True, capture_output=True, text=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--paths", default="/,/auth/login", help="Comma-separated paths for the first request.")
+    parser.add_argument("--no-warmup", action="store_true", help="Measure without warm_up().")
+    parser.add_argument("--max-cold-start", type=float, default=None, help="Bound on import + create_app + warm-up (s).")
+    parser.add_argument("--max-first-request", type=float, default=None, help="Bound on first request latency (s).")
+    args = parser.parse_args()
+
+    runs = [run_once(args.paths.split(","), not args.no_warmup) for _ in range(args.runs)]
+    for run in runs:
+        run["cold_start_s"] = run["import_s"] + run["create_app_s"] + run["warm_up_s"]
+
+    report = {}
+    for metric in ("import_s", "create_app_s", "warm_up_s", "cold_start_s", "first_request_s"):
+        values = [run[metric] for run in runs]
+        report[metric] = {"median": statistics.median(values), "max": max(values)}
+
+    failures = []
+    if args.max_cold_start is not None and report["cold_start_s"]["median"] > args.max_cold_start:
+        failures.append(f"cold start {report['cold_start_s']['median']:.3f}s > {args.max_cold_start}s")
+    if args.max_first_request is not None and report["first_request_s"]["median"] > args.max_first_request:
+        failures.append(f"first request {report['first_request_s']['median']:.3f}s > {args.max_first_request}s")
+    report["failures"] = failures
+
+    print(json.dumps(report, indent=2))
+    sys.exit(1 if failures else 0)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+"""
+Import-time profile of `create_app()`.
+
+Runs `python -X importtime` in a fresh interpreter, parses the report and
+prints the total plus the slowest modules (cumulative time). Exits 1 when
+the total exceeds `--max-ms` or a module listed with `--forbid` is imported
+at startup, so it can run as a regression check (tests/test_startup_imports.py
+runs it for LAZY_BLUEPRINTS=1).
+
+Usage:
+    python scripts/importtime.py --max-ms 800 --forbid numpy --forbid app.dashboards.admin.analytics
+    LAZY_BLUEPRINTS=1 python scripts/importtime.py --top 30
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Prints every loaded module: import_module() calls are missing from the -X importtime report
+CHILD = "import json, sys; from app import create_app; create_app(); print(json.dumps(sorted(sys.modules)))"
+
+
+def profile_imports() -> tuple[list[dict], set[str]]:
+    """
+    Return ([{module, self_us, cumulative_us, depth}] in import order, the
+    names of all modules loaded after create_app()).
+    """
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", CHILD],
+        cwd=ROOT, capture_output=True, text=True
+    )
+    if result.returncode != 0:
+        sys.stderr.write(result.stderr)
+        raise SystemExit(f"create_app() failed (exit {result.returncode})")
+
+    modules = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        modules.append({
+            "module": name.strip(),
+            "self_us": int(self_us),
+            "cumulative_us": int(cumulative_us),
+            "depth": (len(name) - len(name.lstrip())) // 2,
+        })
+    return modules, set(json.loads(result.stdout.strip().splitlines()[-1]))
+
+
+def forbidden_imports(imported: set[str], names: list[str]) -> list[str]:
+    """The `names` among the loaded modules, as modules or packages."""
+    return sorted(
+        name for name in names
+        if name in imported or any(module.startswith(name + ".") for module in imported)
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--top", type=int, default=20, help="Number of slowest modules to report.")
+    parser.add_argument("--max-ms", type=float, help="Fail if total import time exceeds this many ms.")
+    parser.add_argument("--forbid", action="append", default=[], help="Module that must not be imported at startup.")
+    args = parser.parse_args()
+
+    modules, imported = profile_imports()
+    # Top-level entries (depth 0) partition the total
+    total_ms = sum(m["cumulative_us"] for m in modules if m["depth"] == 0) / 1000
+    slowest = sorted(modules, key=lambda m: m["cumulative_us"], reverse=True)[: args.top]
+
+    forbidden = forbidden_imports(imported, args.forbid)
+
+    print(json.dumps({
+        "total_ms": round(total_ms, 1),
+        "modules": len(modules),
+        "app_modules": sorted(name for name in imported if name == "app" or name.startswith("app.")),
+        "slowest": [
+            {"module": m["module"], "cumulative_ms": round(m["cumulative_us"] / 1000, 1),
+             "self_ms": round(m["self_us"] / 1000, 1)}
+            for m in slowest
+        ],
+        "forbidden_imported": forbidden,
+    }, indent=2))
+
+    failed = False
+    if args.max_ms is not None and total_ms > args.max_ms:
+        print(f"FAIL total import time {total_ms:.1f} ms > {args.max_ms} ms", file=sys.stderr)
+        failed = True
+    for name in forbidden:
+        print(f"FAIL {name} is imported at startup", file=sys.stderr)
+        failed = True
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,327 @@
+"""
+Load generator: drives a realistic request mix against a running app.
+
+Virtual users log in as the seed users (see app/seed/seed_dev.py) and
+loop over weighted actions their role may perform:
+- login          log out and log in again (all)
+- list           GET /appointments/list (all)
+- create         POST /appointments/create (patients, receptionist)
+- status         POST /appointments/update_status on a listed appointment (receptionist)
+- create_user    POST /users/create_user (receptionist)
+
+Users start over `--ramp` seconds up to `--concurrency`, then run until
+`--duration` has elapsed. Redirects are not followed, so each sample is
+one request.
+
+The JSON report (sorted keys, diff-friendly) has throughput plus
+p50/p95/p99 and a latency histogram (ms buckets, `le` = upper bound) per
+endpoint and overall. `--baseline` prints p95/throughput deltas against
+an earlier report.
+
+The login throttle limits bursts per client IP: start the app with e.g.
+LOGIN_IP_BURST=1000 LOGIN_IP_RATE=100 when testing from one machine.
+
+Usage:
+    python scripts/loadgen.py --base-url http://127.0.0.1:5000 --concurrency 20 --ramp 10 --duration 60 --output load.json
+    python scripts/loadgen.py --mix list=70,create=20,status=10 --baseline load.json
+"""
+
+import argparse
+import bisect
+import itertools
+import json
+import math
+import random
+import re
+import subprocess
+import sys
+import threading
+import time
+import uuid
+from http.cookiejar import CookieJar
+from urllib.error import HTTPError, URLError
+from urllib.parse import urlencode
+from urllib.request import HTTPCookieProcessor, HTTPRedirectHandler, Request, build_opener
+
+# Seed users: (user_name, password, persona)
+SEED_USERS = [
+    ("admin", "admin", "admin"),
+    ("st_cr_ron", "st_cr_ron", "receptionist"),
+    ("dr_john", "dr_john", "doctor"),
+    ("dr_smith", "dr_smith", "doctor"),
+    ("dr_khan", "dr_khan", "doctor"),
+    ("pat_rahul", "pat_rahul", "patient"),
+    ("pat_anjali", "pat_anjali", "patient"),
+    ("pat_karan", "pat_karan", "patient"),
+    ("pat_sneha", "pat_sneha", "patient"),
+    ("pat_mohan", "pat_mohan", "patient"),
+]
+PATIENTS = [user_name for user_name, _, persona in SEED_USERS if persona == "patient"]
+
+ACTIONS_BY_PERSONA = {
+    "admin": {"login", "list", "create", "status", "create_user"},
+    "receptionist": {"login", "list", "create", "status", "create_user"},
+    "doctor": {"login", "list"},
+    "patient": {"login", "list", "create"},
+}
+
+DEFAULT_MIX = "login=5,list=50,create=20,status=15,create_user=10"
+
+# Histogram bucket upper bounds (ms)
+BUCKETS_MS = [5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, math.inf]
+
+APPOINTMENT_ID = re.compile(r'name="appointment_id" value="(\d+)"')
+
+
+class _NoRedirect(HTTPRedirectHandler):
+    def redirect_request(self, *args, **kwargs):
+        return None
+
+
+class Recorder:
+    """Thread-safe latency samples per endpoint."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.samples = {}    # endpoint -> [seconds]
+        self.statuses = {}   # endpoint -> {status: count}
+
+    def add(self, endpoint: str, seconds: float, status):
+        with self._lock:
+            self.samples.setdefault(endpoint, []).append(seconds)
+            counts = self.statuses.setdefault(endpoint, {})
+            counts[str(status)] = counts.get(str(status), 0) + 1
+
+
+class VirtualUser(threading.Thread):
+    def __init__(self, base_url, account, mix, recorder, stop_at, think_time, doctor_ids, clinic):
+        super().__init__(daemon=True)
+        self.base_url = base_url.rstrip("/")
+        self.user_name, self.password, self.persona = account
+        allowed = ACTIONS_BY_PERSONA[self.persona]
+        self.actions = [(name, weight) for name, weight in mix if name in allowed]
+        self.recorder = recorder
+        self.stop_at = stop_at
+        self.think_time = think_time
+        self.doctor_ids = doctor_ids
+        self.clinic = clinic
+        self.opener = build_opener(HTTPCookieProcessor(CookieJar()), _NoRedirect())
+        self.appointment_ids = []
+
+    def request(self, endpoint, method, path, form=None, headers=None):
+        data = urlencode(form).encode() if form is not None else None
+        req = Request(self.base_url + path, data=data, method=method, headers=headers or {})
+        if self.clinic:
+            req.add_header("X-Clinic", self.clinic)
+        start = time.perf_counter()
+        try:
+            with self.opener.open(req, timeout=30) as response:
+                body = response.read()
+                status = response.status
+        except HTTPError as e:
+            body = e.read()
+            status = e.code
+        except (URLError, OSError) as e:
+            body = b""
+            status = type(e).__name__
+        self.recorder.add(endpoint, time.perf_counter() - start, status)
+        return status, body
+
+    def login(self):
+        self.request("POST /auth/logout", "POST", "/auth/logout")
+        status, _ = self.request(
+            "POST /auth/login", "POST", "/auth/login",
+            {"user_name": self.user_name, "password": self.password}
+        )
+        return status == 302
+
+    def run(self):
+        if not self.actions or not self.login():
+            return
+        names = [name for name, _ in self.actions]
+        weights = [weight for _, weight in self.actions]
+        while time.monotonic() < self.stop_at:
+            getattr(self, f"do_{random.choices(names, weights)[0]}")()
+            if self.think_time:
+                time.sleep(random.expovariate(1 / self.think_time))
+
+    def do_login(self):
+        self.login()
+
+    def do_list(self):
+        _, body = self.request("GET /appointments/list", "GET", "/appointments/list")
+        ids = APPOINTMENT_ID.findall(body.decode("utf-8", "replace"))
+        if ids:
+            self.appointment_ids = ids[:200]
+
+    def do_create(self):
+        day = time.strftime("%Y-%m-%d", time.localtime(time.time() + random.randint(1, 60) * 86400))
+        form = {
+            "doctor_id": random.choice(self.doctor_ids),
+            "appt_date": day,
+            "appt_time": f"{random.randint(9, 17):02d}:{random.choice(['00', '30'])}",
+            "notes": "loadgen",
+        }
+        if self.persona != "patient":
+            form["user_name"] = random.choice(PATIENTS)
+        self.request(
+            "POST /appointments/create", "POST", "/appointments/create", form,
+            {"Idempotency-Key": uuid.uuid4().hex}
+        )
+
+    def do_status(self):
+        if not self.appointment_ids:
+            return self.do_list()
+        self.request(
+            "POST /appointments/update_status", "POST", "/appointments/update_status",
+            {
+                "appointment_id": random.choice(self.appointment_ids),
+                "status": random.choice(["confirmed", "cancelled", "no_show", "completed"]),
+                "notes": "loadgen",
+            }
+        )
+
+    def do_create_user(self):
+        suffix = uuid.uuid4().hex[:12]
+        self.request(
+            "POST /users/create_user", "POST", "/users/create_user",
+            {"name": f"Load {suffix}", "user_name": f"lg_{suffix}", "email": f"lg_{suffix}@example.com"},
+            {"Idempotency-Key": uuid.uuid4().hex}
+        )
+
+
+def summarize(samples: list[float], statuses: dict, elapsed: float) -> dict:
+    ms = sorted(s * 1000 for s in samples)
+
+    def percentile(p):
+        return round(ms[min(len(ms) - 1, max(0, math.ceil(p / 100 * len(ms)) - 1))], 2)
+
+    # Per-bucket (not cumulative) counts; `ms` is sorted
+    histogram, below = [], 0
+    for bound in BUCKETS_MS:
+        upto = bisect.bisect_right(ms, bound)
+        histogram.append({"le": "inf" if bound == math.inf else bound, "count": upto - below})
+        below = upto
+
+    errors = sum(
+        count for status, count in statuses.items()
+        if not (status.isdigit() and int(status) < 400)
+    )
+    return {
+        "requests": len(ms),
+        "throughput_rps": round(len(ms) / elapsed, 2),
+        "errors": errors,
+        "status": dict(sorted(statuses.items())),
+        "latency_ms": {
+            "mean": round(sum(ms) / len(ms), 2),
+            "p50": percentile(50),
+            "p95": percentile(95),
+            "p99": percentile(99),
+            "max": round(ms[-1], 2),
+        },
+        "histogram_ms": histogram,
+    }
+
+
+def compare(report: dict, baseline: dict):
+    print(f"{'endpoint':40} {'p95 ms':>10} {'base':>10} {'delta':>8} {'rps':>8} {'base':>8}", file=sys.stderr)
+    for name, current in sorted(report["endpoints"].items()) + [("TOTAL", report["total"])]:
+        before = baseline["total"] if name == "TOTAL" else baseline["endpoints"].get(name)
+        if not before:
+            continue
+        p95, base_p95 = current["latency_ms"]["p95"], before["latency_ms"]["p95"]
+        delta = f"{(p95 - base_p95) / base_p95 * 100:+.0f}%" if base_p95 else "n/a"
+        print(
+            f"{name:40} {p95:>10} {base_p95:>10} {delta:>8} "
+            f"{current['throughput_rps']:>8} {before['throughput_rps']:>8}",
+            file=sys.stderr
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--base-url", default="http://127.0.0.1:5000")
+    parser.add_argument("--concurrency", type=int, default=10, help="Virtual users at full load.")
+    parser.add_argument("--ramp", type=float, default=5.0, help="Seconds to start all virtual users.")
+    parser.add_argument("--duration", type=float, default=30.0, help="Total run time in seconds (including ramp).")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help="Action weights, e.g. list=50,create=20.")
+    parser.add_argument("--think-time", type=float, default=0.0, help="Mean pause between actions (s).")
+    parser.add_argument("--doctor-ids", default="2,3,4", help="Doctor user ids for created appointments.")
+    parser.add_argument("--clinic", help="Send X-Clinic with every request.")
+    parser.add_argument("--seed", type=int, help="Random seed for a repeatable mix.")
+    parser.add_argument("--output", help="Write the JSON report here (default: stdout).")
+    parser.add_argument("--baseline", help="Earlier JSON report to compare against.")
+    args = parser.parse_args()
+
+    if args.seed is not None:
+        random.seed(args.seed)
+    mix = [(name, float(weight)) for name, weight in (item.split("=") for item in args.mix.split(","))]
+    unknown = {name for name, _ in mix} - set().union(*ACTIONS_BY_PERSONA.values())
+    if unknown:
+        parser.error(f"unknown actions in --mix: {', '.join(sorted(unknown))}")
+
+    recorder = Recorder()
+    started = time.monotonic()
+    stop_at = started + args.duration
+    accounts = itertools.cycle(SEED_USERS)
+    users = []
+    for i in range(args.concurrency):
+        user = VirtualUser(
+            args.base_url, next(accounts), mix, recorder, stop_at,
+            args.think_time, args.doctor_ids.split(","), args.clinic
+        )
+        user.start()
+        users.append(user)
+        if args.concurrency > 1 and i < args.concurrency - 1:
+            time.sleep(args.ramp / (args.concurrency - 1))
+    for user in users:
+        user.join()
+    elapsed = time.monotonic() - started
+
+    if not recorder.samples:
+        sys.exit("No requests completed; is the app running at --base-url?")
+
+    all_samples = [s for samples in recorder.samples.values() for s in samples]
+    all_statuses = {}
+    for statuses in recorder.statuses.values():
+        for status, count in statuses.items():
+            all_statuses[status] = all_statuses.get(status, 0) + count
+
+    try:
+        revision = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True
+        ).stdout.strip() or None
+    except OSError:
+        revision = None
+
+    report = {
+        "meta": {
+            "base_url": args.base_url,
+            "concurrency": args.concurrency,
+            "ramp_s": args.ramp,
+            "duration_s": round(elapsed, 2),
+            "mix": dict(mix),
+            "revision": revision,
+            "started_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        },
+        "total": summarize(all_samples, all_statuses, elapsed),
+        "endpoints": {
+            name: summarize(samples, recorder.statuses[name], elapsed)
+            for name, samples in sorted(recorder.samples.items())
+        },
+    }
+
+    output = json.dumps(report, indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            compare(report, json.load(f))
+
+
+if __name__ == "__main__":
+    main()
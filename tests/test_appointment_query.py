@@ -0,0 +1,106 @@
+"""
+Appointment listing SQL for every filter combination, without a database.
+
+Checks the statements `list_appointments_for` sends (via the same builder)
+and that each one forces a `(driving column, appointment_timestamp)` index
+that exists in db/01_schema.sql. `flask appointments explain` checks the
+live plans.
+"""
+
+import re
+from datetime import datetime
+from pathlib import Path
+
+import pytest
+
+from app.appointments.query import EQUALITY_FILTERS, AppointmentQuery, filter_combinations
+from app.appointments.service import FULL_VIEW_QUERY
+
+SCHEMA = Path(__file__).resolve().parents[1] / "db" / "01_schema.sql"
+
+COMBINATIONS = list(filter_combinations())
+
+
+def _schema_indexes() -> dict:
+    """table -> index name -> [columns], from the schema file."""
+    indexes, table = {}, None
+    for line in SCHEMA.read_text(encoding="utf-8").splitlines():
+        created = re.match(r"\s*CREATE TABLE (?:IF NOT EXISTS )?`?(\w+)`?", line, re.IGNORECASE)
+        if created:
+            table = created.group(1)
+            continue
+        index = re.match(r"\s*(?:UNIQUE )?(?:INDEX|KEY) `(\w+)` \(([^)]*)\)", line, re.IGNORECASE)
+        if index and table:
+            columns = [c.strip(" `") for c in index.group(2).split(",")]
+            indexes.setdefault(table, {})[index.group(1)] = columns
+    return indexes
+
+INDEXES = _schema_indexes()
+
+
+def _label(filters: AppointmentQuery) -> str:
+    return "+".join(filters.equals) + ("+range" if filters.start else "") or "none"
+
+
+def test_every_combination_is_listed():
+    keys = {(frozenset(f.equals), f.start is not None) for f in COMBINATIONS}
+    assert len(COMBINATIONS) == len(keys) == 2 ** len(EQUALITY_FILTERS) * 2
+
+
+@pytest.mark.parametrize("include_history", [False, True], ids=["hot", "history"])
+@pytest.mark.parametrize("filters", COMBINATIONS, ids=_label)
+def test_listing_statements(filters, include_history):
+    statements = filters.statements(FULL_VIEW_QUERY, include_history)
+    sources = ["appointments", "appointments_archive"] if include_history else ["appointments"]
+    assert [source for source, _, _ in statements] == sources
+
+    driving = next((name for name in EQUALITY_FILTERS if name in filters.equals), None)
+    expected_parameters = tuple(filters.equals[name] for name in EQUALITY_FILTERS if name in filters.equals)
+    if filters.start:
+        expected_parameters += (filters.start, filters.end)
+
+    for source, sql, parameters in statements:
+        # Fully substituted, one table per statement, ordered by the index
+        assert "{" not in sql and "UNION" not in sql
+        assert sql.lstrip().startswith("SELECT STRAIGHT_JOIN a.id")
+        assert f"FROM {source} a FORCE INDEX ({filters.index_for(source)})" in sql
+        assert "JOIN user_details d ON a.doctor_id = d.user_id" in sql
+        assert "JOIN user_details p ON a.patient_id = p.user_id" in sql
+        assert f"{int(source == 'appointments_archive')} AS archived" in sql
+        assert sql.endswith("ORDER BY a.appointment_timestamp DESC")
+
+        where = sql.split("WHERE", 1)[1]
+        for name, column in EQUALITY_FILTERS.items():
+            assert where.count(f"{column} = %s") == (name in filters.equals)
+        assert ("a.appointment_timestamp >= %s" in where) == (filters.start is not None)
+        assert ("a.appointment_timestamp < %s" in where) == (filters.end is not None)
+        assert where.count("%s") == len(parameters)
+        assert parameters == expected_parameters
+
+        # The forced index exists and reads the driving column in listing order
+        columns = INDEXES[source][filters.index_for(source)]
+        if driving:
+            assert columns == [EQUALITY_FILTERS[driving].removeprefix("a."), "appointment_timestamp"]
+        else:
+            assert columns == ["appointment_timestamp"]
+
+
+def test_scope_drives_the_index():
+    doctor = AppointmentQuery().scoped(doctor_id=7)
+    assert doctor.index_for("appointments") == "cidx_appointments_doctor_at"
+
+    # A patient filter within the doctor's scope is more selective
+    both = AppointmentQuery({"patient_id": 3}).scoped(doctor_id=7)
+    assert both.index_for("appointments") == "cidx_appointments_patient_at"
+
+    assert AppointmentQuery({"doctor_id": 8}).scoped(doctor_id=7) is None
+
+
+def test_from_args_rejects_malformed_values():
+    query = AppointmentQuery.from_args({"from": "2024-01-01", "to": "2024-01-31", "status": "confirmed"})
+    assert query.start == datetime(2024, 1, 1) and query.end == datetime(2024, 2, 1)
+
+    for args in ({"doctor_id": "x"}, {"status": "lost"}, {"from": "01/01/2024"},
+                 {"from": "2024-02-01", "to": "2024-01-01"}):
+        with pytest.raises(ValueError):
+            AppointmentQuery.from_args(args)
@@ -0,0 +1,47 @@
+"""
+Startup imports of `create_app()` with LAZY_BLUEPRINTS=1, profiled in a
+fresh interpreter by scripts/importtime.py.
+"""
+
+import importlib.util
+from pathlib import Path
+
+from app import BLUEPRINTS
+
+SCRIPT = Path(__file__).resolve().parents[1] / "scripts" / "importtime.py"
+
+# Loaded on the first request (routes) or on demand (services, numpy analytics)
+DEFERRED = [f"{package}.routes" for package in BLUEPRINTS] + [
+    "numpy",
+    "app.appointments",
+    "app.users",
+    "app.dashboards",
+    "app.seed",
+]
+
+
+def _importtime():
+    spec = importlib.util.spec_from_file_location("importtime", SCRIPT)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def test_lazy_startup_defers_routes_and_services(monkeypatch):
+    monkeypatch.setenv("LAZY_BLUEPRINTS", "1")
+    importtime = _importtime()
+
+    _, loaded = importtime.profile_imports()
+
+    assert loaded >= {"app", "app.db"}
+    assert importtime.forbidden_imports(loaded, DEFERRED) == []
+
+
+def test_eager_startup_is_detected(monkeypatch):
+    # Guards the check itself: registered blueprints must show up
+    monkeypatch.setenv("LAZY_BLUEPRINTS", "0")
+    importtime = _importtime()
+
+    _, loaded = importtime.profile_imports()
+
+    assert "app.auth.routes" in importtime.forbidden_imports(loaded, DEFERRED)
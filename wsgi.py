@@ -0,0 +1,15 @@
+"""
+Production WSGI entry point.
+
+    gunicorn -c gunicorn.conf.py wsgi:app
+    waitress-serve --threads=8 wsgi:app        (Windows)
+
+The app is created and warmed up at import time; with gunicorn's
+`preload_app` this happens once in the master before workers fork.
+"""
+
+from app import create_app
+from app.warmup import warm_up
+
+app = create_app()
+warm_up(app)